@@ -1,10 +1,21 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, NotFoundError, APIError, APIConnectionError
+import httpx
+import importlib.util
 import os
 from dotenv import load_dotenv
 import asyncio
+import contextvars
+import functools
+import hashlib
+import heapq
+import itertools
+import json
 import re
+import sqlite3
+import threading
 import time
+import unicodedata
 
 # -----------------------
 # Carga variables de entorno
@@ -16,11 +27,458 @@ openai_key = os.getenv("OPENAI_API_KEY")
 instrucciones = os.getenv("INSTRUCCIONES")
 modelo = os.getenv("MODELO")
 proposito = os.getenv("PROPOSITO")
+# Permite apuntar el cliente al servidor local fake_openai.py (ej: http://localhost:8010/v1)
+openai_base_url = os.getenv("OPENAI_BASE_URL") or None
+
+# Un solo assistant (por modelo e instrucciones) para todas las unidades: el
+# vector de cada unidad se entrega en el thread (tool_resources) y no en el assistant
+asistente_compartido = os.getenv("ASISTENTE_COMPARTIDO", "0").lower() in ("1", "true", "si")
+# Id del assistant compartido; si no se indica se busca o se crea al primer uso
+assistant_compartido_id = os.getenv("ASSISTANT_COMPARTIDO_ID") or None
+
+# Bytes de cada archivo subido que se mantienen en memoria; el resto queda en un
+# archivo temporal y se envía a OpenAI por bloques desde ahí
+limite_memoria_subida = int(os.getenv("LIMITE_MEMORIA_SUBIDA", str(1024 * 1024)))
+
+# Máximo de archivos subidos en paralelo en una carga múltiple de corpus
+subidas_concurrentes = int(os.getenv("SUBIDAS_CONCURRENTES", "5"))
+
+# Máximo de respuestas de desarrollo corregidas en paralelo por envío
+correcciones_concurrentes = int(os.getenv("CORRECCIONES_CONCURRENTES", "3"))
 
 # -----------------------
-# Cliente OpenAI
+# Transporte HTTP compartido
 # -----------------------
-client = OpenAI(api_key=openai_key)
+# Conexiones abiertas como máximo y cuántas se mantienen vivas para reutilizar
+max_conexiones = int(os.getenv("OPENAI_MAX_CONEXIONES", "100"))
+max_keepalive = int(os.getenv("OPENAI_MAX_KEEPALIVE", "50"))
+keepalive_expiry = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+# "auto": HTTP/2 solo si el paquete h2 está instalado
+usar_http2 = os.getenv("OPENAI_HTTP2", "auto")
+
+def _timeout(lectura: float, escritura: float = None):
+    conexion = float(os.getenv("OPENAI_TIMEOUT_CONEXION", "5"))
+    return httpx.Timeout(conexion, read=lectura, write=escritura or lectura, pool=conexion * 2)
+
+# Timeouts por tipo de operación: las subidas son largas y las consultas de estado cortas
+TIMEOUTS = {
+    "default": _timeout(float(os.getenv("OPENAI_TIMEOUT_LECTURA", "60"))),
+    "subida": _timeout(float(os.getenv("OPENAI_TIMEOUT_SUBIDA", "600"))),
+    "consulta": _timeout(float(os.getenv("OPENAI_TIMEOUT_CONSULTA", "15"))),
+    # Tiempo máximo sin recibir eventos del stream de un run
+    "stream": _timeout(float(os.getenv("OPENAI_TIMEOUT_STREAM", "120"))),
+}
+
+def http2_disponible():
+    if usar_http2 == "auto":
+        return importlib.util.find_spec("h2") is not None
+    return usar_http2.lower() in ("1", "true", "si")
+
+def crear_http_client(**opciones):
+    """
+    Cliente httpx compartido por todas las llamadas a OpenAI del proceso.
+    """
+    return DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=opciones.get("max_conexiones", max_conexiones),
+            max_keepalive_connections=opciones.get("max_keepalive", max_keepalive),
+            keepalive_expiry=opciones.get("keepalive_expiry", keepalive_expiry),
+        ),
+        http2=opciones.get("http2", http2_disponible()),
+        timeout=TIMEOUTS["default"],
+        event_hooks=opciones.get("event_hooks"),
+    )
+
+# -----------------------
+# Límite de tasa y prioridades
+# -----------------------
+# Solicitudes y tokens por minuto de la cuenta. Con 0 se toman de los
+# encabezados x-ratelimit-* de las respuestas de OpenAI
+solicitudes_por_minuto = int(os.getenv("OPENAI_SOLICITUDES_POR_MINUTO", "0"))
+tokens_por_minuto = int(os.getenv("OPENAI_TOKENS_POR_MINUTO", "0"))
+# Tokens que se descuentan al crear un run (el prompt ya está en el thread);
+# se corrigen con el uso real cuando el run termina
+tokens_por_run = int(os.getenv("OPENAI_TOKENS_POR_RUN", "2000"))
+# Archivo SQLite para compartir el presupuesto entre los workers de uvicorn y
+# worker.py; vacío: cada proceso lleva su propia cuenta
+limite_compartido = os.getenv("OPENAI_LIMITE_COMPARTIDO", "")
+# Pausa tras un 429 que no trae Retry-After (segundos)
+pausa_429 = float(os.getenv("OPENAI_PAUSA_429", "5"))
+
+# Clase de prioridad de cada operación instrumentada (0 = la más urgente); lo
+# que no está instrumentado (sondeos de ingesta, etc.) va como provisión
+PRIORIDADES = {"grade": 0, "generate": 1, "upload": 2, "provision": 2, "delete": 2}
+CLASES_PRIORIDAD = {0: "correccion", 1: "generacion", 2: "provision"}
+# Fracción de cada cubeta que una clase no puede usar: deja margen a las más
+# urgentes, también cuando compiten varios procesos
+RESERVAS = {
+    0: 0.0,
+    1: float(os.getenv("OPENAI_RESERVA_GENERACION", "0.1")),
+    2: float(os.getenv("OPENAI_RESERVA_PROVISION", "0.25")),
+}
+
+def _estado_inicial():
+    return {
+        "cubetas": {
+            "solicitudes": {"capacidad": solicitudes_por_minuto, "nivel": solicitudes_por_minuto, "actualizado": time.time()},
+            "tokens": {"capacidad": tokens_por_minuto, "nivel": tokens_por_minuto, "actualizado": time.time()},
+        },
+        "pausa_hasta": 0.0,
+    }
+
+def _rellenar(cubeta: dict, ahora: float):
+    capacidad = cubeta["capacidad"]
+    cubeta["nivel"] = min(capacidad, cubeta["nivel"] + capacidad / 60 * max(0.0, ahora - cubeta["actualizado"]))
+    cubeta["actualizado"] = ahora
+
+def _tomar(estado: dict, ahora: float, pedido: dict, reserva: float):
+    """
+    Descuenta `pedido` ({cubeta: cantidad}) si todas las cubetas alcanzan sin
+    bajar de la reserva. Devuelve 0 si se descontó o los segundos que faltan.
+    Las cubetas sin capacidad conocida no limitan.
+    """
+    if estado["pausa_hasta"] > ahora:
+        return estado["pausa_hasta"] - ahora
+    falta = 0.0
+    for nombre, cubeta in estado["cubetas"].items():
+        if not cubeta["capacidad"]:
+            continue
+        _rellenar(cubeta, ahora)
+        necesario = min(pedido.get(nombre, 0), cubeta["capacidad"]) + reserva * cubeta["capacidad"]
+        if cubeta["nivel"] < necesario:
+            falta = max(falta, (necesario - cubeta["nivel"]) * 60 / cubeta["capacidad"])
+    if falta:
+        return falta
+    for nombre, cubeta in estado["cubetas"].items():
+        if cubeta["capacidad"]:
+            cubeta["nivel"] -= min(pedido.get(nombre, 0), cubeta["capacidad"])
+    return 0.0
+
+def _registrar_respuesta(estado: dict, ahora: float, limites: dict, pausa: float):
+    """
+    Ajusta las cubetas con lo que informó OpenAI: {cubeta: (límite, restante)}
+    de los encabezados y la pausa pedida por un 429.
+    """
+    configuradas = {"solicitudes": solicitudes_por_minuto, "tokens": tokens_por_minuto}
+    for nombre, (limite, restante) in limites.items():
+        cubeta = estado["cubetas"][nombre]
+        if not configuradas[nombre] and limite:
+            cubeta["capacidad"] = limite
+        if cubeta["capacidad"]:
+            _rellenar(cubeta, ahora)
+            if restante is not None:
+                cubeta["nivel"] = min(cubeta["nivel"], restante)
+    if pausa:
+        estado["pausa_hasta"] = max(estado["pausa_hasta"], ahora + pausa)
+
+class AlmacenMemoria:
+    """
+    Cubetas de este proceso.
+    """
+    def __init__(self):
+        self.estado = _estado_inicial()
+
+    async def aplicar(self, cambio):
+        return cambio(self.estado, time.time())
+
+class AlmacenSQLite:
+    """
+    Cubetas en un archivo SQLite compartido: cada cambio corre en una
+    transacción BEGIN IMMEDIATE, que bloquea el archivo entre procesos.
+    """
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._conexion = None
+        self._lock = threading.Lock()
+
+    def _aplicar(self, cambio):
+        with self._lock:
+            if self._conexion is None:
+                self._conexion = sqlite3.connect(self.ruta, timeout=10, isolation_level=None, check_same_thread=False)
+                self._conexion.execute("CREATE TABLE IF NOT EXISTS limite_openai (id INTEGER PRIMARY KEY, estado TEXT)")
+            conexion = self._conexion
+            conexion.execute("BEGIN IMMEDIATE")
+            try:
+                fila = conexion.execute("SELECT estado FROM limite_openai WHERE id = 1").fetchone()
+                estado = json.loads(fila[0]) if fila else _estado_inicial()
+                # La capacidad configurada en este proceso manda sobre la guardada
+                for nombre, capacidad in (("solicitudes", solicitudes_por_minuto), ("tokens", tokens_por_minuto)):
+                    if capacidad:
+                        estado["cubetas"][nombre]["capacidad"] = capacidad
+                resultado = cambio(estado, time.time())
+                conexion.execute("INSERT OR REPLACE INTO limite_openai (id, estado) VALUES (1, ?)", (json.dumps(estado),))
+                conexion.execute("COMMIT")
+                return resultado
+            except BaseException:
+                conexion.execute("ROLLBACK")
+                raise
+
+    async def aplicar(self, cambio):
+        return await asyncio.to_thread(self._aplicar, cambio)
+
+class PlanificadorOpenAI:
+    """
+    Cola de prioridad delante de cada solicitud HTTP a OpenAI: atiende primero
+    la clase más urgente y deja pasar una solicitud solo cuando alcanzan las
+    cubetas de solicitudes y tokens por minuto (o terminó la pausa de un 429).
+    """
+    def __init__(self, almacen):
+        self.almacen = almacen
+        self._cola = []  # (prioridad, orden, futuro, pedido)
+        self._orden = itertools.count()
+        self._ajuste_tokens = 0
+        self._loop = None
+        self._llegada = None
+        self._tarea = None
+
+    async def _aplicar(self, funcion, **argumentos):
+        # Las correcciones de tokens pendientes se aplican junto con el próximo cambio
+        ajuste, self._ajuste_tokens = self._ajuste_tokens, 0
+
+        def cambio(estado, ahora):
+            if ajuste and estado["cubetas"]["tokens"]["capacidad"]:
+                estado["cubetas"]["tokens"]["nivel"] -= ajuste
+            return funcion(estado, ahora, **argumentos)
+        try:
+            return await self.almacen.aplicar(cambio)
+        except Exception:
+            # La transacción no se confirmó (p. ej. archivo bloqueado): el ajuste
+            # queda pendiente para el próximo cambio
+            self._ajuste_tokens += ajuste
+            raise
+
+    def ajustar_tokens(self, diferencia: int):
+        """
+        Corrige lo descontado por un run con su uso real (sin bloquear).
+        """
+        self._ajuste_tokens += diferencia
+
+    async def registrar_respuesta(self, limites: dict, pausa: float = 0):
+        await self._aplicar(_registrar_respuesta, limites=limites, pausa=pausa)
+
+    async def adquirir(self, prioridad: int, pedido: dict):
+        """
+        Espera el turno de la solicitud. Devuelve los segundos esperados.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop, self._cola, self._llegada, self._tarea = loop, [], asyncio.Event(), None
+
+        if not self._cola:
+            try:
+                if await self._aplicar(_tomar, pedido=pedido, reserva=RESERVAS[prioridad]) == 0:
+                    return 0.0
+            except Exception as e:
+                # Si falla el limitador no se frenan las llamadas
+                print(f"Error en el limitador de OpenAI: {e}")
+                return 0.0
+
+        inicio = time.monotonic()
+        futuro = loop.create_future()
+        heapq.heappush(self._cola, (prioridad, next(self._orden), futuro, pedido))
+        self._llegada.set()
+        if self._tarea is None or self._tarea.done():
+            self._tarea = loop.create_task(self._despachar())
+        await futuro
+        return time.monotonic() - inicio
+
+    async def _despachar(self):
+        while self._cola:
+            entrada = self._cola[0]
+            prioridad, _, futuro, pedido = entrada
+            if futuro.done():
+                # Quien esperaba se canceló
+                heapq.heappop(self._cola)
+                continue
+            try:
+                espera = await self._aplicar(_tomar, pedido=pedido, reserva=RESERVAS[prioridad])
+            except Exception as e:
+                print(f"Error en el limitador de OpenAI: {e}")
+                espera = 0
+            if espera <= 0:
+                # Mientras se consultaba pudo llegar alguien más urgente: sacar esta entrada
+                self._cola.remove(entrada)
+                heapq.heapify(self._cola)
+                if not futuro.done():
+                    futuro.set_result(None)
+                continue
+            # Esperar lo que falta, o menos si llega una solicitud (puede ser más urgente)
+            self._llegada.clear()
+            try:
+                await asyncio.wait_for(self._llegada.wait(), espera)
+            except asyncio.TimeoutError:
+                pass
+
+    async def estado(self):
+        """
+        Solicitudes en cola por clase, cubetas y pausa restante (para /metricas/limitador).
+        """
+        en_cola = {clase: 0 for clase in CLASES_PRIORIDAD.values()}
+        for prioridad, _, futuro, _ in self._cola:
+            if not futuro.done():
+                en_cola[CLASES_PRIORIDAD[prioridad]] += 1
+
+        def leer(estado, ahora):
+            for cubeta in estado["cubetas"].values():
+                if cubeta["capacidad"]:
+                    _rellenar(cubeta, ahora)
+            return {
+                "cubetas": {nombre: {"capacidad": c["capacidad"], "disponible": round(c["nivel"], 1)}
+                            for nombre, c in estado["cubetas"].items()},
+                "pausa": round(max(0.0, estado["pausa_hasta"] - ahora), 3),
+            }
+
+        return {"en_cola": en_cola, "compartido": bool(limite_compartido), **await self.almacen.aplicar(leer)}
+
+planificador = PlanificadorOpenAI(AlmacenSQLite(limite_compartido) if limite_compartido else AlmacenMemoria())
+
+def tokens_estimados(request: httpx.Request):
+    """
+    Tokens a descontar por una solicitud: solo consumen las que generan texto.
+    """
+    if request.method != "POST" or not request.url.path.endswith(("/runs", "/chat/completions", "/responses")):
+        return 0
+    try:
+        cuerpo = len(request.content)
+    except httpx.RequestNotRead:
+        cuerpo = 0
+    return tokens_por_run + cuerpo // 4
+
+async def limitar_solicitud(request: httpx.Request):
+    """
+    Hook de httpx: espera el turno de la solicitud según la operación en curso.
+    """
+    datos = medicion_actual()
+    operacion = datos["operacion"] if datos else "otras"
+    prioridad = PRIORIDADES.get(operacion, 2)
+    espera = await planificador.adquirir(prioridad, {"solicitudes": 1, "tokens": tokens_estimados(request)})
+    observar_latencia(operacion, "espera_limite", espera)
+    if espera:
+        sumar_metrica(f"llm.{operacion}.limitadas")
+
+def _entero(valor):
+    try:
+        return int(float(valor))
+    except (TypeError, ValueError):
+        return None
+
+def pausa_pedida(headers):
+    """
+    Segundos de Retry-After (retry-after-ms de OpenAI o retry-after en segundos).
+    """
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return pausa_429
+
+async def registrar_limites(response: httpx.Response):
+    """
+    Hook de httpx: actualiza las cubetas con los encabezados x-ratelimit-* y
+    pausa todas las solicitudes del presupuesto ante un 429.
+    """
+    try:
+        headers = response.headers
+        limites = {}
+        for nombre, sufijo in (("solicitudes", "requests"), ("tokens", "tokens")):
+            if f"x-ratelimit-limit-{sufijo}" in headers:
+                limites[nombre] = (_entero(headers[f"x-ratelimit-limit-{sufijo}"]),
+                                   _entero(headers.get(f"x-ratelimit-remaining-{sufijo}")))
+        pausa = 0
+        if response.status_code == 429:
+            datos = medicion_actual()
+            sumar_metrica(f"llm.{datos['operacion'] if datos else 'otras'}.respuestas_429")
+            pausa = pausa_pedida(headers)
+        if limites or pausa:
+            await planificador.registrar_respuesta(limites, pausa)
+    except Exception as e:
+        print(f"No se pudieron registrar los límites de OpenAI: {e}")
+
+async def estado_limitador():
+    return await planificador.estado()
+
+# -----------------------
+# Cliente OpenAI (asíncrono, no bloquea el event loop de uvicorn)
+# -----------------------
+client = AsyncOpenAI(
+    api_key=openai_key,
+    base_url=openai_base_url,
+    http_client=crear_http_client(event_hooks={"request": [limitar_solicitud], "response": [registrar_limites]}),
+    timeout=TIMEOUTS["default"],
+)
+
+# -----------------------
+# Instrumentación de las llamadas a OpenAI
+# -----------------------
+# Límites (segundos) de los histogramas de latencia
+BUCKETS_LATENCIA = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, float("inf")]
+
+# Acumulado desde el último vaciar_metricas(): nombre -> valor
+_metricas = {}
+_medicion = contextvars.ContextVar("medicion", default=None)
+
+def sumar_metrica(nombre: str, valor: float = 1):
+    _metricas[nombre] = _metricas.get(nombre, 0) + valor
+
+def observar_latencia(operacion: str, medida: str, segundos: float):
+    limite = next(b for b in BUCKETS_LATENCIA if segundos <= b)
+    prefijo = f"llm.{operacion}.{medida}"
+    sumar_metrica(f"{prefijo}.bucket.{limite}")
+    sumar_metrica(f"{prefijo}.suma", segundos)
+    sumar_metrica(f"{prefijo}.cantidad")
+
+def vaciar_metricas():
+    """
+    Devuelve lo acumulado desde la última llamada y lo reinicia
+    (el backend lo suma a la tabla contador).
+    """
+    global _metricas
+    metricas, _metricas = _metricas, {}
+    return metricas
+
+def medicion_actual():
+    """
+    Datos de la operación instrumentada en curso (o None fuera de una).
+    """
+    return _medicion.get()
+
+def instrumentar(operacion: str):
+    """
+    Registra de cada llamada: tiempo total, tiempo en cola y en ejecución de
+    sus runs, reintentos, tokens y resultado (ok / error).
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        async def envoltura(*args, **kwargs):
+            datos = {"operacion": operacion, "cola": 0.0, "ejecucion": 0.0, "reintentos": 0,
+                     "tokens_prompt": 0, "tokens_completion": 0}
+            token = _medicion.set(datos)
+            inicio = time.monotonic()
+            resultado = "ok"
+            try:
+                return await funcion(*args, **kwargs)
+            except asyncio.CancelledError:
+                resultado = "cancelado"
+                raise
+            except Exception:
+                resultado = "error"
+                raise
+            finally:
+                _medicion.reset(token)
+                observar_latencia(operacion, "total", time.monotonic() - inicio)
+                if datos["cola"] or datos["ejecucion"]:
+                    observar_latencia(operacion, "cola", datos["cola"])
+                    observar_latencia(operacion, "ejecucion", datos["ejecucion"])
+                sumar_metrica(f"llm.{operacion}.resultado.{resultado}")
+                sumar_metrica(f"llm.{operacion}.reintentos", datos["reintentos"])
+                sumar_metrica(f"llm.{operacion}.tokens_prompt", datos["tokens_prompt"])
+                sumar_metrica(f"llm.{operacion}.tokens_completion", datos["tokens_completion"])
+        return envoltura
+    return decorador
 
 # -----------------------
 # FastAPI app
@@ -32,8 +490,9 @@ app = FastAPI()
 # -----------------------
 
 # Asistente
+@instrumentar("provision")
 async def crear_assistant(name: str):
-    assistant = client.beta.assistants.create(
+    assistant = await client.beta.assistants.create(
         name=name,
         instructions=instrucciones,
         model=modelo,
@@ -41,27 +500,83 @@ async def crear_assistant(name: str):
     )
     return assistant.id
 
+@instrumentar("provision")
 async def actualizar_assistant(assistant_id: str, vector_id: str):
-    assistant = client.beta.assistants.update(
+    assistant = await client.beta.assistants.update(
         assistant_id=assistant_id,
         tool_resources={"file_search": {"vector_store_ids": [vector_id]}},
     )
     return assistant.id
 
+@instrumentar("provision")
+async def renombrar_assistant(assistant_id: str, nombre: str):
+    assistant = await client.beta.assistants.update(assistant_id=assistant_id, name=nombre)
+    return assistant.id
+
+_assistant_compartido = {}
+_lock_compartido = asyncio.Lock()
+
+async def obtener_assistant_compartido():
+    """
+    Assistant compartido por todas las unidades para el modelo e instrucciones
+    actuales. Se busca por metadata entre los assistants de la cuenta y se
+    crea si no existe.
+    """
+    if assistant_compartido_id:
+        return assistant_compartido_id
+    clave = (modelo, instrucciones)
+    async with _lock_compartido:
+        if clave not in _assistant_compartido:
+            async for assistant in client.beta.assistants.list(limit=100):
+                if ((assistant.metadata or {}).get("compartido") == "si"
+                        and assistant.model == modelo and assistant.instructions == instrucciones):
+                    _assistant_compartido[clave] = assistant.id
+                    break
+            else:
+                assistant = await client.beta.assistants.create(
+                    name=f"Asistente compartido ({modelo})",
+                    instructions=instrucciones,
+                    model=modelo,
+                    tools=[{"type": "code_interpreter"}, {"type": "file_search"}],
+                    metadata={"compartido": "si"}
+                )
+                _assistant_compartido[clave] = assistant.id
+        return _assistant_compartido[clave]
+
+async def es_assistant_compartido(assistant_id: str):
+    """
+    True si el assistant es el compartido (no se borra con la unidad).
+    """
+    if not asistente_compartido or not assistant_id:
+        return False
+    return assistant_id == await obtener_assistant_compartido()
+
+def recursos_thread(vector_id: str = None):
+    """
+    Argumentos para threads.create que vinculan el vector de la unidad al thread
+    (solo con assistant compartido: si no, el vector ya está en el assistant).
+    """
+    if not asistente_compartido or not vector_id:
+        return {}
+    return {"tool_resources": {"file_search": {"vector_store_ids": [vector_id]}}}
+
+@instrumentar("delete")
 async def borrar_assistant(assistant_id: str):
     try:
-        respuesta = client.beta.assistants.delete(assistant_id)
+        respuesta = await client.beta.assistants.delete(assistant_id)
         return respuesta
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete Assistant: {e}")
 
 # API.py
-async def crear_vector(assistant_id: str):
+@instrumentar("provision")
+async def crear_vector(assistant_id: str, vincular: bool = True):
     """
-    Crea un vector store y lo vincula con el assistant.
+    Crea un vector store y lo vincula con el assistant
+    (con vincular=False solo lo crea: modo assistant compartido).
     """
     # Crear un vector store usando la API correcta
-    vector_store = client.vector_stores.create(
+    vector_store = await client.vector_stores.create(
         name=f"Vector {assistant_id}"
     )
     
@@ -69,7 +584,8 @@ async def crear_vector(assistant_id: str):
     vector_id = vector_store.id
 
     # Actualizar el assistant con el vector_id
-    await actualizar_assistant(assistant_id, vector_id)
+    if vincular:
+        await actualizar_assistant(assistant_id, vector_id)
 
     return vector_id
 
@@ -78,17 +594,63 @@ async def crear_vector(assistant_id: str):
 
 
 
+def archivo_para_subir(archivo: UploadFile):
+    """
+    (nombre, archivo) para client.files.create sin leer el contenido:
+    httpx lo envía por bloques desde el archivo temporal del UploadFile.
+    """
+    archivo.file.seek(0)
+    return (archivo.filename, archivo.file)
+
+def _huella_archivo(archivo):
+    huella = hashlib.sha256()
+    archivo.seek(0)
+    for bloque in iter(lambda: archivo.read(1024 * 1024), b""):
+        huella.update(bloque)
+    archivo.seek(0)
+    return huella.hexdigest()
+
+async def huella_archivo(archivo: UploadFile):
+    """
+    SHA-256 del contenido, leyendo por bloques el archivo temporal (en un thread).
+    """
+    return await asyncio.to_thread(_huella_archivo, archivo.file)
+
+@instrumentar("upload")
+async def subir_archivo_openai(archivo: UploadFile):
+    """
+    Sube el archivo a OpenAI sin vincularlo a ningún vector. Devuelve el file_id.
+    """
+    try:
+        openai_file = await client.files.create(
+            file=archivo_para_subir(archivo),
+            purpose="assistants",
+            timeout=TIMEOUTS["subida"]
+        )
+        return openai_file.id
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al subir archivo a OpenAI: {e}")
+
+@instrumentar("upload")
+async def vincular_archivo(vector_id: str, file_id: str):
+    try:
+        await client.vector_stores.files.create(vector_store_id=vector_id, file_id=file_id)
+        return file_id
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al vincular archivo al vector: {e}")
+
+@instrumentar("upload")
 async def subir_archivo_a_vector(vector_id: str, archivo: UploadFile):
-    file_bytes = await archivo.read()
     try:
         # 1. Crear archivo en OpenAI
-        openai_file = client.files.create(
-            file=(archivo.filename, file_bytes),
-            purpose="assistants"
+        openai_file = await client.files.create(
+            file=archivo_para_subir(archivo),
+            purpose="assistants",
+            timeout=TIMEOUTS["subida"]
         )
 
         # 2. Asociar archivo al vector (nota: sin .beta)
-        client.vector_stores.files.create(
+        await client.vector_stores.files.create(
             vector_store_id=vector_id,
             file_id=openai_file.id
         )
@@ -102,16 +664,77 @@ async def subir_archivo_a_vector(vector_id: str, archivo: UploadFile):
 
 
 
+@instrumentar("upload")
+async def subir_archivos_a_vector(vector_id: str, archivos: list, max_concurrentes: int = None,
+                                  reutilizados: dict = None):
+    """
+    Sube varios archivos en paralelo (como máximo SUBIDAS_CONCURRENTES a la vez)
+    y los vincula al vector en un solo file batch.
+    reutilizados: {posición: file_id} de archivos que ya están en OpenAI y solo se vinculan.
+    Devuelve, en el orden de archivos, {nombre, file_id, estado, error, reutilizado} por archivo;
+    estado es "error" o el estado del archivo en el vector (in_progress, completed, failed).
+    """
+    semaforo = asyncio.Semaphore(max_concurrentes or subidas_concurrentes)
+    reutilizados = reutilizados or {}
+
+    async def subir(posicion: int, archivo: UploadFile):
+        if posicion in reutilizados:
+            return {"nombre": archivo.filename, "file_id": reutilizados[posicion], "estado": "subido",
+                    "error": None, "reutilizado": True}
+        async with semaforo:
+            try:
+                openai_file = await client.files.create(
+                    file=archivo_para_subir(archivo),
+                    purpose="assistants",
+                    timeout=TIMEOUTS["subida"]
+                )
+                return {"nombre": archivo.filename, "file_id": openai_file.id, "estado": "subido",
+                        "error": None, "reutilizado": False}
+            except Exception as e:
+                return {"nombre": archivo.filename, "file_id": None, "estado": "error", "error": str(e),
+                        "reutilizado": False}
+
+    resultados = await asyncio.gather(*(subir(i, archivo) for i, archivo in enumerate(archivos)))
+    subidos = [r for r in resultados if r["file_id"]]
+    if not subidos:
+        return resultados
+
+    try:
+        lote = await client.vector_stores.file_batches.create(
+            vector_store_id=vector_id, file_ids=[r["file_id"] for r in subidos]
+        )
+        estados = {}
+        async for archivo in client.vector_stores.file_batches.list_files(
+            batch_id=lote.id, vector_store_id=vector_id, limit=100, timeout=TIMEOUTS["consulta"]
+        ):
+            estados[archivo.id] = archivo
+    except Exception as e:
+        # Sin vincular no sirven: se borran los recién subidos para no dejar archivos huérfanos
+        await asyncio.gather(
+            *(client.files.delete(r["file_id"]) for r in subidos if not r["reutilizado"]), return_exceptions=True
+        )
+        for r in subidos:
+            r.update(file_id=None, estado="error", error=f"No se pudo vincular al vector: {e}")
+        return resultados
+
+    for r in subidos:
+        archivo = estados.get(r["file_id"])
+        r["estado"] = archivo.status if archivo else "in_progress"
+        if archivo and archivo.last_error:
+            r["error"] = archivo.last_error.message
+    return resultados
+
+@instrumentar("upload")
 async def actualizar_vector(assistant_id: str, vector_id: str, file_id: str):
     try:
         # Asociar archivo con vector store
-        client.vector_stores.add_files(
-            id=vector_id,
-            files=[file_id]
+        await client.vector_stores.files.create(
+            vector_store_id=vector_id,
+            file_id=file_id
         )
 
         # Actualizar assistant para usar el vector store
-        client.assistants.update(
+        await client.beta.assistants.update(
             assistant_id=assistant_id,
             tool_resources={"file_search": {"vector_store_ids": [vector_id]}}
         )
@@ -124,37 +747,36 @@ async def actualizar_vector(assistant_id: str, vector_id: str, file_id: str):
 
 
 
+@instrumentar("delete")
 async def borrar_vector(vector_id: str):
     """
     Borra un vector store.
     """
     try:
-        response = client.vector_stores.delete(vector_id)
+        response = await client.vector_stores.delete(vector_id)
         return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete Vector: {e}")
 
+@instrumentar("upload")
 async def subir_archivo(assistant_id: str, vector_id: str, archivo: UploadFile):
     """
     Sube un archivo al vector store existente y actualiza el assistant.
     Devuelve file_id y vector_store_id.
     """
     try:
-        # Leer contenido del archivo
-        contenido = await archivo.read()
-
-        # 1️⃣ Crear archivo en la API
-        respuesta = client.files.create(file=contenido, purpose="file.search")
+        # 1️⃣ Crear archivo en la API (por bloques, sin cargarlo en memoria)
+        respuesta = await client.files.create(file=archivo_para_subir(archivo), purpose="file.search", timeout=TIMEOUTS["subida"])
         file_id = str(respuesta.id)
 
         # 2️⃣ Agregar el archivo al vector store existente
-        client.vector_stores.add_files(
-            id=vector_id,
-            files=[file_id]
+        await client.vector_stores.files.create(
+            vector_store_id=vector_id,
+            file_id=file_id
         )
 
         # 3️⃣ Actualizar el assistant para usar el vector
-        client.beta.assistants.update(
+        await client.beta.assistants.update(
             assistant_id=assistant_id,
             tool_resources={"file_search": {"vector_store_ids": [vector_id]}}
         )
@@ -167,33 +789,263 @@ async def subir_archivo(assistant_id: str, vector_id: str, archivo: UploadFile):
 
 
 async def actualizar_archivo(assistant_id: str, vector_id: str, file_id: str, archivo: UploadFile):
-    await borrar_archivo(file_id)
+    await borrar_archivo(file_id, vector_id)
     file_id_nuevo = await subir_archivo(assistant_id, vector_id, archivo)
     return file_id_nuevo
 
-def borrar_archivo(file_id: str, vector_id: str):
+@instrumentar("delete")
+async def borrar_archivo(file_id: str, vector_id: str = None, borrar_remoto: bool = True):
+    """
+    Desvincula el archivo del vector (si se indica) y lo borra de OpenAI
+    (salvo borrar_remoto=False: otras unidades todavía lo usan).
+    """
     errores = {}
+    if vector_id:
+        try:
+            # Desvincular el archivo del vector store
+            await client.vector_stores.files.delete(file_id, vector_store_id=vector_id)
+        except Exception as e:
+            errores['vector'] = str(e)
+
+    if borrar_remoto:
+        try:
+            # Borrar el archivo de la API de OpenAI
+            await client.files.delete(file_id)
+        except Exception as e:
+            errores['archivo'] = str(e)
+
+    return {"errores": errores}
+
+async def conteo_archivos_vector(vector_id: str):
+    """
+    Cantidad de archivos del vector store por estado (in_progress, completed, failed, cancelled, total).
+    """
+    vector = await client.vector_stores.retrieve(vector_id, timeout=TIMEOUTS["consulta"])
+    return vector.file_counts
+
+async def estados_archivos_vector(vector_id: str):
+    """
+    Estado de indexación de todos los archivos del vector store, paginando de a 100:
+    {file_id: (estado, error)}.
+    """
+    estados = {}
+    async for archivo in client.vector_stores.files.list(vector_store_id=vector_id, limit=100,
+                                                         timeout=TIMEOUTS["consulta"]):
+        estados[archivo.id] = (archivo.status, archivo.last_error.message if archivo.last_error else None)
+    return estados
+
+@instrumentar("delete")
+async def borrar_recurso(tipo: str, recurso_id: str):
+    """
+    Borra un assistant, vector store o archivo de OpenAI (tipo: "assistant",
+    "vector" o "archivo"). Si ya no existe cuenta como borrado; los demás
+    errores se propagan para reintentar.
+    """
+    borrar = {
+        "assistant": client.beta.assistants.delete,
+        "vector": client.vector_stores.delete,
+        "archivo": client.files.delete,
+    }[tipo]
     try:
-        # Borrar todos los vectores del vector store
-        client.vectors.delete(vector_store_id=vector_id)
-    except Exception as e:
-        errores['vector'] = str(e)
+        await borrar(recurso_id, timeout=TIMEOUTS["consulta"])
+    except NotFoundError:
+        pass
+
+
+
 
+
+# -----------------------
+# Ejecución de runs
+# -----------------------
+ESTADOS_FINALES = ["completed", "failed", "cancelled", "expired", "incomplete"]
+
+# Espera entre consultas cuando no hay streaming (segundos)
+POLL_INICIAL = 0.25
+POLL_MAXIMO = 4.0
+
+class RunNoCompletado(Exception):
+    def __init__(self, run):
+        self.run = run
+        error = getattr(run, "last_error", None)
+        mensaje = f"El run {run.id} terminó con estado '{run.status}'"
+        if error:
+            mensaje += f": {error.message}"
+        super().__init__(mensaje)
+
+# Duración (cola + ejecución) de los runs completados en este proceso, por
+# operación: (suma, cantidad). Estima el tiempo que se evita al cancelar uno
+_duracion_runs = {}
+
+def duracion_esperada(operacion: str):
+    suma, cantidad = _duracion_runs.get(operacion, (0.0, 0))
+    return suma / cantidad if cantidad else 0.0
+
+class TiemposRun:
+    """
+    Momentos (locales) en que se vio el run creado, en ejecución y terminado.
+    """
+    def __init__(self):
+        self.creado = time.monotonic()
+        self.inicio = None
+        self.fin = None
+
+    def ver(self, run):
+        ahora = time.monotonic()
+        if run.status == "in_progress" and self.inicio is None:
+            self.inicio = ahora
+        if run.status in ESTADOS_FINALES and self.fin is None:
+            self.fin = ahora
+            self.inicio = self.inicio or ahora
+
+    def registrar(self, run):
+        """
+        Suma cola, ejecución y tokens del run a la operación instrumentada en
+        curso, y corrige los tokens descontados por el limitador con el uso real.
+        """
+        uso = getattr(run, "usage", None)
+        if uso:
+            planificador.ajustar_tokens((uso.prompt_tokens or 0) + (uso.completion_tokens or 0) - tokens_por_run)
+        datos = medicion_actual()
+        if datos is None:
+            return
+        fin = self.fin or time.monotonic()
+        inicio = self.inicio or fin
+        datos["cola"] += inicio - self.creado
+        datos["ejecucion"] += fin - inicio
+        if run.status == "completed":
+            suma, cantidad = _duracion_runs.get(datos["operacion"], (0.0, 0))
+            _duracion_runs[datos["operacion"]] = (suma + fin - self.creado, cantidad + 1)
+        if uso:
+            datos["tokens_prompt"] += uso.prompt_tokens or 0
+            datos["tokens_completion"] += uso.completion_tokens or 0
+
+async def esperar_run(thread_id: str, run, tiempos: TiemposRun = None):
+    """
+    Espera a que un run termine consultando su estado con backoff
+    exponencial (POLL_INICIAL hasta POLL_MAXIMO).
+    """
+    tiempos = tiempos or TiemposRun()
+    espera = POLL_INICIAL
+    while run.status not in ESTADOS_FINALES:
+        if run.status == "requires_action":
+            # El assistant no tiene funciones propias: nadie va a responder
+            return await cancelar_run(thread_id, run)
+        await asyncio.sleep(espera)
+        espera = min(espera * 2, POLL_MAXIMO)
+        run = await client.beta.threads.runs.retrieve(
+            thread_id=thread_id, run_id=run.id, timeout=TIMEOUTS["consulta"]
+        )
+        tiempos.ver(run)
+    return run
+
+async def cancelar_run(thread_id: str, run):
     try:
-        # Borrar el archivo de la API de OpenAI
-        client.files.delete(file_id)
-    except Exception as e:
-        errores['archivo'] = str(e)
+        return await client.beta.threads.runs.cancel(
+            thread_id=thread_id, run_id=run.id, timeout=TIMEOUTS["consulta"]
+        )
+    except Exception:
+        return run
 
-    return {"errores": errores}
+async def abandonar_run(thread_id: str, run, tiempos: TiemposRun):
+    """
+    Nadie va a leer el resultado (el cliente se fue o venció el plazo):
+    cancela el run en OpenAI y suma el tiempo de run que se evitó, estimado
+    con la duración media de los runs completados de la operación.
+    Con run=None (cancelado antes del primer evento) busca los runs del thread.
+    """
+    if run is not None and run.status in ESTADOS_FINALES:
+        return
+    if run is None:
+        await cancelar_runs_activos(thread_id)
+    else:
+        await cancelar_run(thread_id, run)
+    datos = medicion_actual()
+    operacion = datos["operacion"] if datos else "otras"
+    transcurrido = time.monotonic() - tiempos.creado
+    sumar_metrica(f"llm.{operacion}.runs_cancelados")
+    sumar_metrica(f"llm.{operacion}.segundos_ahorrados", max(0.0, duracion_esperada(operacion) - transcurrido))
+
+# Tolerancia entre el reloj local y el de OpenAI al comparar created_at
+MARGEN_RELOJ = 30
+
+async def recuperar_run(thread_id: str, assistant_id: str, desde: float):
+    """
+    Run más reciente del thread si es del assistant y se creó después de `desde`
+    (el que se pidió con un stream que falló antes del primer evento), o None.
+    """
+    runs = await client.beta.threads.runs.list(thread_id=thread_id, limit=1, timeout=TIMEOUTS["consulta"])
+    for run in runs.data:
+        if run.assistant_id == assistant_id and run.created_at >= desde - MARGEN_RELOJ:
+            return run
+    return None
 
+async def ejecutar_run(thread_id: str, assistant_id: str, **kwargs):
+    """
+    Crea un run y espera a que termine.
+    Usa los eventos del stream del run; si el stream falla o se corta antes
+    del estado final, sigue consultando el run con backoff.
+    Devuelve el run final (completed, failed, cancelled, expired o incomplete).
+    """
+    run = None
+    tiempos = TiemposRun()
+    inicio = time.time()
+    try:
+        try:
+            stream = await client.beta.threads.runs.create(
+                thread_id=thread_id, assistant_id=assistant_id, stream=True, timeout=TIMEOUTS["stream"], **kwargs
+            )
+            async for evento in stream:
+                if not evento.event.startswith("thread.run.") or evento.event.startswith("thread.run.step"):
+                    continue
+                run = evento.data
+                tiempos.ver(run)
+                if run.status in ESTADOS_FINALES or run.status == "requires_action":
+                    break
+            await stream.close()
+        except (APIConnectionError, httpx.TransportError, httpx.StreamError):
+            # Falló la conexión o el stream (APITimeoutError es un APIConnectionError).
+            # Si el run alcanzó a crearse se sigue ese; solo si no existe se crea otro
+            if run is None:
+                run = await recuperar_run(thread_id, assistant_id, inicio)
+            if run is None:
+                run = await client.beta.threads.runs.create(
+                    thread_id=thread_id, assistant_id=assistant_id, **kwargs
+                )
+
+        if run is None:
+            raise Exception("El stream del run terminó sin entregar eventos")
+        run = await esperar_run(thread_id, run, tiempos)
+    except asyncio.CancelledError:
+        # Cliente desconectado o plazo vencido: que el run no siga consumiendo capacidad
+        await asyncio.shield(abandonar_run(thread_id, run, tiempos))
+        raise
+    tiempos.registrar(run)
+    return run
 
 
+# -----------------------
+# Material recuperado localmente (alternativa a file_search)
+# -----------------------
+def con_contexto(prompt: str, contexto: str = None):
+    """
+    Antepone al prompt los fragmentos del corpus recuperados por el backend.
+    """
+    if not contexto:
+        return prompt
+    return ("Material de la unidad (fragmentos de los archivos del curso). "
+            "Úsalo en lugar del vector_store:\n"
+            f"{contexto}\n\n{prompt}")
 
+def opciones_run(contexto: str = None):
+    """
+    Con el material en el prompt el run no necesita file_search.
+    """
+    return {"tools": []} if contexto else {}
 
 # Generación de preguntas
-async def generar_preguntas(assistant_id: str, vf: str, desarrollo: str, alternativas: str, dificultad: str):
-    prompt = f'''Generame preguntas segun su tipo que seran indicadas a continuacion.
+def prompt_preguntas(vf: str, desarrollo: str, alternativas: str, dificultad: str):
+    return f'''Generame preguntas segun su tipo que seran indicadas a continuacion.
         Las preguntas deben basarse exclusivamente en la información contenida en los archivos proporcionados en el vector_store, 
         pero sin mencionar los nombres de los documentos. 
         Cada pregunta debe abordar un concepto aprendido en los archivos. 
@@ -221,36 +1073,113 @@ async def generar_preguntas(assistant_id: str, vf: str, desarrollo: str, alterna
         solo proporciona la lista anidada. 
         No incluyas formatos especiales como **, -, o markdown en general, solamente devuelve texto plano. 
         Si la cantidad de preguntas es 0 no generes ese tipo de preguntas'''
+
+@instrumentar("generate")
+async def generar_preguntas(assistant_id: str, vf: str, desarrollo: str, alternativas: str, dificultad: str,
+                            vector_id: str = None, contexto: str = None):
+    """
+    Genera la evaluación en texto libre. Cada intento usa un thread nuevo con
+    solo el prompt: reenviarlo en el mismo thread duplicaría el historial
+    (y los tokens) del intento fallido.
+    Devuelve (texto, thread_id).
+    """
+    prompt = prompt_preguntas(vf, desarrollo, alternativas, dificultad)
+    prompt = con_contexto(prompt, contexto)
     max_retries = 4
-    retries = 0
-    thread_retries = 0
     try:
-        while retries < max_retries:
-            if thread_retries == 0 or thread_retries >= 2:
-                thread = client.beta.threads.create(messages=[{"role": "user", "content": prompt}])
-                thread_retries = 0
-
-            run = client.beta.threads.runs.create(thread_id=thread.id, assistant_id=assistant_id)
-
-            while run.status not in ["completed", "failed"]:
-                run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-                await asyncio.sleep(1)
-
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-            preguntas = interpretar_mensajes(messages)
+        for retries in range(max_retries):
+            medicion_actual()["reintentos"] = retries
+            thread = await client.beta.threads.create(
+                messages=[{"role": "user", "content": prompt}], **recursos_thread(vector_id)
+            )
+            run = await ejecutar_run(thread.id, assistant_id, **opciones_run(contexto))
+
+            preguntas = None
+            if run.status == "completed":
+                messages = await client.beta.threads.messages.list(thread_id=thread.id)
+                preguntas = interpretar_mensajes(messages)
 
             if preguntas and re.search(r"(Pregunta_vf:|Pregunta_desarrollo:|Pregunta_alternativas:)", preguntas):
                 return preguntas, thread.id
 
-            client.beta.threads.messages.create(thread_id=thread.id, content=prompt, role="user")
-            retries += 1
-            thread_retries += 1
-
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generando preguntas: {e}")
 
     raise HTTPException(status_code=500, detail="No se pudieron generar preguntas tras varios intentos.")
 
+@instrumentar("generate")
+async def generar_preguntas_en_vivo(assistant_id: str, vf: str, desarrollo: str, alternativas: str, dificultad: str,
+                                    al_evento, vector_id: str = None, contexto: str = None):
+    """
+    Como generar_preguntas, pero interpreta el texto mientras el modelo lo
+    escribe y llama a `al_evento(tipo, valor)` (async) con cada elemento ya
+    completo: ("nombre", str), ("descripcion", str) o ("pregunta", dict).
+    No reintenta (lo ya entregado no se puede retirar).
+    Devuelve el resultado completo, igual que interpretar_mensaje_separado.
+    """
+    prompt = con_contexto(prompt_preguntas(vf, desarrollo, alternativas, dificultad), contexto)
+    inicio = time.monotonic()
+    thread = await client.beta.threads.create(
+        messages=[{"role": "user", "content": prompt}], **recursos_thread(vector_id)
+    )
+    parser = ParserEvaluacion()
+    recibido = []  # texto ya entregado al parser
+    run = None
+    cortado = False
+    tiempos = TiemposRun()
+    primera = None
+
+    async def entregar(eventos):
+        nonlocal primera
+        for tipo, valor in eventos:
+            if tipo == "pregunta" and primera is None:
+                # Tiempo hasta la primera pregunta (lo que espera el alumno)
+                primera = time.monotonic() - inicio
+                observar_latencia("generate", "primera_pregunta", primera)
+            await al_evento(tipo, valor)
+
+    try:
+        try:
+            stream = await client.beta.threads.runs.create(
+                thread_id=thread.id, assistant_id=assistant_id, stream=True, timeout=TIMEOUTS["stream"],
+                **opciones_run(contexto)
+            )
+            async for evento in stream:
+                if evento.event == "thread.message.delta":
+                    for bloque in evento.data.delta.content or []:
+                        texto = getattr(getattr(bloque, "text", None), "value", None)
+                        if texto:
+                            recibido.append(texto)
+                            await entregar(parser.alimentar(texto))
+                elif evento.event.startswith("thread.run.") and not evento.event.startswith("thread.run.step"):
+                    run = evento.data
+                    tiempos.ver(run)
+                    if run.status in ESTADOS_FINALES or run.status == "requires_action":
+                        break
+            await stream.close()
+        except (APIError, httpx.HTTPError):
+            if run is None:
+                raise
+            cortado = True
+
+        if run is None:
+            raise HTTPException(status_code=500, detail="El stream del run terminó sin entregar eventos")
+        run = await esperar_run(thread.id, run, tiempos)
+    except asyncio.CancelledError:
+        await asyncio.shield(abandonar_run(thread.id, run, tiempos))
+        raise
+    tiempos.registrar(run)
+    if run.status != "completed":
+        raise HTTPException(status_code=500, detail=f"Error generando preguntas: el run terminó en {run.status}")
+
+    if cortado:
+        # El stream se cortó: lo que faltaba se toma del mensaje final
+        messages = await client.beta.threads.messages.list(thread_id=thread.id, limit=1)
+        completo = interpretar_mensajes(messages) or ""
+        await entregar(parser.alimentar(completo[len("".join(recibido)):]))
+    await entregar(parser.terminar())
+    return parser.resultado()
+
 def interpretar_mensajes(messages):
     for thread_message in messages.data:
         # Iterate over the 'content' attribute of the ThreadMessage, which is a list
@@ -259,9 +1188,165 @@ def interpretar_mensajes(messages):
             # and that 'text' has a 'value' attribute, print it
             return(content_item.text.value)
         
-import re
+# -----------------------
+# Interpretación de la evaluación generada
+# -----------------------
+MARCADORES_PREGUNTA = {
+    "Pregunta_vf:": "vf",
+    "Pregunta_desarrollo:": "desarrollo",
+    "Pregunta_alternativas:": "alternativas",
+}
+INICIOS_PREGUNTA = tuple(MARCADORES_PREGUNTA)
+CORRECTA = "Alternativa correcta:"
+CORRECTAS_VALIDAS = {"vf": ("V", "F"), "alternativas": ("a", "b", "c", "d")}
+LETRAS = ("a)", "b)", "c)", "d)")
+# Sangría y numeración de lista antes de un marcador ("  Pregunta_vf:", "1. Pregunta_vf:", "- Pregunta_vf:")
+PREFIJO_MARCADOR = re.compile(r"\s*(?:\d+[.)]|[-*•])?\s*(?=Pregunta_)")
+
+def quitar_prefijo(linea: str):
+    """
+    Quita la sangría o numeración que el modelo a veces agrega antes de un
+    marcador de pregunta; las demás líneas quedan igual.
+    """
+    if "Pregunta_" in linea and not linea.startswith(INICIOS_PREGUNTA):
+        prefijo = PREFIJO_MARCADOR.match(linea)
+        if prefijo:
+            return linea[prefijo.end():]
+    return linea
 
-import re
+class ParserEvaluacion:
+    """
+    Interpreta en una sola pasada, línea por línea, el texto generado por el
+    assistant. Se le puede entregar el texto completo o de a fragmentos a
+    medida que llega (alimentar), y devuelve los elementos que se completan:
+    ("nombre", str), ("descripcion", str) y ("pregunta", dict).
+    """
+
+    def __init__(self):
+        self.nombre = None
+        self.descripcion = None
+        self.preguntas = {"vf": [], "desarrollo": [], "alternativas": []}
+        self._pendiente = ""        # línea incompleta del último fragmento
+        self._nombre_en_siguiente = False
+        self._bloque = None         # "descripcion", "vf", "desarrollo", "alternativas"
+        self._lineas = []           # líneas del bloque actual
+        self._respuesta = None      # líneas de la respuesta (desarrollo)
+        self._completa = False      # la pregunta actual ya tiene su alternativa correcta
+
+    def alimentar(self, fragmento: str):
+        lineas = (self._pendiente + fragmento).split("\n")
+        self._pendiente = lineas.pop()
+        eventos = []
+        for linea in lineas:
+            self._linea(linea, eventos)
+        return eventos
+
+    def terminar(self):
+        eventos = []
+        if self._pendiente:
+            self._linea(self._pendiente, eventos)
+            self._pendiente = ""
+        self._cerrar_bloque(eventos)
+        return eventos
+
+    def resultado(self):
+        return {
+            "nombre": self.nombre if self.nombre is not None else "Evaluacion",
+            "descripcion": self.descripcion or "",
+            "preguntas": self.preguntas["vf"] + self.preguntas["desarrollo"] + self.preguntas["alternativas"]
+        }
+
+    # ---------------- Procesamiento por línea ----------------
+    def _linea(self, linea: str, eventos: list):
+        linea = quitar_prefijo(linea)
+        if self.nombre is None:
+            if self._nombre_en_siguiente:
+                if linea.strip():
+                    self.nombre = linea.strip()
+                    eventos.append(("nombre", self.nombre))
+            elif "Nombre:" in linea:
+                resto = linea.split("Nombre:", 1)[1].strip()
+                if resto:
+                    self.nombre = resto
+                    eventos.append(("nombre", self.nombre))
+                else:
+                    self._nombre_en_siguiente = True
+
+        if linea.startswith(INICIOS_PREGUNTA):
+            marcador = linea.split(":", 1)[0] + ":"
+            self._cerrar_bloque(eventos)
+            self._bloque = MARCADORES_PREGUNTA[marcador]
+            self._lineas = []
+            self._respuesta = None
+            self._completa = False
+            linea = linea[len(marcador):]
+        elif self.descripcion is None and self._bloque is None and "Descripcion:" in linea:
+            self._bloque = "descripcion"
+            self._lineas = [linea.split("Descripcion:", 1)[1]]
+            return
+        elif self._bloque is None or self._completa:
+            return
+        elif self._bloque == "descripcion":
+            self._lineas.append(linea)
+            return
+
+        if self._bloque == "desarrollo":
+            if self._respuesta is not None:
+                self._respuesta.append(linea)
+            elif "Respuesta:" in linea:
+                antes, despues = linea.split("Respuesta:", 1)
+                self._lineas.append(antes)
+                self._respuesta = [despues]
+            else:
+                self._lineas.append(linea)
+            return
+
+        # vf / alternativas: la pregunta termina con "Alternativa correcta: X"
+        if CORRECTA in linea:
+            antes, despues = linea.split(CORRECTA, 1)
+            correcta = despues.strip()
+            if correcta in CORRECTAS_VALIDAS[self._bloque]:
+                self._lineas.append(antes)
+                self._completa = True
+                eventos.append(("pregunta", self._agregar_pregunta(correcta)))
+                return
+        self._lineas.append(linea)
+
+    def _cerrar_bloque(self, eventos: list):
+        if self._bloque == "descripcion":
+            self.descripcion = "\n".join(self._lineas).strip()
+            eventos.append(("descripcion", self.descripcion))
+        elif self._bloque == "desarrollo" and self._respuesta is not None:
+            respuesta = "\n".join(self._respuesta).strip()
+            if respuesta:
+                eventos.append(("pregunta", self._agregar_pregunta(respuesta)))
+        # vf / alternativas sin alternativa correcta quedan descartadas
+        self._bloque = None
+        self._lineas = []
+        self._respuesta = None
+        self._completa = False
+
+    def _agregar_pregunta(self, valor: str):
+        texto = "\n".join(self._lineas).strip()
+        if self._bloque == "vf":
+            pregunta = {"tipo": "vf", "enunciado": texto, "correcta": valor}
+        elif self._bloque == "desarrollo":
+            pregunta = {"tipo": "desarrollo", "enunciado": texto, "respuesta": valor}
+        else:
+            pregunta = {"tipo": "alternativas", "enunciado": texto, "opciones": {}, "correcta": valor}
+            # El enunciado termina donde aparece la primera opción
+            corte = len(texto)
+            for letra in LETRAS:
+                posicion = texto.find(letra)
+                if posicion == -1:
+                    continue
+                corte = min(corte, posicion)
+                opcion = texto[posicion + 2:].lstrip().split("\n", 1)[0].strip()
+                if opcion:
+                    pregunta["opciones"][letra[0]] = opcion
+            pregunta["enunciado"] = texto[:corte].strip()
+        self.preguntas[pregunta["tipo"]].append(pregunta)
+        return pregunta
 
 def interpretar_mensaje_separado(mensaje_crudo: str):
     """
@@ -270,87 +1355,311 @@ def interpretar_mensaje_separado(mensaje_crudo: str):
     - descripcion
     - lista de preguntas separadas por tipo (vf, desarrollo, alternativas)
     """
+    parser = ParserEvaluacion()
+    parser.alimentar(mensaje_crudo)
+    parser.terminar()
+    return parser.resultado()
 
-    # ---------------- Nombre ----------------
-    nombre_match = re.search(r"Nombre:\s*(.+)", mensaje_crudo)
-    nombre = nombre_match.group(1).strip() if nombre_match else "Evaluacion"
+# -----------------------
+# Generación estructurada (JSON schema)
+# -----------------------
+# Intentos de generación y tiempo máximo de cada uno (segundos)
+intentos_generacion = int(os.getenv("INTENTOS_GENERACION", "3"))
+plazo_generacion = float(os.getenv("PLAZO_GENERACION", "120"))
 
-    # ---------------- Descripción ----------------
-    descripcion_match = re.search(
-        r"Descripcion:\s*(.+?)(?=(\nPregunta_vf:|\nPregunta_desarrollo:|\nPregunta_alternativas:|$))",
-        mensaje_crudo,
-        re.DOTALL
-    )
-    descripcion = descripcion_match.group(1).strip() if descripcion_match else ""
+class EvaluacionInvalida(Exception):
+    pass
 
-    preguntas = []
+def _lista(cantidad: int, propiedades: dict):
+    return {
+        "type": "array",
+        "minItems": cantidad,
+        "maxItems": cantidad,
+        "items": {
+            "type": "object",
+            "properties": propiedades,
+            "required": list(propiedades),
+            "additionalProperties": False
+        }
+    }
 
-    # ---------------- Verdadero/Falso ----------------
-    vf_pattern = re.compile(
-        r"Pregunta_vf:\s*(.+?)\s*Alternativa correcta:\s*([VF])(?=(\nPregunta_vf:|\nPregunta_desarrollo:|\nPregunta_alternativas:|$))",
-        re.DOTALL | re.MULTILINE
-    )
-    for match in vf_pattern.finditer(mensaje_crudo):
-        preguntas.append({
-            "tipo": "vf",
-            "enunciado": match.group(1).strip(),
-            "correcta": match.group(2).strip()
-        })
-
-    # ---------------- Desarrollo ----------------
-# ---------------- Desarrollo ----------------
-    des_pattern = re.compile(
-        r"Pregunta_desarrollo:\s*(.+?)\s*Respuesta:\s*(.+?)(?=\nPregunta_desarrollo:|\nPregunta_vf:|\nPregunta_alternativas:|$)",
-        re.DOTALL
-    )
-    for match in des_pattern.finditer(mensaje_crudo):
-        preguntas.append({
-            "tipo": "desarrollo",
-            "enunciado": match.group(1).strip(),
-            "respuesta": match.group(2).strip()
-        })
-
-
-    # ---------------- Alternativas ----------------
-    alt_pattern = re.compile(
-        r"Pregunta_alternativas:\s*(.+?)\s*Alternativa correcta:\s*([a-d])(?=(\nPregunta_desarrollo:|\nPregunta_vf:|\nPregunta_alternativas:|$))",
-        re.DOTALL | re.MULTILINE
-    )
-    for match in alt_pattern.finditer(mensaje_crudo):
-        enunciado_completo = match.group(1).strip()
-        correcta = match.group(2).strip()
-        opciones = {}
-
-        # Extraer opciones a-d
-        for letra in ['a', 'b', 'c', 'd']:
-            op_match = re.search(rf"{letra}\)\s*(.+)", enunciado_completo)
-            if op_match:
-                opciones[letra] = op_match.group(1).strip()
-
-        # Limpiar enunciado de las opciones
-        enunciado_limpio = re.split(r"(a\)|b\)|c\)|d\))", enunciado_completo)[0].strip()
-        preguntas.append({
-            "tipo": "alternativas",
-            "enunciado": enunciado_limpio,
+def esquema_evaluacion(cantidades: dict):
+    """
+    JSON schema de la evaluación con la cantidad exacta de preguntas por tipo.
+    """
+    texto = {"type": "string"}
+    opciones = {
+        "type": "object",
+        "properties": {letra: texto for letra in CORRECTAS_VALIDAS["alternativas"]},
+        "required": list(CORRECTAS_VALIDAS["alternativas"]),
+        "additionalProperties": False
+    }
+    propiedades = {
+        "nombre": texto,
+        "descripcion": texto,
+        "vf": _lista(cantidades["vf"], {
+            "enunciado": texto,
+            "correcta": {"type": "string", "enum": list(CORRECTAS_VALIDAS["vf"])}
+        }),
+        "desarrollo": _lista(cantidades["desarrollo"], {
+            "enunciado": texto,
+            "respuesta": texto
+        }),
+        "alternativas": _lista(cantidades["alternativas"], {
+            "enunciado": texto,
             "opciones": opciones,
-            "correcta": correcta
-        })
+            "correcta": {"type": "string", "enum": list(CORRECTAS_VALIDAS["alternativas"])}
+        }),
+    }
+    return {
+        "type": "object",
+        "properties": propiedades,
+        "required": list(propiedades),
+        "additionalProperties": False
+    }
+
+def validar_evaluacion(texto: str, cantidades: dict):
+    """
+    Revisa el JSON generado (cantidades por tipo, alternativas correctas) y lo
+    devuelve con la misma estructura que interpretar_mensaje_separado.
+    """
+    try:
+        datos = json.loads(texto or "")
+    except json.JSONDecodeError as e:
+        raise EvaluacionInvalida(f"la respuesta no es JSON válido ({e})")
+    if not isinstance(datos, dict):
+        raise EvaluacionInvalida("la respuesta no es un objeto JSON")
+
+    preguntas = []
+    for tipo in ("vf", "desarrollo", "alternativas"):
+        lista = datos.get(tipo) or []
+        if len(lista) != cantidades[tipo]:
+            raise EvaluacionInvalida(f"se pidieron {cantidades[tipo]} preguntas de {tipo} y llegaron {len(lista)}")
+        for pregunta in lista:
+            enunciado = (pregunta.get("enunciado") or "").strip()
+            if not enunciado:
+                raise EvaluacionInvalida(f"hay una pregunta de {tipo} sin enunciado")
+
+            if tipo == "desarrollo":
+                respuesta = (pregunta.get("respuesta") or "").strip()
+                if not respuesta:
+                    raise EvaluacionInvalida("hay una pregunta de desarrollo sin respuesta")
+                preguntas.append({"tipo": tipo, "enunciado": enunciado, "respuesta": respuesta})
+                continue
+
+            correcta = (pregunta.get("correcta") or "").strip()
+            if correcta not in CORRECTAS_VALIDAS[tipo]:
+                raise EvaluacionInvalida(f"alternativa correcta '{correcta}' no válida en {tipo}")
+            if tipo == "vf":
+                preguntas.append({"tipo": tipo, "enunciado": enunciado, "correcta": correcta})
+                continue
+
+            opciones = {letra: (valor or "").strip() for letra, valor in (pregunta.get("opciones") or {}).items()}
+            if any(not opciones.get(letra) for letra in CORRECTAS_VALIDAS["alternativas"]):
+                raise EvaluacionInvalida("hay una pregunta de alternativas sin sus cuatro opciones")
+            preguntas.append({"tipo": tipo, "enunciado": enunciado, "opciones": opciones, "correcta": correcta})
 
     return {
-        "nombre": nombre,
-        "descripcion": descripcion,
+        "nombre": (datos.get("nombre") or "").strip() or "Evaluacion",
+        "descripcion": (datos.get("descripcion") or "").strip(),
         "preguntas": preguntas
     }
 
+async def cancelar_runs_activos(thread_id: str):
+    """
+    Cancela los runs del thread que sigan en curso (por ejemplo tras un plazo vencido).
+    """
+    try:
+        runs = await client.beta.threads.runs.list(thread_id=thread_id, limit=5, timeout=TIMEOUTS["consulta"])
+        for run in runs.data:
+            if run.status not in ESTADOS_FINALES:
+                await cancelar_run(thread_id, run)
+    except Exception:
+        pass
+
+@instrumentar("generate")
+async def generar_evaluacion_estructurada(assistant_id: str, vf: int, desarrollo: int, alternativas: int, dificultad: str,
+                                          vector_id: str = None, contexto: str = None):
+    """
+    Genera la evaluación como JSON que cumple esquema_evaluacion, sin pasar por el texto libre.
+    Cada intento usa un thread nuevo con solo el prompt (y el motivo del rechazo anterior)
+    y tiene como máximo plazo_generacion segundos.
+    Con response_format json_schema la API solo acepta herramientas de tipo
+    function: el run va sin file_search y el material debe venir en `contexto`.
+    """
+    cantidades = {"vf": vf, "desarrollo": desarrollo, "alternativas": alternativas}
+    formato = {
+        "type": "json_schema",
+        "json_schema": {"name": "evaluacion", "schema": esquema_evaluacion(cantidades), "strict": True}
+    }
+    prompt = f'''Generame una evaluación basada exclusivamente en la información contenida en los archivos proporcionados en el vector_store,
+        sin mencionar los nombres de los documentos. Cada pregunta debe abordar un concepto aprendido en los archivos
+        y tener una dificultad {dificultad}.
+        La evaluación debe tener un nombre corto y formal, una descripción breve (2–3 líneas) sobre su contenido general,
+        exactamente {vf} preguntas de verdadero o falso, {desarrollo} preguntas de desarrollo con una breve respuesta esperada
+        y {alternativas} preguntas de alternativas con cuatro opciones (a, b, c y d) y una sola correcta.
+        Utiliza un tono formal y texto plano, sin markdown.'''
+    prompt = con_contexto(prompt, contexto)
+
+    motivo = None
+    for intento in range(intentos_generacion):
+        medicion_actual()["reintentos"] = intento
+        contenido = prompt if motivo is None else f"{prompt}\n\nEl intento anterior fue rechazado: {motivo}."
+        thread = await client.beta.threads.create(
+            messages=[{"role": "user", "content": contenido}], **recursos_thread(vector_id)
+        )
+        try:
+            run = await asyncio.wait_for(
+                ejecutar_run(thread.id, assistant_id, response_format=formato, tools=[]),
+                plazo_generacion
+            )
+            if run.status != "completed":
+                raise RunNoCompletado(run)
+            messages = await client.beta.threads.messages.list(
+                thread_id=thread.id, limit=1, timeout=TIMEOUTS["consulta"]
+            )
+            return validar_evaluacion(interpretar_mensajes(messages), cantidades)
+        except asyncio.TimeoutError:
+            # ejecutar_run ya canceló el run al vencer el plazo
+            motivo = f"no terminó en {plazo_generacion:.0f} segundos"
+        except (RunNoCompletado, EvaluacionInvalida) as e:
+            motivo = str(e)
+
+    raise HTTPException(
+        status_code=500,
+        detail=f"No se pudo generar la evaluación tras {intentos_generacion} intentos: {motivo}"
+    )
+
+
+@instrumentar("grade")
+async def corregir_desarrollo(assistant_id: str, r: dict, vector_id: str = None, contexto: str = None):
+    """
+    Corrige una respuesta de desarrollo con el assistant.
+    Devuelve el puntaje (0-100) y el texto de retroalimentación.
+    """
+    prompt = f"""
+    Evalúa la siguiente respuesta de un estudiante en base a los documentos del vector_store.
+    Pregunta: {r['enunciado']}
+    Respuesta del estudiante: {r['respuesta_usuario']}
+
+    Devuelve en este formato:
+    Puntaje: (0 a 100)
+    Retroalimentacion: texto plano breve sobre fortalezas y debilidades.
+    """
+    thread = await client.beta.threads.create(
+        messages=[{"role": "user", "content": con_contexto(prompt, contexto)}], **recursos_thread(vector_id)
+    )
+    run = await ejecutar_run(thread.id, assistant_id, **opciones_run(contexto))
+    if run.status != "completed":
+        raise RunNoCompletado(run)
+
+    messages = await client.beta.threads.messages.list(thread_id=thread.id)
+    feedback = interpretar_mensajes(messages)
+
+    return extraer_puntaje(feedback), feedback
 
+def extraer_puntaje(feedback: str):
+    # Extraer puntaje de desarrollo (0-100)
+    match = re.search(r"Puntaje:\s*(\d+)", feedback or "")
+    return int(match.group(1)) if match else 0
 
-async def corregir_evaluacion(assistant_id: str, respuestas: list, peso_desarrollo: float = 2.0):
+
+def normalizar_texto(texto: str):
+    texto = unicodedata.normalize("NFKC", str(texto or "")).casefold()
+    texto = re.sub(r"\s+", " ", texto).strip()
+    return texto.rstrip(" .;,")
+
+def huella_correccion(version_contenido: str, enunciado: str, respuesta_usuario: str):
+    """
+    Clave de la caché de correcciones: cambia si cambia el material de la
+    unidad, la pregunta o la respuesta (ignorando mayúsculas y espacios).
+    """
+    partes = [version_contenido or "", normalizar_texto(enunciado), normalizar_texto(respuesta_usuario)]
+    return hashlib.sha256("\x1f".join(partes).encode("utf-8")).hexdigest()
+
+async def corregir_desarrollo_con_cache(assistant_id: str, r: dict, cache, version_contenido: str,
+                                        vector_id: str = None, contexto: str = None):
+    """
+    Igual que corregir_desarrollo, pero reutiliza correcciones previas.
+    cache debe tener obtener(huella) y guardar(huella, puntaje, retroalimentacion, segundos);
+    son síncronos (usan la base de datos), así que corren con asyncio.to_thread.
+    """
+    if cache is None:
+        return await corregir_desarrollo(assistant_id, r, vector_id, contexto)
+
+    huella = huella_correccion(version_contenido, r["enunciado"], r["respuesta_usuario"])
+    guardado = await asyncio.to_thread(cache.obtener, huella)
+    if guardado:
+        return guardado
+
+    inicio = time.monotonic()
+    puntaje_desarrollo, feedback = await corregir_desarrollo(assistant_id, r, vector_id, contexto)
+    await asyncio.to_thread(cache.guardar, huella, puntaje_desarrollo, feedback, time.monotonic() - inicio)
+    return puntaje_desarrollo, feedback
+
+async def corregir_evaluacion(assistant_id: str, respuestas: list, peso_desarrollo: float = 2.0,
+                              max_concurrentes: int = None, cache=None, version_contenido: str = "",
+                              vector_id: str = None, contexto_de=None):
     """
     Corrige una evaluación completa.
     - respuestas: lista de dicts con {id, tipo, enunciado, respuesta_usuario, correcta}
     - peso_desarrollo: multiplicador para el puntaje de desarrollo (por defecto 2)
+    - max_concurrentes: máximo de respuestas de desarrollo corregidas en paralelo
+      (por defecto CORRECCIONES_CONCURRENTES)
+    - cache / version_contenido: caché opcional de correcciones de desarrollo
+    - vector_id: vector de la unidad, se vincula a cada thread (assistant compartido)
+    - contexto_de: función opcional r -> fragmentos del corpus para el prompt (índice local);
+      es síncrona (consulta BM25), así que corre con asyncio.to_thread
     Devuelve: % cumplimiento y retroalimentación de desarrollo.
     """
+    # Corregir todas las respuestas de desarrollo en paralelo (con límite)
+    semaforo = asyncio.Semaphore(max_concurrentes or correcciones_concurrentes)
+
+    async def corregir_con_limite(r):
+        async with semaforo:
+            contexto = await asyncio.to_thread(contexto_de, r) if contexto_de else None
+            return await corregir_desarrollo_con_cache(assistant_id, r, cache, version_contenido, vector_id, contexto)
+
+    desarrollos = [r for r in respuestas if r["tipo"] == "desarrollo"]
+    try:
+        # Si una corrección falla, el grupo cancela las demás y sus runs se abandonan
+        async with asyncio.TaskGroup() as grupo:
+            tareas = [grupo.create_task(corregir_con_limite(r)) for r in desarrollos]
+    except ExceptionGroup as errores:
+        e = errores.exceptions[0]
+        raise HTTPException(status_code=500, detail=f"Error evaluando desarrollo: {e}") from e
+    resultados = [tarea.result() for tarea in tareas]
+
+    return calcular_resultado(respuestas, resultados, peso_desarrollo)
+
+def es_correcta(r: dict):
+    """
+    Respuesta VF / alternativa igual a la correcta (sin distinguir mayúsculas).
+    """
+    return r.get("correcta") is not None and str(r["respuesta_usuario"]).strip().lower() == str(r["correcta"]).strip().lower()
+
+def resultado_objetivo(respuestas: list, peso_desarrollo: float = 2.0):
+    """
+    Parte de la corrección que no necesita la IA (VF y alternativas).
+    Devuelve el % de cumplimiento ya asegurado (desarrollo en 0), el máximo
+    alcanzable (desarrollo perfecto) y las correctas sobre el total objetivo.
+    """
+    desarrollos = sum(1 for r in respuestas if r["tipo"] == "desarrollo")
+    objetivas = [r for r in respuestas if r["tipo"] in ["vf", "alternativa"]]
+    return {
+        "cumplimiento": calcular_resultado(respuestas, [(0, "")] * desarrollos, peso_desarrollo)["cumplimiento"],
+        "cumplimiento_maximo": calcular_resultado(respuestas, [(100, "")] * desarrollos, peso_desarrollo)["cumplimiento"],
+        "correctas": sum(1 for r in objetivas if es_correcta(r)),
+        "total_objetivas": len(objetivas),
+        "desarrollos_pendientes": desarrollos,
+    }
+
+def calcular_resultado(respuestas: list, resultados: list, peso_desarrollo: float = 2.0):
+    """
+    Calcula el % de cumplimiento de una evaluación.
+    - respuestas: lista de dicts con {id, tipo, respuesta_usuario, correcta}
+    - resultados: (puntaje 0-100, retroalimentacion) de cada desarrollo, en el orden de respuestas
+    """
     retroalimentaciones = []
 
     # Contar preguntas por tipo
@@ -361,46 +1670,24 @@ async def corregir_evaluacion(assistant_id: str, respuestas: list, peso_desarrol
     max_puntos = total_vf_alt + total_desarrollo * peso_desarrollo
     puntos_obtenidos = 0.0
 
+    resultados_desarrollo = iter(resultados)
+
+    # Sumar en el mismo orden de las respuestas para mantener el resultado
     for r in respuestas:
         if r["tipo"] in ["vf", "alternativa"]:
-            if r.get("correcta") is not None and str(r["respuesta_usuario"]).strip().lower() == str(r["correcta"]).strip().lower():
+            if es_correcta(r):
                 puntos_obtenidos += 1  # cada VF/alt correcta = 1 punto
 
         elif r["tipo"] == "desarrollo":
-            prompt = f"""
-            Evalúa la siguiente respuesta de un estudiante en base a los documentos del vector_store.
-            Pregunta: {r['enunciado']}
-            Respuesta del estudiante: {r['respuesta_usuario']}
-
-            Devuelve en este formato:
-            Puntaje: (0 a 100)
-            Retroalimentacion: texto plano breve sobre fortalezas y debilidades.
-            """
-            try:
-                thread = client.beta.threads.create(messages=[{"role": "user", "content": prompt}])
-                run = client.beta.threads.runs.create(thread_id=thread.id, assistant_id=assistant_id)
+            puntaje_desarrollo, feedback = next(resultados_desarrollo)
 
-                while run.status not in ["completed", "failed"]:
-                    run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-                    await asyncio.sleep(1)
+            # Convertir a escala de peso_desarrollo
+            puntos_obtenidos += (puntaje_desarrollo / 100) * peso_desarrollo
 
-                messages = client.beta.threads.messages.list(thread_id=thread.id)
-                feedback = interpretar_mensajes(messages)
-
-                # Extraer puntaje de desarrollo (0-100)
-                match = re.search(r"Puntaje:\s*(\d+)", feedback)
-                puntaje_desarrollo = int(match.group(1)) if match else 0
-
-                # Convertir a escala de peso_desarrollo
-                puntos_obtenidos += (puntaje_desarrollo / 100) * peso_desarrollo
-
-                retroalimentaciones.append({
-                    "id_desarrollo": r["id"],
-                    "retroalimentacion": feedback
-                })
-
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Error evaluando desarrollo: {e}")
+            retroalimentaciones.append({
+                "id_desarrollo": r["id"],
+                "retroalimentacion": feedback
+            })
 
     # Cumplimiento global en %
     cumplimiento = int((puntos_obtenidos / max_puntos) * 100) if max_puntos > 0 else 0
@@ -409,3 +1696,80 @@ async def corregir_evaluacion(assistant_id: str, respuestas: list, peso_desarrol
         "cumplimiento": cumplimiento,
         "retroalimentaciones": retroalimentaciones
     }
+
+
+# -----------------------
+# Corrección masiva con la Batch API
+# -----------------------
+def solicitud_lote_correccion(custom_id: str, enunciado: str, respuesta_usuario: str, referencia: str = None):
+    """
+    Una línea del JSONL de la Batch API para corregir una respuesta de desarrollo.
+    La Batch API no ejecuta assistants, así que se usa la respuesta de referencia
+    de la pregunta en vez del vector_store.
+    """
+    prompt = f"""
+    Evalúa la siguiente respuesta de un estudiante comparándola con la respuesta de referencia.
+    Pregunta: {enunciado}
+    Respuesta de referencia: {referencia or "(sin referencia)"}
+    Respuesta del estudiante: {respuesta_usuario}
+
+    Devuelve en este formato:
+    Puntaje: (0 a 100)
+    Retroalimentacion: texto plano breve sobre fortalezas y debilidades.
+    """
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": modelo,
+            "messages": [
+                {"role": "system", "content": instrucciones or ""},
+                {"role": "user", "content": prompt}
+            ]
+        }
+    }
+
+async def enviar_lote(ruta_jsonl: str):
+    """
+    Sube el JSONL y crea el batch. Devuelve el batch_id.
+    """
+    with open(ruta_jsonl, "rb") as f:
+        archivo = await client.files.create(
+            file=(os.path.basename(ruta_jsonl), f), purpose="batch", timeout=TIMEOUTS["subida"]
+        )
+    lote = await client.batches.create(
+        input_file_id=archivo.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    return lote.id
+
+async def obtener_lote(batch_id: str):
+    return await client.batches.retrieve(batch_id, timeout=TIMEOUTS["consulta"])
+
+async def resultados_lote(lote):
+    """
+    Descarga la salida de un batch completado.
+    Devuelve {custom_id: texto de la respuesta} y {custom_id: error}.
+    """
+    resultados = {}
+    errores = {}
+    if lote.output_file_id:
+        contenido = await client.files.content(lote.output_file_id, timeout=TIMEOUTS["subida"])
+        for linea in contenido.text.splitlines():
+            if not linea.strip():
+                continue
+            item = json.loads(linea)
+            respuesta = item.get("response") or {}
+            if item.get("error") or respuesta.get("status_code") != 200:
+                errores[item["custom_id"]] = item.get("error") or respuesta.get("body")
+                continue
+            resultados[item["custom_id"]] = respuesta["body"]["choices"][0]["message"]["content"]
+    if lote.error_file_id:
+        contenido = await client.files.content(lote.error_file_id, timeout=TIMEOUTS["subida"])
+        for linea in contenido.text.splitlines():
+            if linea.strip():
+                item = json.loads(linea)
+                errores[item["custom_id"]] = item.get("error")
+    return resultados, errores
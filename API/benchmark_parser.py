@@ -0,0 +1,139 @@
+"""
+Compara el parser incremental de API.py (ParserEvaluacion) con la versión
+anterior basada en expresiones regulares, sobre las salidas capturadas en
+salidas_generadas/.
+
+    cd API
+    python benchmark_parser.py
+
+Informa el tiempo de interpretación por KB de cada versión y si ambas
+entregan el mismo resultado. La versión anterior no aceptaba marcadores con
+sangría o numeración, así que el resultado esperado se calcula sobre el texto
+con esos prefijos quitados.
+"""
+from API import interpretar_mensaje_separado, ParserEvaluacion, quitar_prefijo
+import argparse
+import glob
+import os
+import re
+import time
+
+
+def interpretar_regex(mensaje_crudo: str):
+    """
+    Implementación anterior de interpretar_mensaje_separado.
+    """
+    nombre_match = re.search(r"Nombre:\s*(.+)", mensaje_crudo)
+    nombre = nombre_match.group(1).strip() if nombre_match else "Evaluacion"
+
+    descripcion_match = re.search(
+        r"Descripcion:\s*(.+?)(?=(\nPregunta_vf:|\nPregunta_desarrollo:|\nPregunta_alternativas:|$))",
+        mensaje_crudo,
+        re.DOTALL
+    )
+    descripcion = descripcion_match.group(1).strip() if descripcion_match else ""
+
+    preguntas = []
+
+    vf_pattern = re.compile(
+        r"Pregunta_vf:\s*(.+?)\s*Alternativa correcta:\s*([VF])(?=(\nPregunta_vf:|\nPregunta_desarrollo:|\nPregunta_alternativas:|$))",
+        re.DOTALL | re.MULTILINE
+    )
+    for match in vf_pattern.finditer(mensaje_crudo):
+        preguntas.append({
+            "tipo": "vf",
+            "enunciado": match.group(1).strip(),
+            "correcta": match.group(2).strip()
+        })
+
+    des_pattern = re.compile(
+        r"Pregunta_desarrollo:\s*(.+?)\s*Respuesta:\s*(.+?)(?=\nPregunta_desarrollo:|\nPregunta_vf:|\nPregunta_alternativas:|$)",
+        re.DOTALL
+    )
+    for match in des_pattern.finditer(mensaje_crudo):
+        preguntas.append({
+            "tipo": "desarrollo",
+            "enunciado": match.group(1).strip(),
+            "respuesta": match.group(2).strip()
+        })
+
+    alt_pattern = re.compile(
+        r"Pregunta_alternativas:\s*(.+?)\s*Alternativa correcta:\s*([a-d])(?=(\nPregunta_desarrollo:|\nPregunta_vf:|\nPregunta_alternativas:|$))",
+        re.DOTALL | re.MULTILINE
+    )
+    for match in alt_pattern.finditer(mensaje_crudo):
+        enunciado_completo = match.group(1).strip()
+        correcta = match.group(2).strip()
+        opciones = {}
+        for letra in ['a', 'b', 'c', 'd']:
+            op_match = re.search(rf"{letra}\)\s*(.+)", enunciado_completo)
+            if op_match:
+                opciones[letra] = op_match.group(1).strip()
+        enunciado_limpio = re.split(r"(a\)|b\)|c\)|d\))", enunciado_completo)[0].strip()
+        preguntas.append({
+            "tipo": "alternativas",
+            "enunciado": enunciado_limpio,
+            "opciones": opciones,
+            "correcta": correcta
+        })
+
+    return {"nombre": nombre, "descripcion": descripcion, "preguntas": preguntas}
+
+
+def interpretar_por_fragmentos(mensaje_crudo: str, tamano: int = 16):
+    """
+    Igual que interpretar_mensaje_separado pero entregando el texto de a
+    fragmentos, como llega desde el stream.
+    """
+    parser = ParserEvaluacion()
+    for i in range(0, len(mensaje_crudo), tamano):
+        parser.alimentar(mensaje_crudo[i:i + tamano])
+    parser.terminar()
+    return parser.resultado()
+
+
+def medir(funcion, texto, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion(texto)
+    return (time.perf_counter() - inicio) / repeticiones
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--carpeta", default=os.path.join(os.path.dirname(__file__), "salidas_generadas"))
+    parser.add_argument("--repeticiones", type=int, default=2000)
+    args = parser.parse_args()
+
+    versiones = {
+        "regex": interpretar_regex,
+        "una pasada": interpretar_mensaje_separado,
+        "fragmentos": interpretar_por_fragmentos,
+    }
+    totales = {nombre: 0.0 for nombre in versiones}
+    kb_total = 0.0
+
+    for ruta in sorted(glob.glob(os.path.join(args.carpeta, "*.txt"))):
+        with open(ruta, encoding="utf-8") as f:
+            texto = f.read()
+        kb = len(texto.encode("utf-8")) / 1024
+        kb_total += kb
+
+        esperado = interpretar_regex("\n".join(quitar_prefijo(linea) for linea in texto.split("\n")))
+        iguales = all(funcion(texto) == esperado for nombre, funcion in versiones.items() if nombre != "regex")
+
+        tiempos = []
+        for nombre, funcion in versiones.items():
+            segundos = medir(funcion, texto, args.repeticiones)
+            totales[nombre] += segundos
+            tiempos.append(f"{nombre}={segundos * 1e6 / kb:7.1f} µs/KB")
+        print(f"{os.path.basename(ruta):<32} {kb:5.2f} KB  {'  '.join(tiempos)}  "
+              f"{'igual' if iguales else 'DISTINTO'}")
+
+    if kb_total:
+        print("total".ljust(32), f"{kb_total:5.2f} KB ",
+              "  ".join(f"{nombre}={segundos * 1e6 / kb_total:7.1f} µs/KB" for nombre, segundos in totales.items()))
+
+
+if __name__ == "__main__":
+    main()
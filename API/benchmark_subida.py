@@ -0,0 +1,78 @@
+"""
+Mide la memoria máxima (RSS) del proceso al subir archivos cada vez más
+grandes con subir_archivo_a_vector contra el servidor local.
+
+    cd API
+    uvicorn fake_openai:app --port 8010
+    python benchmark_subida.py --url http://localhost:8010/v1
+
+Cada subida corre en un proceso aparte (el RSS máximo nunca baja) y se
+compara con la versión anterior, que leía el archivo completo en memoria.
+Con envío por bloques el RSS debe mantenerse plano al crecer el archivo.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+BLOQUE = os.urandom(1024 * 1024)
+
+
+def rss_maximo_mb():
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo entrega en KB, macOS en bytes
+    return maximo / 1024 if sys.platform != "darwin" else maximo / (1024 * 1024)
+
+
+async def subir(modo: str, megas: int):
+    from fastapi import UploadFile
+    import API
+
+    archivo = UploadFile(
+        file=tempfile.SpooledTemporaryFile(max_size=API.limite_memoria_subida),
+        filename=f"apuntes_{megas}mb.pdf"
+    )
+    for _ in range(megas):
+        archivo.file.write(BLOQUE)
+
+    vector = await API.client.vector_stores.create(name="benchmark")
+    base = rss_maximo_mb()
+    if modo == "bloques":
+        await API.subir_archivo_a_vector(vector.id, archivo)
+    else:
+        # Versión anterior: todo el contenido en memoria antes de enviarlo
+        await archivo.seek(0)
+        contenido = await archivo.read()
+        await API.client.files.create(file=(archivo.filename, contenido), purpose="assistants")
+    print(f"{rss_maximo_mb() - base:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8010/v1")
+    parser.add_argument("--tamanos", default="10,50,100,200", help="Tamaños en MB separados por coma")
+    parser.add_argument("--interno", nargs=2, metavar=("MODO", "MB"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.interno:
+        asyncio.run(subir(args.interno[0], int(args.interno[1])))
+        return
+
+    entorno = dict(os.environ, OPENAI_BASE_URL=args.url, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "benchmark"))
+    print(f"{'MB':>6} {'por bloques':>14} {'en memoria':>14}   (aumento del RSS máximo durante la subida)")
+    for megas in (int(t) for t in args.tamanos.split(",")):
+        fila = []
+        for modo in ("bloques", "memoria"):
+            salida = subprocess.run(
+                [sys.executable, __file__, "--interno", modo, str(megas)],
+                env=entorno, capture_output=True, text=True, check=True
+            )
+            fila.append(float(salida.stdout.strip().splitlines()[-1]))
+        print(f"{megas:>6} {fila[0]:>11.1f} MB {fila[1]:>11.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Mide la reutilización de conexiones y la latencia p99 del transporte HTTP
+de API.py con 50 requests concurrentes contra el servidor local.
+
+    cd API
+    uvicorn fake_openai:app --port 8010
+    python benchmark_transporte.py --url http://localhost:8010/v1
+
+Compara el transporte configurado en API.py con uno sin keep-alive.
+"""
+from openai import AsyncOpenAI
+from API import crear_http_client, TIMEOUTS
+import argparse
+import asyncio
+import time
+
+
+class Conteo:
+    def __init__(self):
+        self.requests = 0
+        self.conexiones = 0
+
+    async def trace(self, evento, info):
+        if evento == "connection.connect_tcp.complete":
+            self.conexiones += 1
+
+    async def al_enviar(self, request):
+        self.requests += 1
+        request.extensions["trace"] = self.trace
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+async def medir(nombre, url, concurrentes, rondas, **opciones):
+    conteo = Conteo()
+    http_client = crear_http_client(event_hooks={"request": [conteo.al_enviar]}, **opciones)
+    cliente = AsyncOpenAI(api_key="benchmark", base_url=url, http_client=http_client)
+    latencias = []
+
+    async def tarea():
+        for _ in range(rondas):
+            inicio = time.perf_counter()
+            thread = await cliente.beta.threads.create(messages=[{"role": "user", "content": "hola"}])
+            await cliente.beta.threads.messages.list(thread_id=thread.id, timeout=TIMEOUTS["consulta"])
+            latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(tarea() for _ in range(concurrentes)))
+    total = time.perf_counter() - inicio
+    await cliente.close()
+
+    reutilizacion = 1 - conteo.conexiones / conteo.requests if conteo.requests else 0
+    print(f"{nombre:<14} requests={conteo.requests:<5} conexiones={conteo.conexiones:<4} "
+          f"reutilización={reutilizacion:6.1%}  p50={percentil(latencias, 0.5) * 1000:7.1f} ms  "
+          f"p99={percentil(latencias, 0.99) * 1000:7.1f} ms  total={total:5.2f} s")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8010/v1")
+    parser.add_argument("--concurrentes", type=int, default=50)
+    parser.add_argument("--rondas", type=int, default=20)
+    args = parser.parse_args()
+
+    await medir("configurado", args.url, args.concurrentes, args.rondas)
+    await medir("sin keep-alive", args.url, args.concurrentes, args.rondas, max_keepalive=0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
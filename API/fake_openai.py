@@ -0,0 +1,763 @@
+"""
+Servidor local que imita los endpoints de OpenAI que usa API.py
+(assistants, threads/runs, messages, files, vector_stores, chat/completions y batches).
+
+Sirve para probar y medir el sistema sin la API real. Para usarlo:
+
+    cd API
+    uvicorn fake_openai:app --port 8010
+
+y en el .env de API (o del backend):
+
+    OPENAI_BASE_URL=http://localhost:8010/v1
+
+Variables de configuración:
+- FAKE_OPENAI_MODO: "simulado" (por defecto), "grabar" o "reproducir"
+- FAKE_OPENAI_LATENCIA: latencia agregada a cada request, en segundos
+- FAKE_OPENAI_COLA / FAKE_OPENAI_DURACION_RUN: segundos que un run pasa en
+  queued y en in_progress
+- FAKE_OPENAI_DURACION_LOTE: segundos que tarda un batch en completarse
+- FAKE_OPENAI_DURACION_INGESTA: segundos que un archivo pasa en in_progress
+  dentro de un vector store
+- FAKE_OPENAI_PARTES_STREAM: deltas (thread.message.delta) en que se divide
+  la respuesta de un run con stream
+- FAKE_OPENAI_SOLICITUDES_POR_MINUTO: límite de solicitudes (0 = sin límite);
+  al pasarlo responde 429 con retry-after-ms, y siempre envía x-ratelimit-*
+- FAKE_OPENAI_CASSETTE: archivo JSON donde se graban / leen las respuestas
+- FAKE_OPENAI_UPSTREAM: API real a la que se reenvía en modo "grabar"
+
+En modo "grabar" cada request se reenvía a la API real y la respuesta queda
+guardada en el cassette; en modo "reproducir" se devuelven las respuestas
+grabadas en el mismo orden, sin red.
+"""
+from fastapi import FastAPI, Request, HTTPException, UploadFile, File, Form
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import os
+import re
+import time
+
+MODO = os.getenv("FAKE_OPENAI_MODO", "simulado")
+LATENCIA = float(os.getenv("FAKE_OPENAI_LATENCIA", "0"))
+COLA = float(os.getenv("FAKE_OPENAI_COLA", "0.2"))
+DURACION_RUN = float(os.getenv("FAKE_OPENAI_DURACION_RUN", "1"))
+DURACION_LOTE = float(os.getenv("FAKE_OPENAI_DURACION_LOTE", "5"))
+DURACION_INGESTA = float(os.getenv("FAKE_OPENAI_DURACION_INGESTA", "0"))
+# Deltas en que se divide la respuesta de un run con stream
+PARTES_STREAM = int(os.getenv("FAKE_OPENAI_PARTES_STREAM", "20"))
+# Límite de solicitudes por minuto (0 = sin límite)
+SOLICITUDES_POR_MINUTO = int(os.getenv("FAKE_OPENAI_SOLICITUDES_POR_MINUTO", "0"))
+CASSETTE = os.getenv("FAKE_OPENAI_CASSETTE", os.path.join(os.path.dirname(__file__), "cassette.json"))
+UPSTREAM = os.getenv("FAKE_OPENAI_UPSTREAM", "https://api.openai.com")
+
+app = FastAPI()
+
+# -----------------------
+# Estado en memoria
+# -----------------------
+assistants = {}
+vector_stores = {}
+archivos = {}
+threads = {}
+mensajes = {}  # thread_id -> lista de mensajes (más antiguo primero)
+runs = {}      # run_id -> run
+lotes = {}     # batch_id -> batch
+contenidos = {}  # file_id -> bytes (solo archivos de batch)
+ingestas = {}    # (vector_id, file_id) -> momento en que termina de indexarse
+_contador = itertools.count(1)
+
+def nuevo_id(prefijo: str):
+    return f"{prefijo}_fake{next(_contador):06d}"
+
+def ahora():
+    return int(time.time())
+
+def lista(datos: list):
+    return {
+        "object": "list",
+        "data": datos,
+        "first_id": datos[0]["id"] if datos else None,
+        "last_id": datos[-1]["id"] if datos else None,
+        "has_more": False
+    }
+
+def no_encontrado(tipo: str, id: str):
+    raise HTTPException(status_code=404, detail=f"No existe {tipo} '{id}'")
+
+# -----------------------
+# Grabar / reproducir
+# -----------------------
+_grabaciones = None
+_posiciones = {}
+
+def cargar_cassette():
+    global _grabaciones
+    if _grabaciones is None:
+        if os.path.exists(CASSETTE):
+            with open(CASSETTE, encoding="utf-8") as f:
+                _grabaciones = json.load(f)
+        else:
+            _grabaciones = {}
+    return _grabaciones
+
+def guardar_cassette():
+    with open(CASSETTE, "w", encoding="utf-8") as f:
+        json.dump(_grabaciones, f, ensure_ascii=False, indent=1)
+
+def clave_request(metodo: str, ruta: str, query: str, tipo_contenido: str, cuerpo: bytes):
+    """
+    Clave estable de un request: el boundary de multipart y el orden de las
+    claves JSON no cambian la clave.
+    """
+    if "multipart/form-data" in tipo_contenido:
+        boundary = tipo_contenido.split("boundary=")[-1].encode()
+        cuerpo = cuerpo.replace(boundary, b"")
+    elif cuerpo:
+        try:
+            cuerpo = json.dumps(json.loads(cuerpo), sort_keys=True).encode()
+        except ValueError:
+            pass
+    return f"{metodo} {ruta}?{query} {hashlib.sha256(cuerpo).hexdigest()[:16]}"
+
+# Cubeta de solicitudes: [nivel, última actualización]
+_cubeta = [float(SOLICITUDES_POR_MINUTO), time.monotonic()]
+respuestas_429 = 0
+
+@app.middleware("http")
+async def limite_de_tasa(request: Request, call_next):
+    """
+    Imita los límites de OpenAI: x-ratelimit-* en cada respuesta y 429 con
+    retry-after-ms cuando se agotan las solicitudes del minuto.
+    """
+    global respuestas_429
+    if not SOLICITUDES_POR_MINUTO:
+        return await call_next(request)
+    instante = time.monotonic()
+    _cubeta[0] = min(SOLICITUDES_POR_MINUTO, _cubeta[0] + SOLICITUDES_POR_MINUTO / 60 * (instante - _cubeta[1]))
+    _cubeta[1] = instante
+    encabezados = {"x-ratelimit-limit-requests": str(SOLICITUDES_POR_MINUTO)}
+    if _cubeta[0] < 1:
+        respuestas_429 += 1
+        espera = (1 - _cubeta[0]) * 60 / SOLICITUDES_POR_MINUTO
+        encabezados.update({"x-ratelimit-remaining-requests": "0", "retry-after-ms": str(int(espera * 1000))})
+        return JSONResponse(status_code=429, headers=encabezados, content={
+            "error": {"message": "Rate limit reached for requests", "type": "requests", "code": "rate_limit_exceeded"}
+        })
+    _cubeta[0] -= 1
+    respuesta = await call_next(request)
+    encabezados["x-ratelimit-remaining-requests"] = str(int(_cubeta[0]))
+    respuesta.headers.update(encabezados)
+    return respuesta
+
+@app.middleware("http")
+async def latencia_y_cassette(request: Request, call_next):
+    if LATENCIA:
+        await asyncio.sleep(LATENCIA)
+
+    if MODO == "simulado":
+        return await call_next(request)
+
+    cuerpo = await request.body()
+    clave = clave_request(
+        request.method, request.url.path, request.url.query,
+        request.headers.get("content-type", ""), cuerpo
+    )
+    grabaciones = cargar_cassette()
+
+    if MODO == "reproducir":
+        respuestas = grabaciones.get(clave)
+        if not respuestas:
+            return JSONResponse(status_code=404, content={"error": {"message": f"Sin grabación para {clave}"}})
+        posicion = _posiciones.get(clave, 0)
+        _posiciones[clave] = posicion + 1
+        grabada = respuestas[min(posicion, len(respuestas) - 1)]
+        return Response(
+            content=base64.b64decode(grabada["cuerpo"]),
+            status_code=grabada["status"],
+            media_type=grabada["tipo"]
+        )
+
+    # MODO == "grabar": reenviar a la API real
+    import httpx
+    encabezados = {k: v for k, v in request.headers.items() if k.lower() not in ("host", "content-length")}
+    async with httpx.AsyncClient(base_url=UPSTREAM, timeout=600) as upstream:
+        respuesta = await upstream.request(
+            request.method, request.url.path, params=request.url.query, content=cuerpo, headers=encabezados
+        )
+    tipo = respuesta.headers.get("content-type", "application/json")
+    grabaciones.setdefault(clave, []).append({
+        "status": respuesta.status_code,
+        "tipo": tipo,
+        "cuerpo": base64.b64encode(respuesta.content).decode()
+    })
+    guardar_cassette()
+    return Response(content=respuesta.content, status_code=respuesta.status_code, media_type=tipo)
+
+# -----------------------
+# Respuestas simuladas del modelo
+# -----------------------
+def cantidad(patron: str, texto: str):
+    match = re.search(patron, texto)
+    return int(match.group(1)) if match else 0
+
+def respuesta_simulada(prompt: str):
+    """
+    Texto determinista con el formato que espera API.py.
+    """
+    semilla = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16)
+
+    if "Pregunta_vf:" in prompt:
+        vf = cantidad(r"Verdadero o Falso → deben ser (\d+)", prompt)
+        desarrollo = cantidad(r"Desarrollo → deben ser (\d+)", prompt)
+        alternativas = cantidad(r"Alternativas → deben ser (\d+)", prompt)
+
+        lineas = [
+            "Nombre: Evaluación simulada",
+            "Descripcion: Evaluación generada por el servidor local de pruebas.",
+            "Cubre los conceptos principales del material de la unidad.",
+        ]
+        for i in range(1, vf + 1):
+            lineas += [f"Pregunta_vf: Afirmación simulada número {i}.",
+                       f"Alternativa correcta: {'VF'[(semilla >> i) & 1]}"]
+        for i in range(1, desarrollo + 1):
+            lineas += [f"Pregunta_desarrollo: Explique el concepto simulado número {i}.",
+                       f"Respuesta: Respuesta esperada del concepto {i}."]
+        for i in range(1, alternativas + 1):
+            lineas += [f"Pregunta_alternativas: ¿Cuál opción describe el concepto {i}?",
+                       "a) Primera opción", "b) Segunda opción", "c) Tercera opción", "d) Cuarta opción",
+                       f"Alternativa correcta: {'abcd'[(semilla >> i) % 4]}"]
+        return "\n".join(lineas)
+
+    if "Puntaje:" in prompt:
+        return (f"Puntaje: {semilla % 101}\n"
+                "Retroalimentacion: La respuesta aborda la pregunta, pero podría profundizar más en los conceptos del material.")
+
+    return "Respuesta simulada."
+
+def respuesta_estructurada(prompt: str, esquema: dict):
+    """
+    JSON determinista que cumple el esquema de evaluación pedido en response_format.
+    """
+    semilla = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16)
+    cantidad_de = lambda tipo: esquema["properties"][tipo]["maxItems"]
+    return json.dumps({
+        "nombre": "Evaluación simulada",
+        "descripcion": "Evaluación generada por el servidor local de pruebas.\nCubre los conceptos principales del material de la unidad.",
+        "vf": [{"enunciado": f"Afirmación simulada número {i}.", "correcta": "VF"[(semilla >> i) & 1]}
+               for i in range(1, cantidad_de("vf") + 1)],
+        "desarrollo": [{"enunciado": f"Explique el concepto simulado número {i}.",
+                        "respuesta": f"Respuesta esperada del concepto {i}."}
+                       for i in range(1, cantidad_de("desarrollo") + 1)],
+        "alternativas": [{"enunciado": f"¿Cuál opción describe el concepto {i}?",
+                          "opciones": {"a": "Primera opción", "b": "Segunda opción",
+                                       "c": "Tercera opción", "d": "Cuarta opción"},
+                          "correcta": "abcd"[(semilla >> i) % 4]}
+                         for i in range(1, cantidad_de("alternativas") + 1)],
+    }, ensure_ascii=False)
+
+# -----------------------
+# Assistants
+# -----------------------
+@app.post("/v1/assistants")
+async def crear_assistant(request: Request):
+    datos = await request.json()
+    assistant = {
+        "id": nuevo_id("asst"),
+        "object": "assistant",
+        "created_at": ahora(),
+        "name": datos.get("name"),
+        "description": None,
+        "model": datos.get("model"),
+        "instructions": datos.get("instructions"),
+        "tools": datos.get("tools", []),
+        "tool_resources": datos.get("tool_resources", {}),
+        "metadata": datos.get("metadata", {})
+    }
+    assistants[assistant["id"]] = assistant
+    return assistant
+
+@app.get("/v1/assistants")
+def listar_assistants(limit: int = 20):
+    return lista(list(reversed(list(assistants.values())))[:limit])
+
+@app.post("/v1/assistants/{assistant_id}")
+async def actualizar_assistant(assistant_id: str, request: Request):
+    assistant = assistants.get(assistant_id) or no_encontrado("assistant", assistant_id)
+    assistant.update(await request.json())
+    return assistant
+
+@app.delete("/v1/assistants/{assistant_id}")
+def borrar_assistant(assistant_id: str):
+    assistants.pop(assistant_id, None) or no_encontrado("assistant", assistant_id)
+    return {"id": assistant_id, "object": "assistant.deleted", "deleted": True}
+
+# -----------------------
+# Files
+# -----------------------
+@app.post("/v1/files")
+async def subir_archivo(file: UploadFile = File(...), purpose: str = Form(...)):
+    tamano = 0
+    bloques = []
+    while True:
+        bloque = await file.read(1024 * 1024)
+        if not bloque:
+            break
+        tamano += len(bloque)
+        if purpose == "batch":
+            bloques.append(bloque)
+    archivo = {
+        "id": nuevo_id("file"),
+        "object": "file",
+        "bytes": tamano,
+        "created_at": ahora(),
+        "filename": file.filename,
+        "purpose": purpose,
+        "status": "processed"
+    }
+    archivos[archivo["id"]] = archivo
+    if purpose == "batch":
+        contenidos[archivo["id"]] = b"".join(bloques)
+    return archivo
+
+@app.get("/v1/files/{file_id}/content")
+def contenido_archivo(file_id: str):
+    if file_id not in contenidos:
+        no_encontrado("file", file_id)
+    return Response(content=contenidos[file_id], media_type="application/octet-stream")
+
+@app.delete("/v1/files/{file_id}")
+def borrar_archivo(file_id: str):
+    archivos.pop(file_id, None) or no_encontrado("file", file_id)
+    contenidos.pop(file_id, None)
+    return {"id": file_id, "object": "file", "deleted": True}
+
+# -----------------------
+# Vector stores
+# -----------------------
+@app.post("/v1/vector_stores")
+async def crear_vector_store(request: Request):
+    datos = await request.json()
+    vector = {
+        "id": nuevo_id("vs"),
+        "object": "vector_store",
+        "created_at": ahora(),
+        "name": datos.get("name"),
+        "usage_bytes": 0,
+        "file_counts": {"in_progress": 0, "completed": 0, "failed": 0, "cancelled": 0, "total": 0},
+        "status": "completed",
+        "metadata": datos.get("metadata", {}),
+        "archivos": {}
+    }
+    vector_stores[vector["id"]] = vector
+    return {k: v for k, v in vector.items() if k not in ("archivos", "lotes")}
+
+@app.delete("/v1/vector_stores/{vector_id}")
+def borrar_vector_store(vector_id: str):
+    vector_stores.pop(vector_id, None) or no_encontrado("vector_store", vector_id)
+    return {"id": vector_id, "object": "vector_store.deleted", "deleted": True}
+
+def archivo_de_vector(vector_id: str, file_id: str):
+    ingestas[(vector_id, file_id)] = time.time() + DURACION_INGESTA
+    return {
+        "id": file_id,
+        "object": "vector_store.file",
+        "created_at": ahora(),
+        "vector_store_id": vector_id,
+        "usage_bytes": archivos.get(file_id, {}).get("bytes", 0),
+        "status": "completed",
+        "last_error": None
+    }
+
+def con_estado(vector_id: str, archivo: dict):
+    listo = time.time() >= ingestas.get((vector_id, archivo["id"]), 0)
+    return dict(archivo, status="completed" if listo else "in_progress")
+
+@app.get("/v1/vector_stores/{vector_id}")
+def obtener_vector_store(vector_id: str):
+    vector = vector_stores.get(vector_id) or no_encontrado("vector_store", vector_id)
+    estados = [con_estado(vector_id, a)["status"] for a in vector["archivos"].values()]
+    conteo = {estado: estados.count(estado) for estado in ("in_progress", "completed", "failed", "cancelled")}
+    return {k: v for k, v in vector.items() if k not in ("archivos", "lotes")} | {
+        "file_counts": dict(conteo, total=len(estados)),
+        "status": "in_progress" if conteo["in_progress"] else "completed"
+    }
+
+@app.get("/v1/vector_stores/{vector_id}/files")
+def listar_archivos_de_vector(vector_id: str, limit: int = 20, after: str = None):
+    vector = vector_stores.get(vector_id) or no_encontrado("vector_store", vector_id)
+    todos = [con_estado(vector_id, a) for a in vector["archivos"].values()]
+    if after:
+        ids = [a["id"] for a in todos]
+        todos = todos[ids.index(after) + 1:] if after in ids else []
+    pagina = todos[:limit]
+    return dict(lista(pagina), has_more=len(todos) > limit)
+
+@app.post("/v1/vector_stores/{vector_id}/files")
+async def agregar_archivo_a_vector(vector_id: str, request: Request):
+    vector = vector_stores.get(vector_id) or no_encontrado("vector_store", vector_id)
+    file_id = (await request.json())["file_id"]
+    if file_id not in archivos:
+        no_encontrado("file", file_id)
+    vector["archivos"][file_id] = archivo_de_vector(vector_id, file_id)
+    return con_estado(vector_id, vector["archivos"][file_id])
+
+@app.get("/v1/vector_stores/{vector_id}/files/{file_id}")
+def obtener_archivo_de_vector(vector_id: str, file_id: str):
+    vector = vector_stores.get(vector_id) or no_encontrado("vector_store", vector_id)
+    return con_estado(vector_id, vector["archivos"].get(file_id) or no_encontrado("vector_store.file", file_id))
+
+@app.delete("/v1/vector_stores/{vector_id}/files/{file_id}")
+def quitar_archivo_de_vector(vector_id: str, file_id: str):
+    vector = vector_stores.get(vector_id) or no_encontrado("vector_store", vector_id)
+    vector["archivos"].pop(file_id, None) or no_encontrado("vector_store.file", file_id)
+    return {"id": file_id, "object": "vector_store.file.deleted", "deleted": True}
+
+def lote_de_vector(vector_id: str, lote_id: str, file_ids: list):
+    return {
+        "id": lote_id,
+        "object": "vector_store.files_batch",
+        "created_at": ahora(),
+        "vector_store_id": vector_id,
+        "status": "completed",
+        "file_counts": {"in_progress": 0, "completed": len(file_ids), "failed": 0, "cancelled": 0,
+                        "total": len(file_ids)},
+        "file_ids": file_ids
+    }
+
+@app.post("/v1/vector_stores/{vector_id}/file_batches")
+async def crear_lote_de_vector(vector_id: str, request: Request):
+    vector = vector_stores.get(vector_id) or no_encontrado("vector_store", vector_id)
+    file_ids = (await request.json())["file_ids"]
+    for file_id in file_ids:
+        if file_id not in archivos:
+            no_encontrado("file", file_id)
+        vector["archivos"][file_id] = archivo_de_vector(vector_id, file_id)
+    lote = lote_de_vector(vector_id, nuevo_id("vsfb"), file_ids)
+    vector.setdefault("lotes", {})[lote["id"]] = lote
+    return {k: v for k, v in lote.items() if k != "file_ids"}
+
+@app.get("/v1/vector_stores/{vector_id}/file_batches/{lote_id}")
+def obtener_lote_de_vector(vector_id: str, lote_id: str):
+    vector = vector_stores.get(vector_id) or no_encontrado("vector_store", vector_id)
+    lote = vector.get("lotes", {}).get(lote_id) or no_encontrado("vector_store.files_batch", lote_id)
+    return {k: v for k, v in lote.items() if k != "file_ids"}
+
+@app.get("/v1/vector_stores/{vector_id}/file_batches/{lote_id}/files")
+def archivos_de_lote(vector_id: str, lote_id: str, limit: int = 100):
+    vector = vector_stores.get(vector_id) or no_encontrado("vector_store", vector_id)
+    lote = vector.get("lotes", {}).get(lote_id) or no_encontrado("vector_store.files_batch", lote_id)
+    return lista([con_estado(vector_id, vector["archivos"][f]) for f in lote["file_ids"] if f in vector["archivos"]][:limit])
+
+# -----------------------
+# Threads y mensajes
+# -----------------------
+def crear_mensaje(thread_id: str, rol: str, texto: str, run_id: str = None, assistant_id: str = None,
+                  mensaje_id: str = None):
+    mensaje = {
+        "id": mensaje_id or nuevo_id("msg"),
+        "object": "thread.message",
+        "created_at": ahora(),
+        "thread_id": thread_id,
+        "role": rol,
+        "status": "completed",
+        "content": [{"type": "text", "text": {"value": texto, "annotations": []}}],
+        "assistant_id": assistant_id,
+        "run_id": run_id,
+        "attachments": [],
+        "metadata": {}
+    }
+    mensajes[thread_id].append(mensaje)
+    return mensaje
+
+def texto_de(contenido):
+    if isinstance(contenido, str):
+        return contenido
+    partes = []
+    for parte in contenido:
+        if not isinstance(parte, dict):
+            continue
+        texto = parte.get("text", "")
+        # Mensajes guardados: {"type": "text", "text": {"value": ...}}
+        partes.append(texto.get("value", "") if isinstance(texto, dict) else texto)
+    return "".join(partes)
+
+@app.post("/v1/threads")
+async def crear_thread(request: Request):
+    datos = await request.json()
+    thread = {"id": nuevo_id("thread"), "object": "thread", "created_at": ahora(),
+              "metadata": datos.get("metadata", {}), "tool_resources": datos.get("tool_resources", {})}
+    threads[thread["id"]] = thread
+    mensajes[thread["id"]] = []
+    for mensaje in datos.get("messages", []):
+        crear_mensaje(thread["id"], mensaje.get("role", "user"), texto_de(mensaje["content"]))
+    return thread
+
+@app.post("/v1/threads/{thread_id}/messages")
+async def agregar_mensaje(thread_id: str, request: Request):
+    if thread_id not in threads:
+        no_encontrado("thread", thread_id)
+    datos = await request.json()
+    return crear_mensaje(thread_id, datos.get("role", "user"), texto_de(datos["content"]))
+
+@app.get("/v1/threads/{thread_id}/messages")
+def listar_mensajes(thread_id: str, order: str = "desc", limit: int = 20):
+    if thread_id not in threads:
+        no_encontrado("thread", thread_id)
+    datos = list(mensajes[thread_id])
+    if order == "desc":
+        datos.reverse()
+    return lista(datos[:limit])
+
+# -----------------------
+# Runs
+# -----------------------
+def respuesta_de_run(run: dict):
+    """
+    Prompt y respuesta del run (se calcula una vez: el stream la entrega antes de completarse).
+    """
+    if "_texto" not in run:
+        prompt = next((texto_de(m["content"]) for m in reversed(mensajes[run["thread_id"]]) if m["role"] == "user"), "")
+        formato = run.get("response_format") or {}
+        if isinstance(formato, dict) and formato.get("type") == "json_schema":
+            texto = respuesta_estructurada(prompt, formato["json_schema"]["schema"])
+        else:
+            texto = respuesta_simulada(prompt)
+        run["_prompt"], run["_texto"] = prompt, texto
+    return run["_prompt"], run["_texto"]
+
+def avanzar_run(run: dict):
+    """
+    Calcula el estado del run según el tiempo transcurrido y, al completarse,
+    agrega la respuesta del assistant al thread.
+    """
+    if run["status"] not in ("queued", "in_progress"):
+        return run
+
+    transcurrido = time.monotonic() - run["_inicio"]
+    if transcurrido < COLA:
+        return run
+    if transcurrido < COLA + DURACION_RUN:
+        if run["status"] == "queued":
+            run["status"] = "in_progress"
+            run["started_at"] = ahora()
+        return run
+
+    prompt, texto = respuesta_de_run(run)
+    crear_mensaje(run["thread_id"], "assistant", texto, run_id=run["id"], assistant_id=run["assistant_id"],
+                  mensaje_id=run["_mensaje_id"])
+    run["status"] = "completed"
+    run["started_at"] = run["started_at"] or ahora()
+    run["completed_at"] = ahora()
+    run["usage"] = {
+        "prompt_tokens": len(prompt) // 4,
+        "completion_tokens": len(texto) // 4,
+        "total_tokens": (len(prompt) + len(texto)) // 4
+    }
+    return run
+
+def run_publico(run: dict):
+    return {k: v for k, v in run.items() if not k.startswith("_")}
+
+async def eventos_run(run: dict):
+    def evento(nombre, datos):
+        return f"event: {nombre}\ndata: {json.dumps(datos)}\n\n"
+
+    yield evento("thread.run.created", run_publico(run))
+    yield evento("thread.run.queued", run_publico(run))
+    await asyncio.sleep(max(0, run["_inicio"] + COLA - time.monotonic()))
+    avanzar_run(run)
+    if run["status"] == "in_progress":
+        yield evento("thread.run.in_progress", run_publico(run))
+        # La respuesta se entrega en PARTES_STREAM deltas repartidos durante la ejecución
+        _, texto = respuesta_de_run(run)
+        yield evento("thread.message.created", {
+            "id": run["_mensaje_id"], "object": "thread.message", "thread_id": run["thread_id"],
+            "role": "assistant", "status": "in_progress", "content": [], "run_id": run["id"],
+            "assistant_id": run["assistant_id"], "created_at": ahora(), "attachments": [], "metadata": {}
+        })
+        tamano = max(1, -(-len(texto) // PARTES_STREAM))
+        for i in range(0, len(texto), tamano):
+            yield evento("thread.message.delta", {
+                "id": run["_mensaje_id"], "object": "thread.message.delta",
+                "delta": {"content": [{"index": 0, "type": "text", "text": {"value": texto[i:i + tamano]}}]}
+            })
+            await asyncio.sleep(DURACION_RUN / PARTES_STREAM)
+    await asyncio.sleep(max(0, run["_inicio"] + COLA + DURACION_RUN - time.monotonic()))
+    avanzar_run(run)
+    if run["status"] == "completed":
+        mensaje = mensajes[run["thread_id"]][-1]
+        yield evento("thread.message.completed", mensaje)
+    yield evento(f"thread.run.{run['status']}", run_publico(run))
+    yield "event: done\ndata: [DONE]\n\n"
+
+@app.post("/v1/threads/{thread_id}/runs")
+async def crear_run(thread_id: str, request: Request):
+    if thread_id not in threads:
+        no_encontrado("thread", thread_id)
+    datos = await request.json()
+    # Como la API real: con json_schema todas las herramientas deben ser funciones
+    herramientas = datos["tools"] if "tools" in datos else assistants.get(datos["assistant_id"], {}).get("tools", [])
+    formato = datos.get("response_format")
+    if isinstance(formato, dict) and formato.get("type") == "json_schema" and any(
+            h.get("type") != "function" for h in herramientas):
+        return JSONResponse(status_code=400, content={"error": {
+            "message": "Invalid tools: all tools must be of type `function` when `response_format` is of type `json_schema`.",
+            "type": "invalid_request_error", "param": "response_format", "code": None
+        }})
+    run = {
+        "id": nuevo_id("run"),
+        "object": "thread.run",
+        "created_at": ahora(),
+        "thread_id": thread_id,
+        "assistant_id": datos["assistant_id"],
+        "status": "queued",
+        "model": assistants.get(datos["assistant_id"], {}).get("model"),
+        "instructions": datos.get("instructions"),
+        "tools": herramientas,
+        "started_at": None,
+        "completed_at": None,
+        "cancelled_at": None,
+        "failed_at": None,
+        "expires_at": None,
+        "last_error": None,
+        "required_action": None,
+        "incomplete_details": None,
+        "usage": None,
+        "metadata": datos.get("metadata", {}),
+        "response_format": datos.get("response_format", "auto"),
+        "_inicio": time.monotonic(),
+        "_mensaje_id": nuevo_id("msg")
+    }
+    runs[run["id"]] = run
+
+    if datos.get("stream"):
+        return StreamingResponse(eventos_run(run), media_type="text/event-stream")
+    return run_publico(run)
+
+@app.get("/v1/threads/{thread_id}/runs")
+def listar_runs(thread_id: str, limit: int = 20):
+    if thread_id not in threads:
+        no_encontrado("thread", thread_id)
+    encontrados = [avanzar_run(r) for r in runs.values() if r["thread_id"] == thread_id]
+    return lista([run_publico(r) for r in reversed(encontrados)][:limit])
+
+@app.get("/v1/threads/{thread_id}/runs/{run_id}")
+def obtener_run(thread_id: str, run_id: str):
+    run = runs.get(run_id) or no_encontrado("run", run_id)
+    return run_publico(avanzar_run(run))
+
+@app.post("/v1/threads/{thread_id}/runs/{run_id}/cancel")
+def cancelar_run(thread_id: str, run_id: str):
+    run = runs.get(run_id) or no_encontrado("run", run_id)
+    avanzar_run(run)
+    if run["status"] in ("queued", "in_progress", "requires_action"):
+        run["status"] = "cancelled"
+        run["cancelled_at"] = ahora()
+    return run_publico(run)
+
+# -----------------------
+# Chat completions y batches
+# -----------------------
+def completar_chat(cuerpo: dict):
+    prompt = next((texto_de(m["content"]) for m in reversed(cuerpo.get("messages", [])) if m["role"] == "user"), "")
+    texto = respuesta_simulada(prompt)
+    return {
+        "id": nuevo_id("chatcmpl"),
+        "object": "chat.completion",
+        "created": ahora(),
+        "model": cuerpo.get("model"),
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": texto}}],
+        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(texto) // 4,
+                  "total_tokens": (len(prompt) + len(texto)) // 4}
+    }
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    await asyncio.sleep(DURACION_RUN)
+    return completar_chat(await request.json())
+
+def avanzar_lote(lote: dict):
+    """
+    validating -> in_progress -> completed según el tiempo transcurrido;
+    al completarse procesa cada línea del JSONL de entrada.
+    """
+    if lote["status"] not in ("validating", "in_progress"):
+        return lote
+
+    transcurrido = time.monotonic() - lote["_inicio"]
+    if transcurrido < COLA:
+        return lote
+    if transcurrido < COLA + DURACION_LOTE:
+        lote["status"] = "in_progress"
+        lote["in_progress_at"] = lote["in_progress_at"] or ahora()
+        return lote
+
+    salida = []
+    for linea in contenidos.get(lote["input_file_id"], b"").decode("utf-8").splitlines():
+        if not linea.strip():
+            continue
+        solicitud = json.loads(linea)
+        salida.append(json.dumps({
+            "id": nuevo_id("batch_req"),
+            "custom_id": solicitud["custom_id"],
+            "response": {"status_code": 200, "request_id": nuevo_id("req"),
+                         "body": completar_chat(solicitud["body"])},
+            "error": None
+        }))
+
+    archivo = {"id": nuevo_id("file"), "object": "file", "bytes": 0, "created_at": ahora(),
+               "filename": "batch_output.jsonl", "purpose": "batch_output", "status": "processed"}
+    contenidos[archivo["id"]] = ("\n".join(salida) + "\n").encode("utf-8")
+    archivo["bytes"] = len(contenidos[archivo["id"]])
+    archivos[archivo["id"]] = archivo
+
+    lote["status"] = "completed"
+    lote["output_file_id"] = archivo["id"]
+    lote["completed_at"] = ahora()
+    lote["request_counts"] = {"total": len(salida), "completed": len(salida), "failed": 0}
+    return lote
+
+@app.post("/v1/batches")
+async def crear_lote(request: Request):
+    datos = await request.json()
+    if datos.get("input_file_id") not in contenidos:
+        no_encontrado("file", datos.get("input_file_id"))
+    lote = {
+        "id": nuevo_id("batch"),
+        "object": "batch",
+        "endpoint": datos["endpoint"],
+        "input_file_id": datos["input_file_id"],
+        "completion_window": datos.get("completion_window", "24h"),
+        "status": "validating",
+        "output_file_id": None,
+        "error_file_id": None,
+        "errors": None,
+        "created_at": ahora(),
+        "in_progress_at": None,
+        "completed_at": None,
+        "cancelled_at": None,
+        "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        "metadata": datos.get("metadata"),
+        "_inicio": time.monotonic()
+    }
+    lotes[lote["id"]] = lote
+    return run_publico(lote)
+
+@app.get("/v1/batches/{batch_id}")
+def obtener_lote(batch_id: str):
+    lote = lotes.get(batch_id) or no_encontrado("batch", batch_id)
+    return run_publico(avanzar_lote(lote))
+
+@app.post("/v1/batches/{batch_id}/cancel")
+def cancelar_lote(batch_id: str):
+    lote = lotes.get(batch_id) or no_encontrado("batch", batch_id)
+    avanzar_lote(lote)
+    if lote["status"] in ("validating", "in_progress"):
+        lote["status"] = "cancelled"
+        lote["cancelled_at"] = ahora()
+    return run_publico(lote)
@@ -0,0 +1,180 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from fastapi import UploadFile, HTTPException
+from models import ArchivoRemoto
+import asyncio
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from API.API import huella_archivo, subir_archivo_openai, vincular_archivo, borrar_archivo, subir_archivos_a_vector
+
+# -----------------------
+# Referencias a archivos compartidos
+# -----------------------
+def tomar_referencia(db: Session, huella: str):
+    """
+    Suma una referencia al archivo ya subido con ese contenido.
+    Devuelve su file_id o None si el contenido no se ha subido.
+    """
+    archivo = (
+        db.query(ArchivoRemoto)
+        .filter(ArchivoRemoto.huella == huella)
+        .with_for_update()
+        .first()
+    )
+    if not archivo:
+        return None
+    archivo.referencias += 1
+    db.commit()
+    return archivo.file_id
+
+def registrar_archivo(db: Session, huella: str, file_id: str):
+    """
+    Registra un archivo recién subido con una referencia. Si otra subida del
+    mismo contenido lo registró antes, suma la referencia a ese y devuelve su
+    file_id (el recién subido sobra y hay que borrarlo).
+    """
+    try:
+        with db.begin_nested():
+            db.add(ArchivoRemoto(huella=huella, file_id=file_id, referencias=1))
+        db.commit()
+        return file_id
+    except IntegrityError:
+        return tomar_referencia(db, huella)
+
+def soltar_referencia(db: Session, file_id: str, confirmar: bool = True):
+    """
+    Resta una referencia. Devuelve True si era la última (hay que borrar el
+    archivo en OpenAI). Los archivos sin registro, subidos antes de la
+    deduplicación, tienen una sola referencia.
+    Con confirmar=False el cambio queda en la transacción de quien llama.
+    """
+    archivo = (
+        db.query(ArchivoRemoto)
+        .filter(ArchivoRemoto.file_id == file_id)
+        .with_for_update()
+        .first()
+    )
+    if not archivo:
+        return True
+    archivo.referencias -= 1
+    ultima = archivo.referencias <= 0
+    if ultima:
+        db.delete(archivo)
+    if confirmar:
+        db.commit()
+    return ultima
+
+async def soltar_referencias(db: Session, file_ids: list, vector_id: str = None):
+    """
+    Devuelve en una transacción las referencias de una carga que no llegó a
+    guardarse, desvincula los archivos del vector (si se indica) y borra de
+    OpenAI los que quedaron sin referencias.
+    """
+    db.rollback()
+    ultimas = [soltar_referencia(db, file_id, confirmar=False) for file_id in file_ids]
+    db.commit()
+    for file_id, ultima in zip(file_ids, ultimas):
+        await borrar_archivo(file_id, vector_id, borrar_remoto=ultima)
+
+# -----------------------
+# Subida y borrado
+# -----------------------
+async def obtener_file_id(db: Session, archivo: UploadFile, huella: str = None):
+    """
+    file_id del contenido del archivo (con una referencia más): se reutiliza
+    si ya se subió antes, si no se sube. huella: SHA-256 ya calculado al copiar
+    el archivo (ver ingesta.revisar_archivo); sin ella se lee el archivo.
+    """
+    huella = huella or await huella_archivo(archivo)
+    file_id = tomar_referencia(db, huella)
+    if file_id:
+        return file_id
+
+    subido = await subir_archivo_openai(archivo)
+    try:
+        file_id = registrar_archivo(db, huella, subido)
+    except Exception:
+        # Sin registro nadie lo referencia: no dejarlo huérfano en OpenAI
+        db.rollback()
+        await borrar_archivo(subido)
+        raise
+    if file_id != subido:
+        await borrar_archivo(subido)
+    return file_id
+
+async def subir_a_vector(db: Session, vector_id: str, archivo: UploadFile, huella: str = None):
+    """
+    Agrega el archivo al vector reutilizando el file_id si el contenido ya estaba subido.
+    """
+    file_id = await obtener_file_id(db, archivo, huella)
+    try:
+        await vincular_archivo(vector_id, file_id)
+    except Exception:
+        await soltar_referencias(db, [file_id])
+        raise
+    return file_id
+
+async def quitar_archivo(db: Session, file_id: str, vector_id: str = None):
+    """
+    Desvincula el archivo del vector y lo borra de OpenAI solo si era su última referencia.
+    """
+    ultima = soltar_referencia(db, file_id)
+    return await borrar_archivo(file_id, vector_id, borrar_remoto=ultima)
+
+async def subir_lote_a_vector(db: Session, vector_id: str, archivos: list, huellas: list = None):
+    """
+    Como subir_archivos_a_vector, pero los contenidos que ya están en OpenAI
+    solo se vinculan y los repetidos dentro de la carga se omiten.
+    Devuelve el estado de cada archivo en el orden recibido.
+    """
+    huellas = huellas or await asyncio.gather(*(huella_archivo(a) for a in archivos))
+
+    resultados = [None] * len(archivos)
+    unicos = []  # posiciones de la primera aparición de cada contenido
+    for i, huella in enumerate(huellas):
+        if huella in huellas[:i]:
+            resultados[i] = {"nombre": archivos[i].filename, "file_id": None, "estado": "error",
+                             "error": "Archivo repetido en la carga", "reutilizado": False}
+        else:
+            unicos.append(i)
+
+    reutilizados = {}
+    for posicion, i in enumerate(unicos):
+        file_id = tomar_referencia(db, huellas[i])
+        if file_id:
+            reutilizados[posicion] = file_id
+
+    try:
+        subidos = await subir_archivos_a_vector(vector_id, [archivos[i] for i in unicos], reutilizados=reutilizados)
+    except Exception:
+        await soltar_referencias(db, list(reutilizados.values()), vector_id)
+        raise
+
+    for posicion, (i, r) in enumerate(zip(unicos, subidos)):
+        resultados[i] = r
+        if posicion in reutilizados:
+            if not r["file_id"]:
+                # No se pudo vincular: devolver la referencia tomada
+                await quitar_archivo(db, reutilizados[posicion])
+            continue
+        if not r["file_id"]:
+            continue
+
+        file_id = registrar_archivo(db, huellas[i], r["file_id"])
+        if file_id != r["file_id"]:
+            # Otra subida del mismo contenido se registró antes: usar esa
+            await borrar_archivo(r["file_id"], vector_id)
+            try:
+                await vincular_archivo(vector_id, file_id)
+                r.update(file_id=file_id, reutilizado=True)
+            except HTTPException as e:
+                await quitar_archivo(db, file_id)
+                r.update(file_id=None, estado="error", error=e.detail)
+
+    # Los que el vector no pudo procesar no quedan en el corpus
+    for r in resultados:
+        if r["file_id"] and r["estado"] == "failed":
+            await quitar_archivo(db, r["file_id"], vector_id)
+            r["file_id"] = None
+    return resultados
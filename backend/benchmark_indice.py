@@ -0,0 +1,89 @@
+"""
+Mide el índice local (indice_local.py): tiempo de construcción y latencia
+de búsqueda según el tamaño del corpus, con texto sintético.
+
+    cd backend
+    python benchmark_indice.py --fragmentos 100,1000,10000,50000
+
+Los fragmentos se agregan por archivos de 50 (como al subir corpus) y la
+latencia se mide con consultas del largo de una pregunta más su respuesta.
+"""
+from indice_local import IndiceUnidad
+import argparse
+import itertools
+import random
+import tempfile
+import time
+import os
+
+
+_acumulados = []
+
+
+def vocabulario_sintetico(cantidad: int, semilla: int = 1):
+    aleatorio = random.Random(semilla)
+    letras = "abcdefghijlmnoprstuv"
+    return ["".join(aleatorio.choice(letras) for _ in range(aleatorio.randint(4, 10))) for _ in range(cantidad)]
+
+
+def texto_sintetico(aleatorio, vocabulario, palabras: int):
+    # Distribución de Zipf aproximada: pocas palabras muy frecuentes, muchas raras
+    if len(_acumulados) != len(vocabulario):
+        _acumulados[:] = itertools.accumulate(1 / (i + 1) for i in range(len(vocabulario)))
+    return " ".join(aleatorio.choices(vocabulario, cum_weights=_acumulados, k=palabras))
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def medir(cantidad: int, vocabulario, consultas: int):
+    aleatorio = random.Random(cantidad)
+    textos = [texto_sintetico(aleatorio, vocabulario, 200) for _ in range(cantidad)]
+
+    indice = IndiceUnidad()
+    inicio = time.perf_counter()
+    for corpus_id, desde in enumerate(range(0, cantidad, 50)):
+        indice.agregar(corpus_id, textos[desde:desde + 50])
+    construccion = time.perf_counter() - inicio
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta = os.path.join(carpeta, "unidad")
+        inicio = time.perf_counter()
+        indice.guardar(ruta)
+        guardado = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        IndiceUnidad.cargar(ruta)
+        carga = time.perf_counter() - inicio
+
+    latencias = []
+    for _ in range(consultas):
+        consulta = texto_sintetico(aleatorio, vocabulario, 40)
+        inicio = time.perf_counter()
+        indice.buscar(consulta, k=6)
+        latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    indice.quitar(0)
+    quitar = time.perf_counter() - inicio
+
+    print(f"{cantidad:>8} {construccion * 1000:>11.1f} {guardado * 1000:>9.1f} {carga * 1000:>8.1f} "
+          f"{quitar * 1000:>9.1f} {percentil(latencias, 0.5) * 1000:>9.2f} {percentil(latencias, 0.99) * 1000:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fragmentos", default="100,1000,10000,50000")
+    parser.add_argument("--vocabulario", type=int, default=20000)
+    parser.add_argument("--consultas", type=int, default=200)
+    args = parser.parse_args()
+
+    vocabulario = vocabulario_sintetico(args.vocabulario)
+    print(f"{'frag.':>8} {'construir':>11} {'guardar':>9} {'cargar':>8} {'quitar':>9} {'p50':>9} {'p99':>9}   (ms)")
+    for cantidad in (int(c) for c in args.fragmentos.split(",")):
+        medir(cantidad, vocabulario, args.consultas)
+
+
+if __name__ == "__main__":
+    main()
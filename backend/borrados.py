@@ -0,0 +1,163 @@
+# borrados.py
+# Bandeja de salida de borrados: al eliminar un curso o unidad se registran
+# sus recursos de OpenAI en borrado_pendiente dentro de la misma transacción,
+# y un recolector en segundo plano los borra en paralelo, con reintentos.
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import BorradoPendiente, Unidad
+from archivos_remotos import soltar_referencia
+from datetime import datetime, timedelta
+import asyncio
+import random
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from API.API import borrar_recurso, es_assistant_compartido
+
+# Borrados simultáneos contra OpenAI
+BORRADOS_CONCURRENTES = int(os.getenv("BORRADOS_CONCURRENTES", "8"))
+# Filas que toma el recolector en cada vuelta
+LOTE_BORRADOS = int(os.getenv("LOTE_BORRADOS", "50"))
+# Espera entre vueltas cuando no hay nada por borrar (segundos)
+INTERVALO_BORRADOS = float(os.getenv("INTERVALO_BORRADOS", "30"))
+# Espera antes del primer reintento; se duplica en cada fallo hasta el máximo (segundos)
+ESPERA_BORRADO_BASE = float(os.getenv("ESPERA_BORRADO_BASE", "10"))
+ESPERA_BORRADO_MAXIMA = float(os.getenv("ESPERA_BORRADO_MAXIMA", "3600"))
+# Mientras un recolector borra una fila, los demás no la toman hasta este plazo (segundos)
+PLAZO_RECOLECCION = float(os.getenv("PLAZO_RECOLECCION", "300"))
+
+_despertar = None
+
+# -----------------------
+# Registro
+# -----------------------
+def registrar_borrado(db: Session, tipo: str, recurso_id: str):
+    """
+    Agrega el recurso a la bandeja sin confirmar: se confirma junto con el borrado en la base de datos.
+    """
+    db.add(BorradoPendiente(tipo=tipo, recurso_id=recurso_id))
+
+async def registrar_borrados_unidad(db: Session, unidad: Unidad):
+    """
+    Registra el assistant (salvo el compartido), el vector y los archivos de
+    corpus que ninguna otra unidad usa. Al borrar el vector store sus archivos
+    quedan desvinculados, así que no hace falta desvincularlos uno a uno.
+    """
+    if unidad.assistant_id and not await es_assistant_compartido(unidad.assistant_id):
+        registrar_borrado(db, "assistant", unidad.assistant_id)
+    if unidad.vector_id:
+        registrar_borrado(db, "vector", unidad.vector_id)
+    for corpus in unidad.corpus:
+        if corpus.material and soltar_referencia(db, corpus.material, confirmar=False):
+            registrar_borrado(db, "archivo", corpus.material)
+
+# -----------------------
+# Recolector
+# -----------------------
+def espera_reintento(intentos: int):
+    """
+    Backoff exponencial con jitter (entre la mitad y el total de la espera).
+    """
+    espera = min(ESPERA_BORRADO_BASE * 2 ** (intentos - 1), ESPERA_BORRADO_MAXIMA)
+    return timedelta(seconds=espera * random.uniform(0.5, 1))
+
+def tomar_borrados(db: Session):
+    """
+    Toma hasta LOTE_BORRADOS filas vencidas y corre su próximo intento
+    PLAZO_RECOLECCION, para que otro proceso no las tome mientras se borran.
+    """
+    ahora = datetime.utcnow()
+    filas = (
+        db.query(BorradoPendiente)
+        .filter(BorradoPendiente.proximo_intento <= ahora)
+        .order_by(BorradoPendiente.proximo_intento)
+        .limit(LOTE_BORRADOS)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for fila in filas:
+        fila.proximo_intento = ahora + timedelta(seconds=PLAZO_RECOLECCION)
+    db.commit()
+    return [(fila.id, fila.tipo, fila.recurso_id) for fila in filas]
+
+async def recolectar_borrados():
+    """
+    Una vuelta del recolector. Devuelve cuántos recursos se borraron y cuántos fallaron.
+    """
+    db = SessionLocal()
+    try:
+        tomados = tomar_borrados(db)
+        semaforo = asyncio.Semaphore(BORRADOS_CONCURRENTES)
+
+        async def borrar(tipo, recurso_id):
+            async with semaforo:
+                await borrar_recurso(tipo, recurso_id)
+
+        resultados = await asyncio.gather(*(borrar(tipo, recurso_id) for _, tipo, recurso_id in tomados),
+                                          return_exceptions=True)
+
+        borrados, fallidos = 0, 0
+        for (id_fila, tipo, recurso_id), resultado in zip(tomados, resultados):
+            fila = db.get(BorradoPendiente, id_fila)
+            if not fila:
+                continue
+            if isinstance(resultado, Exception):
+                fallidos += 1
+                fila.intentos += 1
+                fila.error = str(resultado)
+                fila.proximo_intento = datetime.utcnow() + espera_reintento(fila.intentos)
+                print(f"No se pudo borrar {tipo} {recurso_id} (intento {fila.intentos}): {resultado}")
+            else:
+                borrados += 1
+                db.delete(fila)
+        db.commit()
+        return borrados, fallidos
+    finally:
+        db.close()
+
+def programar_recoleccion():
+    """
+    Despierta al recolector sin esperar INTERVALO_BORRADOS (tras registrar borrados).
+    """
+    if _despertar is not None:
+        _despertar.set()
+
+async def mantener_borrados():
+    global _despertar
+    _despertar = asyncio.Event()
+    while True:
+        try:
+            borrados, fallidos = await recolectar_borrados()
+        except Exception as e:
+            print(f"Error en el recolector de borrados: {e}")
+            borrados = 0
+        if borrados:
+            # Puede haber más filas vencidas: seguir sin esperar
+            continue
+        try:
+            await asyncio.wait_for(_despertar.wait(), INTERVALO_BORRADOS)
+        except asyncio.TimeoutError:
+            pass
+        _despertar.clear()
+
+def borrados_pendientes(db: Session):
+    filas = db.query(BorradoPendiente).order_by(BorradoPendiente.creado).all()
+    por_tipo = {}
+    for fila in filas:
+        por_tipo[fila.tipo] = por_tipo.get(fila.tipo, 0) + 1
+    return {
+        "total": len(filas),
+        "por_tipo": por_tipo,
+        "pendientes": [
+            {
+                "id": fila.id,
+                "tipo": fila.tipo,
+                "recurso_id": fila.recurso_id,
+                "intentos": fila.intentos,
+                "proximo_intento": fila.proximo_intento.isoformat() if fila.proximo_intento else None,
+                "error": fila.error,
+                "creado": fila.creado.isoformat() if fila.creado else None,
+            }
+            for fila in filas
+        ],
+    }
@@ -0,0 +1,125 @@
+from collections import OrderedDict
+from database import SessionLocal
+from models import CorreccionCache
+from metricas import sumar_contador
+import datetime
+import os
+import threading
+
+# Entradas máximas (en memoria y en la base de datos)
+CACHE_CORRECCION_MAX = int(os.getenv("CACHE_CORRECCION_MAX", "5000"))
+# Vida de una corrección guardada (segundos)
+CACHE_CORRECCION_TTL = int(os.getenv("CACHE_CORRECCION_TTL", str(30 * 24 * 3600)))
+# Cada cuántas inserciones se poda la tabla
+PODA_CADA = 100
+
+class CacheCorreccion:
+    """
+    Caché LRU con TTL de correcciones de desarrollo.
+    Guarda en memoria las entradas recientes y en la tabla correccion_cache
+    todas las vigentes, para conservarlas entre reinicios.
+    Usa la base de datos de forma síncrona: desde código async se llama con
+    asyncio.to_thread (la memoria se protege con un lock).
+    """
+
+    def __init__(self, max_entradas: int = CACHE_CORRECCION_MAX, ttl: int = CACHE_CORRECCION_TTL):
+        self.max_entradas = max_entradas
+        self.ttl = datetime.timedelta(seconds=ttl)
+        self.memoria = OrderedDict()  # huella -> (puntaje, retroalimentacion, creado, segundos)
+        self.inserciones = 0
+        self._lock = threading.Lock()
+
+    def _vigente(self, creado):
+        return creado and datetime.datetime.utcnow() - creado < self.ttl
+
+    def obtener(self, huella: str):
+        """
+        Devuelve (puntaje, retroalimentacion) o None si no hay corrección vigente.
+        """
+        db = SessionLocal()
+        try:
+            with self._lock:
+                entrada = self.memoria.get(huella)
+                if entrada and not self._vigente(entrada[2]):
+                    del self.memoria[huella]
+                    entrada = None
+                if entrada:
+                    self.memoria.move_to_end(huella)
+
+            if entrada:
+                # También en la tabla: la poda borra primero las de ultimo_uso más antiguo
+                db.query(CorreccionCache).filter(CorreccionCache.huella == huella).update(
+                    {CorreccionCache.ultimo_uso: datetime.datetime.utcnow()}, synchronize_session=False
+                )
+                db.commit()
+            else:
+                fila = db.query(CorreccionCache).filter(CorreccionCache.huella == huella).first()
+                if fila and self._vigente(fila.creado):
+                    entrada = (fila.puntaje, fila.retroalimentacion, fila.creado, fila.segundos)
+                    self._recordar(huella, entrada)
+                    fila.ultimo_uso = datetime.datetime.utcnow()
+                    db.commit()
+
+            if not entrada:
+                sumar_contador(db, "cache_correccion.fallos")
+                return None
+
+            sumar_contador(db, "cache_correccion.aciertos")
+            sumar_contador(db, "cache_correccion.segundos_ahorrados", entrada[3] or 0)
+            return entrada[0], entrada[1]
+        finally:
+            db.close()
+
+    def guardar(self, huella: str, puntaje: int, retroalimentacion: str, segundos: float = None):
+        ahora = datetime.datetime.utcnow()
+        self._recordar(huella, (puntaje, retroalimentacion, ahora, segundos))
+
+        db = SessionLocal()
+        try:
+            db.merge(CorreccionCache(
+                huella=huella,
+                puntaje=puntaje,
+                retroalimentacion=retroalimentacion,
+                segundos=segundos,
+                creado=ahora,
+                ultimo_uso=ahora
+            ))
+            db.commit()
+
+            with self._lock:
+                self.inserciones += 1
+                podar = self.inserciones % PODA_CADA == 0
+            if podar:
+                self.podar(db)
+        finally:
+            db.close()
+
+    def _recordar(self, huella: str, entrada: tuple):
+        with self._lock:
+            self.memoria[huella] = entrada
+            self.memoria.move_to_end(huella)
+            while len(self.memoria) > self.max_entradas:
+                self.memoria.popitem(last=False)
+
+    def podar(self, db):
+        """
+        Borra las entradas vencidas y las menos usadas sobre el máximo.
+        """
+        limite = datetime.datetime.utcnow() - self.ttl
+        db.query(CorreccionCache).filter(CorreccionCache.creado < limite).delete(synchronize_session=False)
+
+        sobrantes = db.query(CorreccionCache).count() - self.max_entradas
+        if sobrantes > 0:
+            viejas = (
+                db.query(CorreccionCache.huella)
+                .order_by(CorreccionCache.ultimo_uso)
+                .limit(sobrantes)
+                .all()
+            )
+            db.query(CorreccionCache).filter(
+                CorreccionCache.huella.in_([h for (h,) in viejas])
+            ).delete(synchronize_session=False)
+        db.commit()
+
+
+cache_correccion = CacheCorreccion()
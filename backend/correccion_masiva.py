@@ -0,0 +1,167 @@
+# correccion_masiva.py
+# Vuelve a corregir las respuestas de desarrollo de muchos alumnos con la Batch API
+# (por ejemplo al cerrar el semestre o tras corregir una respuesta de referencia).
+# Uso (dentro de backend, igual que main.py):
+#   python correccion_masiva.py preparar --unidad 3 --salida lote.jsonl
+#   python correccion_masiva.py enviar lote.jsonl
+#   python correccion_masiva.py recoger <batch_id>
+# Con OPENAI_BASE_URL apuntando a fake_openai.py funciona sin red.
+from database import SessionLocal
+from models import Respuesta, Desarrollo, Evaluacion, IntentoEvaluacion
+from evaluaciones import registrar_intento, formatear_retroalimentacion
+from datetime import datetime
+import argparse
+import asyncio
+import json
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from API.API import solicitud_lote_correccion, enviar_lote, obtener_lote, resultados_lote, calcular_resultado, extraer_puntaje
+
+ESTADOS_FALLIDOS = ["failed", "expired", "cancelled"]
+
+def ultimas_respuestas(db, filtros: list):
+    """
+    Última respuesta de cada (usuario, evaluacion, tipo, pregunta), en orden de envío.
+    """
+    respuestas = {}
+    consulta = db.query(Respuesta).join(Evaluacion, Respuesta.id_evaluacion == Evaluacion.id)
+    for r in consulta.filter(*filtros).order_by(Respuesta.id).all():
+        respuestas[(r.id_usuario, r.id_evaluacion, r.tipo_pregunta, r.id_pregunta)] = r
+    return sorted(respuestas.values(), key=lambda r: r.id)
+
+def custom_id(r: Respuesta):
+    return f"{r.id_usuario}:{r.id_evaluacion}:{r.id_pregunta}"
+
+# -----------------------
+# Comandos
+# -----------------------
+def preparar(args):
+    filtros = [Respuesta.tipo_pregunta == "desarrollo"]
+    if args.evaluacion:
+        filtros.append(Evaluacion.id == args.evaluacion)
+    if args.unidad:
+        filtros.append(Evaluacion.id_unidad == args.unidad)
+
+    db = SessionLocal()
+    try:
+        respuestas = ultimas_respuestas(db, filtros)
+        preguntas = {d.id: d for d in db.query(Desarrollo).filter(
+            Desarrollo.id.in_({r.id_pregunta for r in respuestas})
+        ).all()}
+
+        with open(args.salida, "w", encoding="utf-8") as f:
+            for r in respuestas:
+                pregunta = preguntas.get(r.id_pregunta)
+                if not pregunta:
+                    continue
+                solicitud = solicitud_lote_correccion(
+                    custom_id(r), pregunta.enunciado, r.respuesta_texto or "", pregunta.respuesta
+                )
+                f.write(json.dumps(solicitud, ensure_ascii=False) + "\n")
+    finally:
+        db.close()
+
+    print(f"{len(respuestas)} respuestas de desarrollo escritas en {args.salida}")
+
+def enviar(args):
+    batch_id = asyncio.run(enviar_lote(args.archivo))
+    print(f"Batch enviado: {batch_id}")
+
+async def descargar(batch_id: str):
+    lote = await obtener_lote(batch_id)
+    if lote.status != "completed":
+        return lote, {}, {}
+    resultados, errores = await resultados_lote(lote)
+    return lote, resultados, errores
+
+def recoger(args):
+    lote, resultados, errores = asyncio.run(descargar(args.batch_id))
+    if lote.status in ESTADOS_FALLIDOS:
+        print(f"El batch terminó con estado '{lote.status}'")
+        sys.exit(1)
+    if lote.status != "completed":
+        print(f"El batch aún no termina (estado '{lote.status}')")
+        sys.exit(2)
+
+    for cid, error in errores.items():
+        print(f"Sin corrección para {cid}: {error}")
+    actualizados = guardar_resultados(resultados)
+    print(f"{actualizados} intentos actualizados")
+
+def guardar_resultados(resultados: dict):
+    """
+    Reemplaza la corrección del último intento de cada envío con las del batch
+    ({custom_id: retroalimentación}). Devuelve los intentos actualizados.
+    """
+    # Agrupar por envío (usuario, evaluación)
+    envios = {}
+    for cid in resultados:
+        id_usuario, id_evaluacion, _ = (int(x) for x in cid.split(":"))
+        envios.setdefault((id_usuario, id_evaluacion), set()).add(cid)
+
+    db = SessionLocal()
+    try:
+        actualizados = 0
+        for (id_usuario, id_evaluacion), corregidas in envios.items():
+            respuestas = ultimas_respuestas(db, [
+                Respuesta.id_usuario == id_usuario,
+                Respuesta.id_evaluacion == id_evaluacion
+            ])
+            desarrollos = [r for r in respuestas if r.tipo_pregunta == "desarrollo"]
+            if any(custom_id(r) not in corregidas for r in desarrollos):
+                print(f"Envío usuario {id_usuario} evaluación {id_evaluacion} incompleto, se omite")
+                continue
+
+            resultado = calcular_resultado(
+                [{
+                    "id": r.id_pregunta,
+                    "tipo": r.tipo_pregunta,
+                    "respuesta_usuario": r.respuesta_texto,
+                    "correcta": r.correcta
+                } for r in respuestas],
+                [(extraer_puntaje(resultados[custom_id(r)]), resultados[custom_id(r)]) for r in desarrollos]
+            )
+
+            evaluacion = db.query(Evaluacion).filter(Evaluacion.id == id_evaluacion).first()
+            intento = (
+                db.query(IntentoEvaluacion)
+                .filter(IntentoEvaluacion.id_usuario == id_usuario,
+                        IntentoEvaluacion.id_evaluacion == id_evaluacion)
+                .order_by(IntentoEvaluacion.id.desc())
+                .first()
+            )
+            if intento:
+                # Reemplazar la corrección del último intento
+                intento.puntaje_obtenido = resultado["cumplimiento"]
+                intento.retroalimentacion = formatear_retroalimentacion(resultado["retroalimentaciones"])
+                intento.fecha = datetime.utcnow()
+                db.commit()
+            else:
+                registrar_intento(db, evaluacion, id_usuario, resultado)
+            actualizados += 1
+    finally:
+        db.close()
+    return actualizados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Corrección masiva de desarrollo con la Batch API")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    p = comandos.add_parser("preparar", help="Escribe el JSONL con las respuestas de desarrollo")
+    p.add_argument("--unidad", type=int)
+    p.add_argument("--evaluacion", type=int)
+    p.add_argument("--salida", default="lote_correccion.jsonl")
+    p.set_defaults(funcion=preparar)
+
+    p = comandos.add_parser("enviar", help="Sube el JSONL y crea el batch")
+    p.add_argument("archivo")
+    p.set_defaults(funcion=enviar)
+
+    p = comandos.add_parser("recoger", help="Guarda los resultados del batch en los intentos")
+    p.add_argument("batch_id")
+    p.set_defaults(funcion=recoger)
+
+    args = parser.parse_args()
+    args.funcion(args)
@@ -1,4 +1,5 @@
 # database.py
+import os
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -9,11 +10,15 @@ DB_PASSWORD = "Crayones1"
 DB_HOST = "localhost"
 DB_NAME = "tesis"
 
-# URL de conexión
-DATABASE_URL = f"mysql+mysqlconnector://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+# URL de conexión (DATABASE_URL la reemplaza, p. ej. SQLite en las pruebas)
+DATABASE_URL = os.getenv("DATABASE_URL") or f"mysql+mysqlconnector://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
 
 # Crear engine
-engine = create_engine(DATABASE_URL, echo=True)  # echo=True muestra los queries en consola
+engine = create_engine(
+    DATABASE_URL,
+    echo=True,  # echo=True muestra los queries en consola
+    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+)
 
 # Crear sesión
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
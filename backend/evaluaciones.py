@@ -0,0 +1,424 @@
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import Unidad, Evaluacion, VF, Desarrollo, Alternativa, Corpus, IntentoEvaluacion, EstadoTrabajo
+from indice_local import contexto_generacion
+from ingesta import esperar_corpus_listo, PLAZO_INGESTA
+from trabajos import encolar_trabajo
+from datetime import datetime
+import asyncio
+import hashlib
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from API.API import generar_preguntas, interpretar_mensaje_separado, generar_evaluacion_estructurada, generar_preguntas_en_vivo
+
+CANTIDADES_POR_NIVEL = {
+    1: {"vf": 2, "desarrollo": 1, "alternativas": 2},  # Fácil
+    2: {"vf": 2, "desarrollo": 2, "alternativas": 2},  # Medio
+    3: {"vf": 1, "desarrollo": 3, "alternativas": 1}   # Difícil
+}
+
+DIFICULTADES = {1: "facil", 2: "medio", 3: "dificil"}
+
+# Cantidad de evaluaciones pre-generadas que se mantienen por (unidad, nivel)
+RESERVA_EVALUACIONES = int(os.getenv("RESERVA_EVALUACIONES", "2"))
+
+# "texto": formato con marcadores; "estructurado": JSON con esquema. El modo
+# estructurado no admite file_search en el run, así que solo se usa con
+# RECUPERACION=local (el material va en el prompt); si no, se genera en texto
+MODO_GENERACION = os.getenv("MODO_GENERACION", "texto")
+
+# Segundos que puede durar una generación en vivo (SSE) antes de cancelar su run
+PLAZO_GENERACION_EN_VIVO = float(os.getenv("PLAZO_GENERACION_EN_VIVO", "180"))
+
+# Canal SSE de un intento: cada cuántos segundos se revisa si terminó la
+# corrección, cada cuántos se envía un comentario para mantenerlo abierto, y
+# cuánto se espera como máximo (segundos)
+INTERVALO_INTENTO = float(os.getenv("INTERVALO_INTENTO", "1"))
+LATIDO_INTENTO = float(os.getenv("LATIDO_INTENTO", "15"))
+PLAZO_EVENTOS_INTENTO = float(os.getenv("PLAZO_EVENTOS_INTENTO", "600"))
+
+# -----------------------
+# Generación y guardado
+# -----------------------
+def pregunta_a_modelo(pregunta: dict, nivel: int, evaluacion_id: int):
+    """
+    Fila VF, Desarrollo o Alternativa de una pregunta interpretada.
+    """
+    if pregunta["tipo"] == "vf":
+        return VF(
+            enunciado=pregunta["enunciado"],
+            correcta=pregunta["correcta"],
+            puntaje=1,
+            nivel_bloom=nivel,
+            id_evaluacion=evaluacion_id
+        )
+    if pregunta["tipo"] == "desarrollo":
+        return Desarrollo(
+            enunciado=pregunta["enunciado"],
+            respuesta=pregunta["respuesta"],
+            puntaje=2,
+            nivel_bloom=nivel,
+            id_evaluacion=evaluacion_id
+        )
+    return Alternativa(
+        enunciado=pregunta["enunciado"],
+        respuesta_a=f"a) {pregunta['opciones'].get('a')}",
+        respuesta_b=f"b) {pregunta['opciones'].get('b')}",
+        respuesta_c=f"c) {pregunta['opciones'].get('c')}",
+        respuesta_d=f"d) {pregunta['opciones'].get('d')}",
+        correcta=pregunta["correcta"],
+        puntaje=1,
+        nivel_bloom=nivel,
+        id_evaluacion=evaluacion_id
+    )
+
+def modelo_a_pregunta(fila):
+    """
+    Inverso de pregunta_a_modelo (para entregar por SSE una evaluación ya guardada).
+    """
+    if isinstance(fila, VF):
+        return {"id": fila.id, "tipo": "vf", "enunciado": fila.enunciado, "correcta": fila.correcta}
+    if isinstance(fila, Desarrollo):
+        return {"id": fila.id, "tipo": "desarrollo", "enunciado": fila.enunciado, "respuesta": fila.respuesta}
+    opciones = {letra: (getattr(fila, f"respuesta_{letra}") or "")[len(f"{letra}) "):] for letra in "abcd"}
+    return {"id": fila.id, "tipo": "alternativas", "enunciado": fila.enunciado, "opciones": opciones,
+            "correcta": fila.correcta}
+
+def guardar_evaluacion(db: Session, unidad_id: int, nivel: int, resultado: dict, en_reserva: bool = False,
+                       version_corpus: int = 0):
+    """
+    Guarda una evaluación ya interpretada (nombre, descripcion, preguntas) con sus preguntas.
+    """
+    cantidades = CANTIDADES_POR_NIVEL[nivel]
+
+    evaluacion = Evaluacion(
+        nombre=resultado.get("nombre", f"Evaluacion Nivel {nivel}"),
+        descripcion=resultado.get("descripcion", ""),
+        preguntas_vf=cantidades["vf"],
+        preguntas_desarrollo=cantidades["desarrollo"],
+        preguntas_alternativas=cantidades["alternativas"],
+        nivel=nivel,
+        puntaje_total=0,
+        id_unidad=unidad_id,
+        en_reserva=en_reserva,
+        version_corpus=version_corpus
+    )
+    db.add(evaluacion)
+    db.commit()
+    db.refresh(evaluacion)
+
+    # Guardar preguntas en sus modelos
+    for pregunta in resultado.get("preguntas", []):
+        db.add(pregunta_a_modelo(pregunta, nivel, evaluacion.id))
+    db.commit()
+    return evaluacion
+
+def evaluacion_a_dict(evaluacion: Evaluacion):
+    return {
+        "id": evaluacion.id,
+        "nombre": evaluacion.nombre,
+        "descripcion": evaluacion.descripcion,
+        "nivel": evaluacion.nivel,
+        "preguntas_vf": evaluacion.preguntas_vf,
+        "preguntas_desarrollo": evaluacion.preguntas_desarrollo,
+        "preguntas_alternativas": evaluacion.preguntas_alternativas,
+        "id_unidad": evaluacion.id_unidad
+    }
+
+def formatear_retroalimentacion(retroalimentaciones: list):
+    return "\n".join(
+        [f"id pregunta: {retro['id_desarrollo']} - Retroalimentacion: {retro['retroalimentacion']}"
+         for retro in retroalimentaciones]
+    )
+
+def registrar_intento(db: Session, evaluacion: Evaluacion, id_usuario: int, resultado: dict):
+    """
+    Guarda el intento con el resultado de corregir_evaluacion.
+    """
+    intento = IntentoEvaluacion(
+        id_evaluacion=evaluacion.id,
+        id_usuario=id_usuario,
+        id_unidad=evaluacion.id_unidad,
+        puntaje_obtenido=resultado["cumplimiento"],
+        nivel_al_momento=evaluacion.nivel,
+        fecha=datetime.utcnow(),
+        retroalimentacion=formatear_retroalimentacion(resultado["retroalimentaciones"])
+    )
+    db.add(intento)
+    db.commit()
+    db.refresh(intento)
+    return intento
+
+def registrar_intento_parcial(db: Session, evaluacion: Evaluacion, id_usuario: int, parcial: dict):
+    """
+    Guarda el intento apenas se envían las respuestas, con el puntaje de
+    resultado_objetivo. Si hay preguntas de desarrollo queda pendiente hasta
+    que el worker las corrija (ver completar_intento).
+    """
+    intento = IntentoEvaluacion(
+        id_evaluacion=evaluacion.id,
+        id_usuario=id_usuario,
+        id_unidad=evaluacion.id_unidad,
+        puntaje_obtenido=parcial["cumplimiento"],
+        nivel_al_momento=evaluacion.nivel,
+        fecha=datetime.utcnow(),
+        estado_correccion=EstadoTrabajo.pendiente if parcial["desarrollos_pendientes"] else EstadoTrabajo.completado
+    )
+    db.add(intento)
+    db.commit()
+    db.refresh(intento)
+    return intento
+
+def completar_intento(db: Session, intento: IntentoEvaluacion, resultado: dict):
+    """
+    Reemplaza el puntaje parcial por el de corregir_evaluacion.
+    """
+    intento.puntaje_obtenido = resultado["cumplimiento"]
+    intento.retroalimentacion = formatear_retroalimentacion(resultado["retroalimentaciones"])
+    intento.estado_correccion = EstadoTrabajo.completado
+    db.commit()
+    db.refresh(intento)
+    return intento
+
+def fallar_intento(db: Session, intento_id: int):
+    """
+    La corrección del desarrollo se agotó sin éxito: el intento conserva el puntaje parcial.
+    """
+    intento = db.get(IntentoEvaluacion, intento_id)
+    if intento and intento.estado_correccion != EstadoTrabajo.completado:
+        intento.estado_correccion = EstadoTrabajo.fallido
+        db.commit()
+
+def intento_a_dict(intento: IntentoEvaluacion):
+    return {
+        "id": intento.id,
+        "id_evaluacion": intento.id_evaluacion,
+        "estado_correccion": intento.estado_correccion.value,
+        "puntaje": intento.puntaje_obtenido,
+        "retroalimentacion": intento.retroalimentacion,
+        "fecha": intento.fecha.isoformat() if intento.fecha else None,
+    }
+
+def leer_intento(intento_id: int):
+    """
+    intento_a_dict con una sesión propia (para el canal SSE, que vive más que el request).
+    """
+    db = SessionLocal()
+    try:
+        intento = db.get(IntentoEvaluacion, intento_id)
+        return intento_a_dict(intento) if intento else None
+    finally:
+        db.close()
+
+def version_contenido(db: Session, unidad: Unidad):
+    """
+    Identifica el material con que el assistant corrige: assistant, vector y archivos del corpus.
+    """
+    archivos = sorted(m for (m,) in db.query(Corpus.material).filter(Corpus.id_unidad == unidad.id).all())
+    partes = [unidad.assistant_id or "", unidad.vector_id or ""] + archivos
+    return hashlib.sha256("|".join(partes).encode("utf-8")).hexdigest()
+
+async def generar_resultado(assistant_id: str, nivel: int, vector_id: str = None, unidad_id: int = None):
+    """
+    Genera las preguntas con la IA y las devuelve interpretadas.
+    Con RECUPERACION=local el material de la unidad va en el prompt.
+    Antes espera (hasta PLAZO_INGESTA) a que el corpus termine de indexarse.
+    """
+    cantidades = CANTIDADES_POR_NIVEL[nivel]
+    if unidad_id and not await esperar_corpus_listo(unidad_id):
+        print(f"El corpus de la unidad {unidad_id} sigue indexándose tras {PLAZO_INGESTA:.0f} s; "
+              f"se genera con lo ya indexado")
+    contexto = await asyncio.to_thread(contexto_generacion, unidad_id) if unidad_id else None
+
+    if MODO_GENERACION == "estructurado" and contexto:
+        return await generar_evaluacion_estructurada(
+            assistant_id=assistant_id,
+            vf=cantidades["vf"],
+            desarrollo=cantidades["desarrollo"],
+            alternativas=cantidades["alternativas"],
+            dificultad=DIFICULTADES[nivel],
+            vector_id=vector_id,
+            contexto=contexto
+        )
+
+    mensaje_crudo, thread_id = await generar_preguntas(
+        assistant_id=assistant_id,
+        vf=cantidades["vf"],
+        desarrollo=cantidades["desarrollo"],
+        alternativas=cantidades["alternativas"],
+        dificultad=DIFICULTADES[nivel],
+        vector_id=vector_id,
+        contexto=contexto
+    )
+
+    # Separar nombre, descripción y preguntas
+    return interpretar_mensaje_separado(mensaje_crudo)
+
+async def generar_en_vivo(db: Session, unidad: Unidad, nivel: int, al_evento):
+    """
+    Genera una evaluación y la guarda a medida que llega: la Evaluacion se
+    crea al empezar, nombre y descripción se actualizan al recibirlos y cada
+    pregunta se guarda apenas está completa. Llama a al_evento(tipo, datos)
+    con "evaluacion", "nombre", "descripcion" y "pregunta".
+    Usa el formato de texto (el JSON no se puede interpretar por partes).
+    Si la generación falla o se interrumpe, la evaluación parcial se borra.
+    """
+    cantidades = CANTIDADES_POR_NIVEL[nivel]
+    if not await esperar_corpus_listo(unidad.id):
+        print(f"El corpus de la unidad {unidad.id} sigue indexándose tras {PLAZO_INGESTA:.0f} s; "
+              f"se genera con lo ya indexado")
+    contexto = await asyncio.to_thread(contexto_generacion, unidad.id)
+
+    evaluacion = Evaluacion(
+        nombre=f"Evaluacion Nivel {nivel}",
+        descripcion="",
+        preguntas_vf=cantidades["vf"],
+        preguntas_desarrollo=cantidades["desarrollo"],
+        preguntas_alternativas=cantidades["alternativas"],
+        nivel=nivel,
+        puntaje_total=0,
+        id_unidad=unidad.id,
+        en_reserva=False
+    )
+    db.add(evaluacion)
+    db.commit()
+    db.refresh(evaluacion)
+    await al_evento("evaluacion", evaluacion_a_dict(evaluacion))
+
+    async def recibir(tipo, valor):
+        if tipo == "nombre":
+            evaluacion.nombre = valor
+            db.commit()
+        elif tipo == "descripcion":
+            evaluacion.descripcion = valor
+            db.commit()
+        elif tipo == "pregunta":
+            fila = pregunta_a_modelo(valor, nivel, evaluacion.id)
+            db.add(fila)
+            db.commit()
+            valor = dict(valor, id=fila.id)
+        await al_evento(tipo, valor)
+
+    try:
+        await generar_preguntas_en_vivo(
+            assistant_id=unidad.assistant_id,
+            vf=cantidades["vf"],
+            desarrollo=cantidades["desarrollo"],
+            alternativas=cantidades["alternativas"],
+            dificultad=DIFICULTADES[nivel],
+            al_evento=recibir,
+            vector_id=unidad.vector_id,
+            contexto=contexto
+        )
+    except BaseException:
+        # También al cancelarse (el cliente cerró la conexión)
+        db.rollback()
+        db.delete(evaluacion)
+        db.commit()
+        raise
+    return evaluacion
+
+# -----------------------
+# Reserva de evaluaciones pre-generadas
+# -----------------------
+# La versión del corpus de cada unidad está en Unidad.version_corpus (compartida
+# entre procesos): solo se entregan evaluaciones generadas con la versión actual.
+# Los rellenos son trabajos de worker.py con clave única por (unidad, nivel), así
+# que aunque haya varios procesos web cada reserva tiene un solo relleno en curso
+
+def tomar_de_reserva(db: Session, unidad_id: int, nivel: int):
+    """
+    Entrega una evaluación de la reserva (si hay) marcándola como usada.
+    Solo sirven las generadas con la versión actual del corpus de la unidad.
+    """
+    evaluacion = (
+        db.query(Evaluacion)
+        .join(Unidad, Unidad.id == Evaluacion.id_unidad)
+        .filter(Evaluacion.id_unidad == unidad_id,
+                Evaluacion.nivel == nivel,
+                Evaluacion.en_reserva == True,
+                Evaluacion.version_corpus == Unidad.version_corpus)
+        .order_by(Evaluacion.id)
+        .with_for_update(skip_locked=True, of=Evaluacion)
+        .first()
+    )
+    if not evaluacion:
+        return None
+
+    evaluacion.en_reserva = False
+    db.commit()
+    db.refresh(evaluacion)
+    return evaluacion
+
+def invalidar_reserva(db: Session, unidad_id: int):
+    """
+    Borra las evaluaciones pre-generadas de la unidad (su corpus cambió) y sube
+    su versión del corpus, así las que se estén generando ya no se entregan.
+    """
+    db.query(Unidad).filter(Unidad.id == unidad_id).update(
+        {Unidad.version_corpus: Unidad.version_corpus + 1}, synchronize_session=False
+    )
+
+    evaluaciones = (
+        db.query(Evaluacion)
+        .filter(Evaluacion.id_unidad == unidad_id, Evaluacion.en_reserva == True)
+        .all()
+    )
+    for evaluacion in evaluaciones:
+        db.delete(evaluacion)
+    db.commit()
+
+async def rellenar_reserva(db: Session, unidad_id: int, nivel: int):
+    """
+    Genera evaluaciones hasta llegar a RESERVA_EVALUACIONES para (unidad, nivel).
+    Lo ejecuta worker.py (trabajo "rellenar_reserva"). Devuelve cuántas generó.
+    """
+    generadas = 0
+    while True:
+        db.expire_all()
+        unidad = db.query(Unidad).filter(Unidad.id == unidad_id).first()
+        if not unidad or not unidad.assistant_id:
+            return generadas
+        if not db.query(Corpus.id).filter(Corpus.id_unidad == unidad_id).first():
+            return generadas
+
+        version = unidad.version_corpus
+        reserva = db.query(Evaluacion).filter(Evaluacion.id_unidad == unidad_id,
+                                              Evaluacion.nivel == nivel,
+                                              Evaluacion.en_reserva == True)
+        # Las guardadas con una versión anterior del corpus ya no se entregan
+        for vieja in reserva.filter(Evaluacion.version_corpus != version).all():
+            db.delete(vieja)
+        db.commit()
+        if reserva.count() >= RESERVA_EVALUACIONES:
+            return generadas
+
+        resultado = await generar_resultado(unidad.assistant_id, nivel, unidad.vector_id, unidad.id)
+
+        db.expire_all()
+        if db.query(Unidad.version_corpus).filter(Unidad.id == unidad_id).scalar() != version:
+            # El corpus cambió durante la generación, volver a intentar
+            continue
+
+        guardar_evaluacion(db, unidad_id, nivel, resultado, en_reserva=True, version_corpus=version)
+        generadas += 1
+
+def programar_relleno(db: Session, unidad_id: int, niveles=None):
+    """
+    Encola el relleno de la reserva para los niveles indicados, salvo los que
+    ya tienen un relleno pendiente o en proceso.
+    """
+    if RESERVA_EVALUACIONES <= 0:
+        return
+    for nivel in niveles or CANTIDADES_POR_NIVEL:
+        encolar_trabajo(db, "rellenar_reserva", {"unidad_id": unidad_id, "nivel": nivel},
+                        clave=f"rellenar_reserva:{unidad_id}:{nivel}")
+
+def programar_relleno_general(db: Session):
+    """
+    Encola el relleno de todas las unidades que tienen corpus (al iniciar worker.py).
+    """
+    unidades = db.query(Corpus.id_unidad).distinct().all()
+    for (unidad_id,) in unidades:
+        programar_relleno(db, unidad_id)
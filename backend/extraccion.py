@@ -0,0 +1,76 @@
+# extraccion.py
+# Extracción de texto de los archivos del corpus y división en fragmentos.
+# Corre en los procesos de ingesta.py: no importa la base de datos ni la API.
+import os
+
+# Tamaño de los fragmentos y solape entre fragmentos seguidos (en palabras)
+PALABRAS_POR_FRAGMENTO = int(os.getenv("PALABRAS_POR_FRAGMENTO", "200"))
+SOLAPE_FRAGMENTO = int(os.getenv("SOLAPE_FRAGMENTO", "40"))
+# Estimación de tokens sin tokenizador (aprox. 4 caracteres por token en español)
+CARACTERES_POR_TOKEN = float(os.getenv("CARACTERES_POR_TOKEN", "4"))
+
+def _partes_texto(ruta: str, extension: str):
+    """
+    Texto del archivo de a partes (todo el archivo, cada página o cada párrafo).
+    None si el formato no se reconoce.
+    """
+    if extension in (".txt", ".md", ".csv"):
+        with open(ruta, "rb") as f:
+            return [f.read().decode("utf-8", errors="ignore")]
+    if extension == ".pdf":
+        from pypdf import PdfReader
+        return (pagina.extract_text() or "" for pagina in PdfReader(ruta).pages)
+    if extension == ".docx":
+        import docx
+        return (parrafo.text for parrafo in docx.Document(ruta).paragraphs)
+    return None
+
+def extraer_texto(ruta: str, nombre: str = None):
+    """
+    Texto de un archivo TXT/MD/CSV, PDF (con pypdf) o DOCX (con python-docx).
+    Devuelve "" si el formato no se reconoce o falta la librería.
+    """
+    extension = os.path.splitext(nombre or ruta)[1].lower()
+    try:
+        partes = _partes_texto(ruta, extension)
+        return "\n".join(partes) if partes is not None else ""
+    except ImportError as e:
+        print(f"No se puede extraer texto de {nombre}: falta {e.name}")
+    return ""
+
+def tiene_texto(ruta: str, nombre: str = None):
+    """
+    Revisión rápida antes de subir: se detiene en la primera página o párrafo con texto.
+    False si el archivo no tiene texto (p. ej. un PDF escaneado); None si no se
+    puede saber (formato no reconocido o falta la librería).
+    """
+    extension = os.path.splitext(nombre or ruta)[1].lower()
+    try:
+        partes = _partes_texto(ruta, extension)
+    except ImportError:
+        return None
+    if partes is None:
+        return None
+    return any(parte.strip() for parte in partes)
+
+def fragmentar(texto: str, palabras: int = None, solape: int = None):
+    """
+    Divide el texto en fragmentos de `palabras` palabras que se solapan en `solape`.
+    """
+    palabras = palabras or PALABRAS_POR_FRAGMENTO
+    solape = min(solape if solape is not None else SOLAPE_FRAGMENTO, palabras - 1)
+    tokens = texto.split()
+    if not tokens:
+        return []
+    paso = palabras - solape
+    return [" ".join(tokens[i:i + palabras]) for i in range(0, max(len(tokens) - solape, 1), paso)]
+
+def estimar_tokens(texto: str):
+    return max(1, round(len(texto) / CARACTERES_POR_TOKEN)) if texto else 0
+
+def procesar_archivo(ruta: str, nombre: str):
+    """
+    Extrae y fragmenta un archivo: [{"texto": str, "tokens": int}].
+    Una lista vacía indica un archivo sin texto (p. ej. un PDF escaneado).
+    """
+    return [{"texto": texto, "tokens": estimar_tokens(texto)} for texto in fragmentar(extraer_texto(ruta, nombre))]
@@ -0,0 +1,302 @@
+# indice_local.py
+# Índice léxico (BM25) del corpus de cada unidad, guardado en disco.
+# Con RECUPERACION=local los fragmentos más relevantes se entregan en el prompt
+# de generación y corrección en vez de usar la herramienta file_search.
+# Los fragmentos vienen de la tabla fragmento_corpus (ver ingesta.py).
+import numpy as np
+import contextlib
+import fcntl
+import json
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+
+# "file_search" (por defecto) o "local"
+RECUPERACION = os.getenv("RECUPERACION", "file_search")
+CARPETA_INDICES = os.getenv("CARPETA_INDICES", os.path.join(os.path.dirname(__file__), "indices"))
+# Fragmentos que se agregan al prompt
+FRAGMENTOS_EN_PROMPT = int(os.getenv("FRAGMENTOS_EN_PROMPT", "6"))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = set("""
+a al algo algun alguna algunas alguno algunos ante antes como con contra cual cuales cuando de del desde donde
+durante e el ella ellas ellos en entre era eran es esa esas ese eso esos esta estan estas este esto estos fue
+fueron ha han hasta hay la las le les lo los mas me mi muy no nos o otra otras otro otros para pero por porque
+que quien quienes se ser si sin sobre son su sus tambien tan te tiene tienen todo todos tu un una unas uno unos
+y ya
+""".split())
+
+# -----------------------
+# Texto
+# -----------------------
+SIN_TILDES = str.maketrans("áéíóúüñàèìòù", "aeiouunaeiou")
+
+def terminos(texto: str):
+    """
+    Palabras normalizadas (minúsculas, sin tildes) sin stopwords.
+    """
+    texto = texto.lower().translate(SIN_TILDES)
+    if not texto.isascii():
+        texto = unicodedata.normalize("NFKD", texto)
+        texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return [t for t in re.findall(r"[a-z0-9]+", texto) if len(t) > 1 and t not in STOPWORDS]
+
+# -----------------------
+# Índice
+# -----------------------
+class IndiceUnidad:
+    """
+    Matriz dispersa fragmentos x términos (CSR: indptr, indices, frecuencias)
+    con el texto de cada fragmento y el corpus al que pertenece.
+    """
+
+    def __init__(self):
+        self.vocabulario = {}
+        self.fragmentos = []  # {"corpus_id": int, "texto": str}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.frecuencias = np.zeros(0, dtype=np.float32)
+        self._preparar()
+
+    def _preparar(self):
+        """
+        Recalcula lo que se deriva de la matriz: fila de cada entrada, largo de
+        cada fragmento y en cuántos fragmentos aparece cada término.
+        """
+        n = len(self.fragmentos)
+        self._filas = np.repeat(np.arange(n, dtype=np.int32), np.diff(self.indptr))
+        self._largos = np.bincount(self._filas, weights=self.frecuencias, minlength=n)
+        self._df = np.bincount(self.indices, minlength=len(self.vocabulario))
+        self._largo_medio = self._largos.mean() if n else 0.0
+
+    def agregar(self, corpus_id: int, textos: list):
+        indices, frecuencias, largos = [], [], []
+        for texto in textos:
+            conteo = {}
+            for termino in terminos(texto):
+                i = self.vocabulario.setdefault(termino, len(self.vocabulario))
+                conteo[i] = conteo.get(i, 0) + 1
+            indices.extend(conteo)
+            frecuencias.extend(conteo.values())
+            largos.append(len(conteo))
+            self.fragmentos.append({"corpus_id": corpus_id, "texto": texto})
+
+        nuevos_indices = np.array(indices, dtype=np.int32)
+        nuevas_frecuencias = np.array(frecuencias, dtype=np.float32)
+        nuevas_filas = np.repeat(np.arange(len(self.fragmentos) - len(textos), len(self.fragmentos), dtype=np.int32),
+                                 largos)
+        self.indptr = np.concatenate([self.indptr, self.indptr[-1] + np.cumsum(largos, dtype=np.int64)])
+        self.indices = np.concatenate([self.indices, nuevos_indices])
+        self.frecuencias = np.concatenate([self.frecuencias, nuevas_frecuencias])
+
+        # Solo se suman los fragmentos nuevos en vez de recalcular todo con _preparar
+        self._filas = np.concatenate([self._filas, nuevas_filas])
+        nuevos_largos = np.bincount(nuevas_filas - (len(self.fragmentos) - len(textos)),
+                                    weights=nuevas_frecuencias, minlength=len(textos))
+        self._largos = np.concatenate([self._largos, nuevos_largos])
+        df = np.bincount(nuevos_indices, minlength=len(self.vocabulario))
+        df[:len(self._df)] += self._df
+        self._df = df
+        self._largo_medio = self._largos.mean() if len(self.fragmentos) else 0.0
+
+    def quitar(self, corpus_id: int):
+        conservar = np.array([f["corpus_id"] != corpus_id for f in self.fragmentos], dtype=bool)
+        if conservar.all():
+            return
+        entradas = conservar[self._filas]
+        self.indices = self.indices[entradas]
+        self.frecuencias = self.frecuencias[entradas]
+        self.indptr = np.concatenate([[0], np.cumsum(np.diff(self.indptr)[conservar])]).astype(np.int64)
+        self.fragmentos = [f for f, c in zip(self.fragmentos, conservar) if c]
+        self._preparar()
+
+    def buscar(self, consulta: str, k: int = None):
+        """
+        Los k fragmentos con mayor puntaje BM25 para la consulta: [(fragmento, puntaje)].
+        """
+        k = k or FRAGMENTOS_EN_PROMPT
+        consultados = np.array(sorted({self.vocabulario[t] for t in terminos(consulta) if t in self.vocabulario}),
+                               dtype=np.int32)
+        if not len(consultados) or not self.fragmentos:
+            return []
+
+        entradas = np.isin(self.indices, consultados)
+        terminos_e = self.indices[entradas]
+        filas = self._filas[entradas]
+        tf = self.frecuencias[entradas]
+
+        n = len(self.fragmentos)
+        df = self._df[terminos_e]
+        idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+        normalizacion = BM25_K1 * (1 - BM25_B + BM25_B * self._largos[filas] / self._largo_medio)
+        puntajes = np.bincount(filas, weights=idf * tf * (BM25_K1 + 1) / (tf + normalizacion), minlength=n)
+
+        mejores = np.argsort(-puntajes)[:k]
+        return [(self.fragmentos[i], float(puntajes[i])) for i in mejores if puntajes[i] > 0]
+
+    def terminos_frecuentes(self, cantidad: int = 30):
+        """
+        Términos que aparecen en más fragmentos (resumen del contenido de la unidad).
+        """
+        por_id = {i: t for t, i in self.vocabulario.items()}
+        return [por_id[i] for i in np.argsort(-self._df)[:cantidad] if self._df[i] > 0]
+
+    # ---------------- Persistencia ----------------
+    def guardar(self, ruta: str):
+        """
+        Escribe cada archivo en un temporal propio y lo reemplaza con os.replace:
+        quien lee nunca ve un archivo a medio escribir.
+        """
+        carpeta = os.path.dirname(ruta)
+        os.makedirs(carpeta, exist_ok=True)
+        temporales = []
+        try:
+            descriptor, temporal_npz = tempfile.mkstemp(dir=carpeta, suffix=".tmp.npz")
+            temporales.append(temporal_npz)
+            with os.fdopen(descriptor, "wb") as f:
+                np.savez(f, indptr=self.indptr, indices=self.indices, frecuencias=self.frecuencias)
+            descriptor, temporal_json = tempfile.mkstemp(dir=carpeta, suffix=".tmp.json")
+            temporales.append(temporal_json)
+            with os.fdopen(descriptor, "w", encoding="utf-8") as f:
+                json.dump({"vocabulario": list(self.vocabulario), "fragmentos": self.fragmentos}, f, ensure_ascii=False)
+            os.replace(temporal_npz, ruta + ".npz")
+            os.replace(temporal_json, ruta + ".json")
+        finally:
+            for temporal in temporales:
+                if os.path.exists(temporal):
+                    os.remove(temporal)
+
+    @classmethod
+    def cargar(cls, ruta: str):
+        indice = cls()
+        if not os.path.exists(ruta + ".json"):
+            return indice
+        with open(ruta + ".json", encoding="utf-8") as f:
+            datos = json.load(f)
+        matriz = np.load(ruta + ".npz")
+        indice.vocabulario = {t: i for i, t in enumerate(datos["vocabulario"])}
+        indice.fragmentos = datos["fragmentos"]
+        indice.indptr = matriz["indptr"]
+        indice.indices = matriz["indices"]
+        indice.frecuencias = matriz["frecuencias"]
+        indice._preparar()
+        return indice
+
+# -----------------------
+# Índices por unidad
+# -----------------------
+# unidad_id -> (fecha de modificación del archivo, índice) ya cargados en este proceso
+_cargados = {}
+_lock = threading.Lock()
+
+def ruta_indice(unidad_id: int):
+    return os.path.join(CARPETA_INDICES, f"unidad_{unidad_id}")
+
+@contextlib.contextmanager
+def _bloqueo(unidad_id: int, exclusivo: bool):
+    """
+    flock sobre unidad_N.lock, compartido entre los procesos (uvicorn y
+    worker.py): las modificaciones se hacen de a una y nadie lee el .npz y el
+    .json de versiones distintas.
+    """
+    os.makedirs(CARPETA_INDICES, exist_ok=True)
+    with open(ruta_indice(unidad_id) + ".lock", "a") as archivo:
+        fcntl.flock(archivo, fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(archivo, fcntl.LOCK_UN)
+
+def _modificacion(ruta: str):
+    return os.stat(ruta + ".json").st_mtime_ns if os.path.exists(ruta + ".json") else None
+
+def _cargar(unidad_id: int):
+    # Llamar con el bloqueo de la unidad tomado
+    ruta = ruta_indice(unidad_id)
+    modificado = _modificacion(ruta)
+    guardado = _cargados.get(unidad_id)
+    if guardado and guardado[0] == modificado:
+        return guardado[1]
+    indice = IndiceUnidad.cargar(ruta)
+    _cargados[unidad_id] = (modificado, indice)
+    return indice
+
+def obtener_indice(unidad_id: int):
+    """
+    Índice de la unidad, recargado solo si otro proceso lo modificó.
+    """
+    guardado = _cargados.get(unidad_id)
+    if guardado and guardado[0] == _modificacion(ruta_indice(unidad_id)):
+        return guardado[1]
+    with _bloqueo(unidad_id, exclusivo=False):
+        return _cargar(unidad_id)
+
+def _modificar(unidad_id: int, cambio):
+    with _lock, _bloqueo(unidad_id, exclusivo=True):
+        # Se relee bajo el bloqueo: otro proceso pudo modificarlo recién
+        indice = _cargar(unidad_id)
+        cambio(indice)
+        ruta = ruta_indice(unidad_id)
+        indice.guardar(ruta)
+        _cargados[unidad_id] = (_modificacion(ruta), indice)
+
+def indexar_fragmentos(unidad_id: int, corpus_id: int, textos: list):
+    """
+    Agrega al índice de la unidad los fragmentos ya extraídos de un corpus (ver ingesta.py).
+    Bloqueante: llamar con asyncio.to_thread.
+    """
+    if textos:
+        _modificar(unidad_id, lambda indice: indice.agregar(corpus_id, textos))
+
+def quitar_del_indice(unidad_id: int, corpus_id: int):
+    _modificar(unidad_id, lambda indice: indice.quitar(corpus_id))
+
+def borrar_indice(unidad_id: int):
+    with _lock, _bloqueo(unidad_id, exclusivo=True):
+        _cargados.pop(unidad_id, None)
+        for extension in (".npz", ".json"):
+            if os.path.exists(ruta_indice(unidad_id) + extension):
+                os.remove(ruta_indice(unidad_id) + extension)
+
+# -----------------------
+# Contexto para los prompts
+# -----------------------
+def formatear_contexto(resultados: list):
+    return "\n\n".join(f"[{i}] {fragmento['texto']}" for i, (fragmento, _) in enumerate(resultados, 1))
+
+def contexto_correccion(unidad_id: int, enunciado: str, respuesta_usuario: str):
+    """
+    Fragmentos del corpus relevantes para corregir una respuesta, o None si no se usa el índice local.
+    """
+    if RECUPERACION != "local":
+        return None
+    resultados = obtener_indice(unidad_id).buscar(f"{enunciado} {respuesta_usuario}")
+    return formatear_contexto(resultados) or None
+
+def contexto_generacion(unidad_id: int):
+    """
+    Fragmentos representativos del corpus para generar una evaluación (como
+    máximo FRAGMENTOS_EN_PROMPT, repartidos entre los archivos), o None.
+    """
+    if RECUPERACION != "local":
+        return None
+    indice = obtener_indice(unidad_id)
+    candidatos = indice.buscar(" ".join(indice.terminos_frecuentes()), k=FRAGMENTOS_EN_PROMPT * 4)
+
+    # Repartir entre archivos: primero el mejor de cada uno, luego el segundo, etc.
+    por_archivo = {}
+    for fragmento, puntaje in candidatos:
+        por_archivo.setdefault(fragmento["corpus_id"], []).append((fragmento, puntaje))
+    elegidos = []
+    while por_archivo and len(elegidos) < FRAGMENTOS_EN_PROMPT:
+        for corpus_id in list(por_archivo):
+            elegidos.append(por_archivo[corpus_id].pop(0))
+            if not por_archivo[corpus_id]:
+                del por_archivo[corpus_id]
+            if len(elegidos) >= FRAGMENTOS_EN_PROMPT:
+                break
+    return formatear_contexto(elegidos) or None
@@ -0,0 +1,270 @@
+# ingesta.py
+# Después de subir un corpus: extraer su texto en un pool de procesos (sin
+# bloquear el event loop), guardar los fragmentos en fragmento_corpus y
+# agregarlos al índice local de la unidad. Antes de subir solo se revisa que
+# el archivo tenga texto; la subida responde sin esperar la extracción.
+# También sigue el estado de indexación de cada corpus en su vector store.
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import Corpus, FragmentoCorpus, Unidad, EstadoIngesta, EstadoExtraccion
+from extraccion import procesar_archivo, tiene_texto
+from indice_local import indexar_fragmentos, quitar_del_indice
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from API.API import conteo_archivos_vector, estados_archivos_vector
+
+# Procesos para extraer texto (PDF/DOCX consumen CPU)
+PROCESOS_EXTRACCION = int(os.getenv("PROCESOS_EXTRACCION", str(min(4, os.cpu_count() or 1))))
+# Cada cuántos segundos se consulta el estado de los corpus que se están indexando
+INTERVALO_ESTADO_INGESTA = float(os.getenv("INTERVALO_ESTADO_INGESTA", "5"))
+# Vector stores consultados a la vez en cada vuelta
+CONSULTAS_ESTADO_CONCURRENTES = int(os.getenv("CONSULTAS_ESTADO_CONCURRENTES", "10"))
+# Segundos que una generación espera a que el corpus de la unidad termine de indexarse
+PLAZO_INGESTA = float(os.getenv("PLAZO_INGESTA", "180"))
+
+# Estado de un archivo en el vector store -> estado del corpus
+ESTADOS_VECTOR = {
+    "in_progress": EstadoIngesta.procesando,
+    "completed": EstadoIngesta.listo,
+    "failed": EstadoIngesta.fallido,
+    "cancelled": EstadoIngesta.fallido,
+}
+SIN_TERMINAR = (EstadoIngesta.pendiente, EstadoIngesta.procesando)
+
+_pool = None
+_tareas = set()
+
+def _en_segundo_plano(corrutina):
+    tarea = asyncio.create_task(corrutina)
+    _tareas.add(tarea)
+    tarea.add_done_callback(_tareas.discard)
+
+def obtener_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PROCESOS_EXTRACCION)
+    return _pool
+
+def cerrar_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def _copiar_a_disco(archivo):
+    """
+    Copia el archivo subido a un temporal propio (el UploadFile se cierra al
+    terminar la request, antes de que termine la extracción) y calcula su
+    SHA-256 en la misma lectura. Devuelve (ruta, huella).
+    """
+    extension = os.path.splitext(archivo.filename or "")[1]
+    descriptor, ruta = tempfile.mkstemp(suffix=extension, prefix="corpus_")
+    huella = hashlib.sha256()
+    archivo.file.seek(0)
+    with os.fdopen(descriptor, "wb") as destino:
+        for bloque in iter(lambda: archivo.file.read(1024 * 1024), b""):
+            huella.update(bloque)
+            destino.write(bloque)
+    archivo.file.seek(0)
+    return ruta, huella.hexdigest()
+
+def descartar_copias(rutas: list):
+    for ruta in rutas:
+        os.remove(ruta)
+
+async def revisar_archivo(archivo):
+    """
+    Copia el archivo a disco y revisa en el pool si tiene texto, antes de subirlo
+    a OpenAI. Devuelve (ruta, con_texto, huella); con_texto es None si no se
+    puede saber y huella es el SHA-256 del contenido (ver archivos_remotos.py).
+    """
+    ruta, huella = await asyncio.to_thread(_copiar_a_disco, archivo)
+    try:
+        loop = asyncio.get_running_loop()
+        con_texto = await loop.run_in_executor(obtener_pool(), tiene_texto, ruta, archivo.filename)
+    except Exception as e:
+        print(f"No se pudo revisar el texto de {archivo.filename}: {e}")
+        con_texto = None
+    return ruta, con_texto, huella
+
+def _guardar_fragmentos(corpus_id: int, fragmentos: list):
+    """
+    Guarda los fragmentos del corpus y su estado de extracción.
+    Devuelve False si el corpus se borró mientras se extraía.
+    """
+    db = SessionLocal()
+    try:
+        corpus = db.query(Corpus).filter(Corpus.id == corpus_id).first()
+        if not corpus:
+            return False
+        db.query(FragmentoCorpus).filter(FragmentoCorpus.id_corpus == corpus_id).delete()
+        db.add_all([
+            FragmentoCorpus(id_corpus=corpus_id, orden=i, texto=f["texto"], tokens=f["tokens"])
+            for i, f in enumerate(fragmentos)
+        ])
+        corpus.estado_extraccion = EstadoExtraccion.lista if fragmentos else EstadoExtraccion.sin_texto
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+def _marcar_error_extraccion(corpus_id: int):
+    db = SessionLocal()
+    try:
+        db.query(Corpus).filter(Corpus.id == corpus_id).update({Corpus.estado_extraccion: EstadoExtraccion.error})
+        db.commit()
+    finally:
+        db.close()
+
+def _sigue_existiendo(corpus_id: int):
+    db = SessionLocal()
+    try:
+        return db.query(Corpus.id).filter(Corpus.id == corpus_id).first() is not None
+    finally:
+        db.close()
+
+async def procesar_corpus(unidad_id: int, corpus_id: int, nombre: str, ruta: str):
+    try:
+        loop = asyncio.get_running_loop()
+        fragmentos = await loop.run_in_executor(obtener_pool(), procesar_archivo, ruta, nombre)
+        if not fragmentos:
+            print(f"{nombre}: no se extrajo texto (¿PDF escaneado o formato no soportado?)")
+
+        if not await asyncio.to_thread(_guardar_fragmentos, corpus_id, fragmentos):
+            return
+        await asyncio.to_thread(indexar_fragmentos, unidad_id, corpus_id, [f["texto"] for f in fragmentos])
+        # Si el corpus se borró mientras se indexaba, sacar lo recién agregado
+        if not await asyncio.to_thread(_sigue_existiendo, corpus_id):
+            await asyncio.to_thread(quitar_del_indice, unidad_id, corpus_id)
+    except Exception as e:
+        print(f"No se pudo extraer el texto de {nombre}: {e}")
+        try:
+            await asyncio.to_thread(_marcar_error_extraccion, corpus_id)
+        except Exception as e:
+            print(f"No se pudo guardar el error de extracción de {nombre}: {e}")
+    finally:
+        os.remove(ruta)
+
+def programar_extraccion(unidad_id: int, guardados: list):
+    """
+    Encola la extracción de cada (Corpus, nombre, ruta) ya guardado, con la
+    copia en disco de revisar_archivo (procesar_corpus la borra al terminar).
+    """
+    for corpus, nombre, ruta in guardados:
+        _en_segundo_plano(procesar_corpus(unidad_id, corpus.id, nombre, ruta))
+
+def resumen_fragmentos(corpus: Corpus):
+    return {
+        "fragmentos": len(corpus.fragmentos),
+        "tokens": sum(f.tokens for f in corpus.fragmentos),
+    }
+
+# -----------------------
+# Estado de indexación en el vector store
+# -----------------------
+async def _actualizar_vector(vector_id: str, corpus: list):
+    """
+    Actualiza los corpus sin terminar de un vector store. Primero se piden
+    los conteos (una llamada): si nada está en proceso ni falló, todos están
+    listos; si no, se listan los archivos del vector (de a 100 por página).
+    """
+    conteo = await conteo_archivos_vector(vector_id)
+    if not (conteo.in_progress or conteo.failed or conteo.cancelled):
+        estados = {c.material: ("completed", None) for c in corpus}
+    else:
+        estados = await estados_archivos_vector(vector_id)
+
+    for c in corpus:
+        if c.material not in estados:
+            c.estado = EstadoIngesta.fallido
+            c.error_ingesta = "El archivo no está en el vector store de la unidad"
+            continue
+        estado, error = estados[c.material]
+        c.estado = ESTADOS_VECTOR.get(estado, EstadoIngesta.procesando)
+        c.error_ingesta = error
+
+async def actualizar_estados_ingesta(db: Session, unidad_ids: list = None):
+    """
+    Una vuelta del sondeo: agrupa por vector store los corpus pendientes o en
+    proceso (de las unidades indicadas, o de todas) y consulta cada vector una vez.
+    """
+    consulta = (
+        db.query(Corpus)
+        .join(Unidad, Corpus.id_unidad == Unidad.id)
+        .filter(Corpus.estado.in_(SIN_TERMINAR), Unidad.vector_id.isnot(None))
+    )
+    if unidad_ids:
+        consulta = consulta.filter(Corpus.id_unidad.in_(unidad_ids))
+
+    por_vector = {}
+    for corpus in consulta.all():
+        por_vector.setdefault(corpus.unidad.vector_id, []).append(corpus)
+    if not por_vector:
+        return
+
+    semaforo = asyncio.Semaphore(CONSULTAS_ESTADO_CONCURRENTES)
+
+    async def actualizar(vector_id, corpus):
+        async with semaforo:
+            await _actualizar_vector(vector_id, corpus)
+
+    resultados = await asyncio.gather(*(actualizar(v, c) for v, c in por_vector.items()), return_exceptions=True)
+    for vector_id, resultado in zip(por_vector, resultados):
+        if isinstance(resultado, Exception):
+            print(f"No se pudo consultar el estado del vector {vector_id}: {resultado}")
+    db.commit()
+
+async def mantener_estados_ingesta():
+    while True:
+        db = SessionLocal()
+        try:
+            await actualizar_estados_ingesta(db)
+        except Exception as e:
+            print(f"Error al actualizar el estado de los corpus: {e}")
+        finally:
+            db.close()
+        await asyncio.sleep(INTERVALO_ESTADO_INGESTA)
+
+def estado_corpus_unidad(db: Session, unidad_id: int):
+    corpus = db.query(Corpus).filter(Corpus.id_unidad == unidad_id).order_by(Corpus.id).all()
+    conteo = {estado.value: 0 for estado in EstadoIngesta}
+    for c in corpus:
+        conteo[c.estado.value] += 1
+    return {
+        # Hay material indexado y nada sigue en proceso
+        "listo": conteo["listo"] > 0 and not any(conteo[e.value] for e in SIN_TERMINAR),
+        "conteo": conteo,
+        "archivos": [{"id": c.id, "nombre": c.nombre, "estado": c.estado.value, "error": c.error_ingesta}
+                     for c in corpus],
+    }
+
+async def esperar_corpus_listo(unidad_id: int, plazo: float = None):
+    """
+    Espera a que ningún corpus de la unidad siga pendiente o en proceso,
+    como máximo `plazo` segundos (PLAZO_INGESTA). Consulta OpenAI en cada
+    vuelta, así que no depende del sondeo de main.py (sirve en worker.py).
+    Devuelve True si terminó la indexación, False si venció el plazo.
+    """
+    limite = time.monotonic() + (plazo if plazo is not None else PLAZO_INGESTA)
+    while True:
+        db = SessionLocal()
+        try:
+            await actualizar_estados_ingesta(db, [unidad_id])
+            sin_terminar = (
+                db.query(Corpus.id)
+                .filter(Corpus.id_unidad == unidad_id, Corpus.estado.in_(SIN_TERMINAR))
+                .count()
+            )
+        finally:
+            db.close()
+        if not sin_terminar:
+            return True
+        if time.monotonic() >= limite:
+            return False
+        await asyncio.sleep(INTERVALO_ESTADO_INGESTA)
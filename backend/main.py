@@ -1,10 +1,12 @@
 from fastapi import FastAPI, Depends, HTTPException, Path, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.formparsers import MultiPartParser
 from sqlalchemy.orm import Session
-from database import engine, Base, get_db
+from database import engine, Base, get_db, SessionLocal
 from crud import crear_usuario, obtener_usuario_por_correo, login_usuario
 from typing import Optional
-from models import Curso, Unidad, Usuario, Evaluacion, Alternativa, VF, Desarrollo, IntentoEvaluacion, Corpus, Respuesta
+from models import Curso, Unidad, Usuario, Evaluacion, Alternativa, VF, Desarrollo, IntentoEvaluacion, Corpus, Respuesta, Trabajo, EstadoIngesta, EstadoTrabajo, EstadoExtraccion
 from typing import List
 from sqlalchemy import select, func
 from pydantic import EmailStr, BaseModel, EmailStr, Field
@@ -18,12 +20,28 @@ from re import findall
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from API.API import crear_assistant, crear_vector, subir_archivo, generar_preguntas, borrar_assistant, borrar_vector, subir_archivo_a_vector, borrar_archivo, generar_preguntas, interpretar_mensajes, interpretar_mensaje_separado, corregir_evaluacion
 
-from API.API import client, instrucciones, modelo
+from API.API import client, instrucciones, modelo, es_assistant_compartido, limite_memoria_subida, resultado_objetivo, estado_limitador
+from evaluaciones import CANTIDADES_POR_NIVEL, evaluacion_a_dict, tomar_de_reserva, invalidar_reserva, programar_relleno
+from evaluaciones import generar_en_vivo, modelo_a_pregunta, registrar_intento_parcial, intento_a_dict, leer_intento
+from evaluaciones import INTERVALO_INTENTO, LATIDO_INTENTO, PLAZO_EVENTOS_INTENTO, PLAZO_GENERACION_EN_VIVO
+from trabajos import encolar_trabajo, trabajo_a_dict, cancelar_trabajo
+from metricas import leer_contadores, metricas_llm, volcar_metricas_llm, volcar_metricas_periodicamente
+from reserva_asistentes import obtener_par, programar_relleno_asistentes, mantener_reserva_asistentes
+from archivos_remotos import subir_a_vector, subir_lote_a_vector, quitar_archivo, soltar_referencias
+from indice_local import quitar_del_indice, borrar_indice
+from ingesta import programar_extraccion, revisar_archivo, descartar_copias, resumen_fragmentos, cerrar_pool, mantener_estados_ingesta, estado_corpus_unidad, ESTADOS_VECTOR
+from borrados import registrar_borrados_unidad, programar_recoleccion, mantener_borrados, borrados_pendientes
+import asyncio
+import json
+import time
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 app = FastAPI()
 
+# Los archivos recibidos pasan a disco sobre este tamaño (en vez de quedar completos en memoria)
+MultiPartParser.spool_max_size = limite_memoria_subida
+
 # Configurar CORS
 origins = [
     "http://localhost:3000",  # React
@@ -42,6 +60,24 @@ app.add_middleware(
 # Crear tablas automáticamente si no existen
 Base.metadata.create_all(bind=engine)
 
+@app.on_event("startup")
+async def iniciar_tareas_de_fondo():
+    # Guardar periódicamente las métricas de las llamadas a OpenAI
+    app.state.tarea_metricas = asyncio.create_task(volcar_metricas_periodicamente())
+
+    # Mantener la reserva de pares assistant + vector para cursos y unidades nuevas
+    app.state.tarea_reserva_asistentes = asyncio.create_task(mantener_reserva_asistentes())
+
+    # Borrar en OpenAI los recursos de cursos y unidades eliminados
+    app.state.tarea_borrados = asyncio.create_task(mantener_borrados())
+
+    # Seguir la indexación de los corpus recién subidos en sus vector stores
+    app.state.tarea_estados_ingesta = asyncio.create_task(mantener_estados_ingesta())
+
+@app.on_event("shutdown")
+def cerrar_procesos_extraccion():
+    cerrar_pool()
+
 @app.get("/")
 def read_root():
     return {"message": "Hola mundo"}
@@ -105,19 +141,15 @@ async def crear_curso(curso: CursoCreate, db: Session = Depends(get_db)):
     if not curso.nombre:
         raise HTTPException(status_code=400, detail="El nombre del curso es obligatorio")
     
-    # 1) Crear Assistant
-    assistant_id = await crear_assistant(f"Asistente Unidad 1 de {curso.nombre}")
+    # 1) Assistant y Vector store (de la reserva si hay)
+    assistant_id, vector_id = await obtener_par(db, f"Asistente Unidad 1 de {curso.nombre}")
 
-    # 2) Crear Vector store
-    vector_id = await crear_vector(assistant_id)
-
-    # 3) Crear el curso en la DB
+    # 2) Crear el curso en la DB
     nuevo_curso = Curso(nombre=curso.nombre, id_usuario=curso.id_usuario)
     db.add(nuevo_curso)
-    db.commit()
-    db.refresh(nuevo_curso)
+    db.flush()
 
-    # 4) Crear Unidad inicial
+    # 3) Crear Unidad inicial (en la misma transacción que saca el par de la reserva)
     unidad_inicial = Unidad(
         nombre="Unidad 1",
         id_curso=nuevo_curso.id,
@@ -126,6 +158,8 @@ async def crear_curso(curso: CursoCreate, db: Session = Depends(get_db)):
     )
     db.add(unidad_inicial)
     db.commit()
+    programar_relleno_asistentes()
+    db.refresh(nuevo_curso)
     db.refresh(unidad_inicial)
 
     return {
@@ -157,47 +191,25 @@ async def borrar_curso(curso_id: int, db: Session = Depends(get_db)):
     curso = db.query(Curso).filter(Curso.id == curso_id).first()
     if not curso:
         raise HTTPException(status_code=404, detail="Curso no encontrado")
-    
-    errores_globales = {}
 
+    # Registrar assistants, vectores y archivos de cada unidad para borrarlos en segundo plano
+    unidades_ids = [unidad.id for unidad in curso.unidades]
     for unidad in curso.unidades:
-        # 1️⃣ Borrar assistants
-        if unidad.assistant_id:
-            try:
-                await borrar_assistant(unidad.assistant_id)
-            except HTTPException as e:
-                print(f"No se pudo borrar assistant {unidad.assistant_id}: {e.detail}")
-                errores_globales[f"assistant_{unidad.assistant_id}"] = e.detail
+        await registrar_borrados_unidad(db, unidad)
 
-        # 2️⃣ Borrar vector de la unidad
-        if unidad.vector_id:
-            try:
-                await borrar_vector(unidad.vector_id)
-            except HTTPException as e:
-                print(f"No se pudo borrar vector {unidad.vector_id}: {e.detail}")
-                errores_globales[f"vector_{unidad.vector_id}"] = e.detail
-
-        # 3️⃣ Borrar archivos de la unidad usando el vector de la unidad
-        for corpus in unidad.corpus:
-            if corpus.material:  # solo necesitamos el file_id
-                resultado = borrar_archivo(corpus.material, unidad.vector_id)
-                if resultado.get("errores"):
-                    errores_globales[f"archivo_{corpus.id}"] = resultado["errores"]
-
-    # 4️⃣ Borrar curso (las unidades se eliminan por cascada si la relación está configurada)
+    # Borrar curso (las unidades se eliminan por cascada) en la misma transacción
     try:
         db.delete(curso)
         db.commit()
     except Exception as e:
+        db.rollback()
         raise HTTPException(status_code=500, detail=f"No se pudo eliminar curso: {str(e)}")
 
-    if errores_globales:
-        return {
-            "detail": f"Curso '{curso.nombre}' eliminado, pero hubo errores en algunos assistants, vectores o archivos",
-            "errores": errores_globales
-        }
+    for unidad_id in unidades_ids:
+        borrar_indice(unidad_id)
+    programar_recoleccion()
 
-    return {"detail": f"Curso '{curso.nombre}' eliminado correctamente junto con unidades, assistants, vectores y archivos"}
+    return {"detail": f"Curso '{curso.nombre}' eliminado; sus assistants, vectores y archivos se borran en segundo plano"}
 
 
 
@@ -284,13 +296,10 @@ async def crear_unidad(unidad: UnidadCreate, db: Session = Depends(get_db)):
     if not curso:
         raise HTTPException(status_code=404, detail="Curso no encontrado")
     
-    # 1) Crear Assistant
-    assistant_id = await crear_assistant(f"Asistente de {unidad.nombre}")
-    
-    # 2) Crear Vector
-    vector_id = await crear_vector(assistant_id)
+    # 1) Assistant y Vector (de la reserva si hay)
+    assistant_id, vector_id = await obtener_par(db, f"Asistente de {unidad.nombre}")
 
-    # 3) Crear la unidad en la base de datos con los IDs generados
+    # 2) Crear la unidad en la base de datos con los IDs obtenidos
     nueva_unidad = Unidad(
         nombre=unidad.nombre,
         id_curso=unidad.id_curso,
@@ -299,6 +308,7 @@ async def crear_unidad(unidad: UnidadCreate, db: Session = Depends(get_db)):
     )
     db.add(nueva_unidad)
     db.commit()
+    programar_relleno_asistentes()
     db.refresh(nueva_unidad)
     
     return nueva_unidad
@@ -332,18 +342,16 @@ async def borrar_unidad(unidad_id: int, db: Session = Depends(get_db)):
     if not db_unidad:
         raise HTTPException(status_code=404, detail="Unidad no encontrada")
     
-    # 1) Borrar Assistant
-    if db_unidad.assistant_id:
-        await borrar_assistant(db_unidad.assistant_id)
-    
-    # 2) Borrar Vector
-    if db_unidad.vector_id:
-        await borrar_vector(db_unidad.vector_id)
-    
-    # 3) Borrar la unidad de la base de datos
+    # Registrar assistant, vector y archivos del corpus para borrarlos en segundo plano
+    await registrar_borrados_unidad(db, db_unidad)
+
+    # Borrar la unidad de la base de datos en la misma transacción
     db.delete(db_unidad)
     db.commit()
-    
+
+    borrar_indice(unidad_id)
+    programar_recoleccion()
+
     return {"detail": f"Unidad '{db_unidad.nombre}' eliminada"}
 
 @app.get("/perfil/{usuario_id}")
@@ -422,7 +430,10 @@ class EvaluacionOut(BaseModel):
 
 @app.get("/evaluaciones/unidad/{unidad_id}", response_model=List[EvaluacionOut])
 def obtener_evaluaciones_por_unidad(unidad_id: int, db: Session = Depends(get_db)):
-    evaluaciones = db.query(Evaluacion).filter(Evaluacion.id_unidad == unidad_id).all()
+    evaluaciones = db.query(Evaluacion).filter(
+        Evaluacion.id_unidad == unidad_id,
+        Evaluacion.en_reserva == False
+    ).all()
     
     if not evaluaciones:
         raise HTTPException(status_code=404, detail="No se encontraron evaluaciones para esta unidad")
@@ -435,6 +446,7 @@ class IntentoEvaluacionOut(BaseModel):
     puntaje_obtenido: int
     fecha: Optional[datetime] = None  # ✅ ahora permite null
     retroalimentacion: Optional[str]
+    estado_correccion: Optional[EstadoTrabajo] = None
 
     class Config:
         orm_mode = True
@@ -532,6 +544,8 @@ class CorpusOut(BaseModel):
     nombre: str
     material: str  # aquí va el file_id
     id_unidad: int
+    estado: EstadoIngesta
+    estado_extraccion: EstadoExtraccion
     class Config:
         orm_mode = True
 
@@ -617,36 +631,158 @@ async def crear_corpus(unidad_id: int, archivo: UploadFile = File(...), db: Sess
     if not unidad.vector_id:
         raise HTTPException(status_code=400, detail="La unidad no tiene vector asociado")
 
-    # Subir archivo y asociarlo
-    file_id = await subir_archivo_a_vector(unidad.vector_id, archivo)
+    # Un archivo sin texto (p. ej. un PDF escaneado) no se sube: no se paga su ingesta
+    ruta, con_texto, huella = await revisar_archivo(archivo)
+    if con_texto is False:
+        descartar_copias([ruta])
+        raise HTTPException(status_code=422, detail=f"'{archivo.filename}' no tiene texto extraíble (¿PDF escaneado?)")
 
-    # Guardar en la base de datos
-    save_file_to_db(db, unidad_id=unidad_id, file_name=archivo.filename, file_id=file_id)
+    file_id = None
+    try:
+        # Subir archivo (o reutilizar uno con el mismo contenido) y asociarlo
+        file_id = await subir_a_vector(db, unidad.vector_id, archivo, huella)
+
+        # Guardar en la base de datos
+        corpus = save_file_to_db(db, unidad_id=unidad_id, file_name=archivo.filename, file_id=file_id)
+    except Exception:
+        descartar_copias([ruta])
+        if file_id:
+            # El Corpus no se guardó: nadie usa la referencia tomada
+            await soltar_referencias(db, [file_id], unidad.vector_id)
+        raise
+
+    # Extraer su texto y fragmentarlo en segundo plano (sin esperar)
+    programar_extraccion(unidad_id, [(corpus, archivo.filename, ruta)])
+
+    # El corpus cambió: descartar evaluaciones pre-generadas y volver a generarlas
+    invalidar_reserva(db, unidad_id)
+    programar_relleno(db, unidad_id)
 
     return {"message": "Archivo subido correctamente", "file_id": file_id}
 
-@app.delete("/corpus/{corpus_id}")
-def eliminar_corpus(
+@app.post("/corpus/unidad/{unidad_id}/lote")
+async def crear_corpus_lote(unidad_id: int, archivos: List[UploadFile] = File(...), db: Session = Depends(get_db)):
+    """
+    Recibe varios archivos, los sube a OpenAI en paralelo (reutilizando los que ya
+    estaban subidos), los vincula al vector store de la unidad en un solo file batch
+    y guarda todos los Corpus en una transacción. Los archivos sin texto no se suben.
+    Devuelve el estado de cada archivo.
+    """
+    unidad = db.query(Unidad).filter(Unidad.id == unidad_id).first()
+    if not unidad:
+        raise HTTPException(status_code=404, detail="Unidad no encontrada")
+
+    if not unidad.vector_id:
+        raise HTTPException(status_code=400, detail="La unidad no tiene vector asociado")
+
+    # Los archivos sin texto (p. ej. PDF escaneados) no se suben: no se paga su ingesta
+    revisados = await asyncio.gather(*(revisar_archivo(a) for a in archivos))
+    rutas = [ruta for ruta, _, _ in revisados]
+    resultados = []
+    try:
+        a_subir = [(a, huella) for a, (_, con_texto, huella) in zip(archivos, revisados) if con_texto is not False]
+        subidos = iter(await subir_lote_a_vector(db, unidad.vector_id, [a for a, _ in a_subir],
+                                                 [huella for _, huella in a_subir]) if a_subir else [])
+        resultados = [
+            next(subidos) if con_texto is not False else
+            {"nombre": a.filename, "file_id": None, "estado": "error",
+             "error": "No tiene texto extraíble (¿PDF escaneado?)", "reutilizado": False}
+            for a, (_, con_texto, _) in zip(archivos, revisados)
+        ]
+
+        # El file batch ya informa si cada archivo terminó de indexarse
+        guardados = [(Corpus(nombre=r["nombre"], material=r["file_id"], id_unidad=unidad_id,
+                             estado=ESTADOS_VECTOR.get(r["estado"], EstadoIngesta.pendiente)), r["nombre"], ruta)
+                     for r, ruta in zip(resultados, rutas) if r["file_id"]]
+        db.add_all([corpus for corpus, _, _ in guardados])
+        db.commit()
+    except Exception:
+        descartar_copias(rutas)
+        # Los Corpus no se guardaron: devolver las referencias tomadas
+        await soltar_referencias(db, [r["file_id"] for r in resultados if r["file_id"]], unidad.vector_id)
+        raise
+    descartar_copias([ruta for r, ruta in zip(resultados, rutas) if not r["file_id"]])
+
+    # Extraer su texto y fragmentarlo en segundo plano (sin esperar)
+    programar_extraccion(unidad_id, guardados)
+
+    if guardados:
+        # El corpus cambió: descartar evaluaciones pre-generadas y volver a generarlas
+        invalidar_reserva(db, unidad_id)
+        programar_relleno(db, unidad_id)
+
+    return {
+        "message": f"{len(guardados)} de {len(resultados)} archivos subidos correctamente",
+        "archivos": resultados
+    }
+
+@app.get("/corpus/unidad/{unidad_id}/estado")
+def obtener_estado_corpus(unidad_id: int, db: Session = Depends(get_db)):
+    """
+    Estado de indexación de cada corpus de la unidad (pendiente, procesando, listo, fallido).
+    listo=True cuando hay material indexado y nada sigue en proceso: recién ahí conviene generar.
+    """
+    unidad = db.query(Unidad).filter(Unidad.id == unidad_id).first()
+    if not unidad:
+        raise HTTPException(status_code=404, detail="Unidad no encontrada")
+
+    return estado_corpus_unidad(db, unidad_id)
+
+@app.get("/corpus/{corpus_id}/fragmentos")
+def obtener_fragmentos_corpus(
     corpus_id: int,
-    file_id: str = Query(..., description="ID del archivo en la API"),
-    vector_id: str = Query(..., description="ID del vector store"),
+    limite: int = Query(20, ge=0, description="Cantidad de fragmentos a devolver"),
     db: Session = Depends(get_db)
 ):
+    """
+    Texto extraído del corpus: estado de la extracción (pendiente, lista, sin_texto, error),
+    total de fragmentos y tokens estimados, y los primeros fragmentos.
+    """
+    corpus = db.query(Corpus).filter(Corpus.id == corpus_id).first()
+    if not corpus:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado en la base de datos")
+
+    return {
+        "id": corpus.id,
+        "nombre": corpus.nombre,
+        "estado_extraccion": corpus.estado_extraccion.value,
+        **resumen_fragmentos(corpus),
+        "vista_previa": [{"orden": f.orden, "texto": f.texto, "tokens": f.tokens} for f in corpus.fragmentos[:limite]]
+    }
+
+@app.delete("/corpus/{corpus_id}")
+async def eliminar_corpus(corpus_id: int, db: Session = Depends(get_db)):
     corpus = db.query(Corpus).filter(Corpus.id == corpus_id).first()
     if not corpus:
         raise HTTPException(status_code=404, detail="Archivo no encontrado en la base de datos")
 
-    # Borrar API y vector
-    resultado = borrar_archivo(file_id=file_id, vector_id=vector_id)
+    # El archivo y el vector salen de la base de datos, no de la request
+    file_id = corpus.material
+    unidad_id = corpus.id_unidad
+    # Si otro corpus de la unidad tiene el mismo archivo, debe seguir en el vector
+    compartido = (
+        db.query(Corpus.id)
+        .filter(Corpus.id_unidad == unidad_id, Corpus.material == file_id, Corpus.id != corpus.id)
+        .first()
+    )
+    vector_id = None if compartido else corpus.unidad.vector_id
+
+    # Desvincular del vector y borrar de la API si ninguna otra unidad lo usa
+    resultado = await quitar_archivo(db, file_id, vector_id)
     errores = resultado.get('errores', {})
 
     # Borrar DB
+    await asyncio.to_thread(quitar_del_indice, unidad_id, corpus.id)
     try:
         db.delete(corpus)
         db.commit()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"No se pudo eliminar de la base de datos: {e}")
 
+    # El corpus cambió: descartar evaluaciones pre-generadas y volver a generarlas
+    invalidar_reserva(db, unidad_id)
+    programar_relleno(db, unidad_id)
+
     if errores:
         return {
             "detail": f"Archivo '{corpus.nombre}' eliminado de la base de datos, pero hubo errores al borrar API/vector.",
@@ -655,12 +791,6 @@ def eliminar_corpus(
 
     return {"detail": f"Archivo '{corpus.nombre}' eliminado correctamente de API, vector y base de datos"}
 
-CANTIDADES_POR_NIVEL = {
-    1: {"vf": 2, "desarrollo": 1, "alternativas": 2},  # Fácil
-    2: {"vf": 2, "desarrollo": 2, "alternativas": 2},  # Medio
-    3: {"vf": 1, "desarrollo": 3, "alternativas": 1}   # Difícil
-}
-
 @app.post("/evaluacion/unidad/{unidad_id}")
 async def crear_evaluacion(unidad_id: int, nivel: int, db: Session = Depends(get_db)):
     # Validar unidad
@@ -671,86 +801,93 @@ async def crear_evaluacion(unidad_id: int, nivel: int, db: Session = Depends(get
     if nivel not in [1, 2, 3]:
         raise HTTPException(status_code=400, detail="Nivel inválido")
 
-    cantidades = CANTIDADES_POR_NIVEL[nivel]
+    # Tomar una evaluación ya generada de la reserva
+    evaluacion = tomar_de_reserva(db, unidad.id, nivel)
 
-    # Generar preguntas con la IA
-    resultado_thread = await generar_preguntas(
-        assistant_id=unidad.assistant_id,
-        vf=cantidades["vf"],
-        desarrollo=cantidades["desarrollo"],
-        alternativas=cantidades["alternativas"],
-        dificultad={1: "facil", 2: "medio", 3: "dificil"}[nivel]
-    )
+    # Volver a llenar la reserva en segundo plano
+    programar_relleno(db, unidad.id, [nivel])
 
-    resultado_str, thread_id = resultado_thread
-
-    # Traer todos los mensajes de la conversación (sin await)
-    messages = client.beta.threads.messages.list(thread_id=thread_id)
-    mensaje_crudo = interpretar_mensajes(messages)
-
-    # Separar nombre, descripción y preguntas
-    resultado = interpretar_mensaje_separado(mensaje_crudo)
-
-    # Crear evaluación
-    evaluacion = Evaluacion(
-        nombre=resultado.get("nombre", f"Evaluacion Nivel {nivel}"),
-        descripcion=resultado.get("descripcion", ""),
-        preguntas_vf=cantidades["vf"],
-        preguntas_desarrollo=cantidades["desarrollo"],
-        preguntas_alternativas=cantidades["alternativas"],
-        nivel=nivel,
-        puntaje_total=0,
-        id_unidad=unidad.id
-    )
-    db.add(evaluacion)
-    db.commit()
-    db.refresh(evaluacion)
-
-    # Guardar preguntas en sus modelos
-    for pregunta in resultado.get("preguntas", []):
-        if pregunta["tipo"] == "vf":
-            db.add(VF(
-                enunciado=pregunta["enunciado"],
-                correcta=pregunta["correcta"],
-                puntaje=1,
-                nivel_bloom=nivel,
-                id_evaluacion=evaluacion.id
-            ))
-        elif pregunta["tipo"] == "desarrollo":
-            db.add(Desarrollo(
-                enunciado=pregunta["enunciado"],
-                respuesta=pregunta["respuesta"],
-                puntaje=2,
-                nivel_bloom=nivel,
-                id_evaluacion=evaluacion.id
-            ))
-        elif pregunta["tipo"] == "alternativas":
-            db.add(Alternativa(
-                enunciado=pregunta["enunciado"],
-                respuesta_a=f"a) {pregunta['opciones'].get('a')}",
-                respuesta_b=f"b) {pregunta['opciones'].get('b')}",
-                respuesta_c=f"c) {pregunta['opciones'].get('c')}",
-                respuesta_d=f"d) {pregunta['opciones'].get('d')}",
-                correcta=pregunta["correcta"],
-                puntaje=1,
-                nivel_bloom=nivel,
-                id_evaluacion=evaluacion.id
-            ))
-    db.commit()
+    if evaluacion:
+        return evaluacion_a_dict(evaluacion)
 
-    # Devolver el objeto completo de la evaluación
-    return {
-        "id": evaluacion.id,
-        "nombre": evaluacion.nombre,
-        "descripcion": evaluacion.descripcion,
-        "nivel": evaluacion.nivel,
-        "preguntas_vf": evaluacion.preguntas_vf,
-        "preguntas_desarrollo": evaluacion.preguntas_desarrollo,
-        "preguntas_alternativas": evaluacion.preguntas_alternativas,
-        "id_unidad": evaluacion.id_unidad
-    }
+    # Reserva vacía: la generación la hace worker.py
+    trabajo = encolar_trabajo(db, "generar_evaluacion", {"unidad_id": unidad.id, "nivel": nivel})
+    return JSONResponse(status_code=202, content=trabajo_a_dict(trabajo))
 
 
+def evento_sse(nombre: str, datos):
+    return f"event: {nombre}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+@app.post("/evaluacion/unidad/{unidad_id}/stream")
+async def crear_evaluacion_stream(unidad_id: int, nivel: int, db: Session = Depends(get_db)):
+    """
+    Variante de crear_evaluacion con Server-Sent Events: envía "evaluacion",
+    "nombre", "descripcion" y cada "pregunta" apenas el modelo la termina de
+    escribir (ya guardada), y al final "fin" (o "error").
+    Si hay una evaluación en la reserva se envía completa de inmediato.
+    """
+    unidad = db.query(Unidad).filter(Unidad.id == unidad_id).first()
+    if not unidad:
+        raise HTTPException(status_code=404, detail="Unidad no encontrada")
+
+    if nivel not in [1, 2, 3]:
+        raise HTTPException(status_code=400, detail="Nivel inválido")
+
+    evaluacion = tomar_de_reserva(db, unidad.id, nivel)
+    programar_relleno(db, unidad.id, [nivel])
+    unidad_id = unidad.id
+
+    def eventos_reserva():
+        # Se arman aquí porque la sesión del request no se usa dentro del stream
+        filas = evaluacion.verdaderofalsos + evaluacion.desarrollos + evaluacion.alternativas
+        eventos = [
+            evento_sse("evaluacion", evaluacion_a_dict(evaluacion)),
+            evento_sse("nombre", evaluacion.nombre),
+            evento_sse("descripcion", evaluacion.descripcion or ""),
+            *(evento_sse("pregunta", modelo_a_pregunta(fila)) for fila in filas),
+            evento_sse("fin", {"id": evaluacion.id, "preguntas": len(filas)}),
+        ]
+        return iter(eventos)
+
+    async def eventos_generados():
+        # La generación corre en su propia tarea y sesión; los eventos llegan por la cola
+        cola = asyncio.Queue()
+        sesion = SessionLocal()
+
+        async def generar():
+            try:
+                unidad = sesion.query(Unidad).filter(Unidad.id == unidad_id).first()
+                async with asyncio.timeout(PLAZO_GENERACION_EN_VIVO):
+                    evaluacion = await generar_en_vivo(sesion, unidad, nivel, lambda tipo, datos: cola.put((tipo, datos)))
+                await cola.put(("fin", {"id": evaluacion.id, "preguntas": len(
+                    evaluacion.verdaderofalsos + evaluacion.desarrollos + evaluacion.alternativas)}))
+            except TimeoutError:
+                # El run ya se canceló en OpenAI y la evaluación parcial se borró
+                await cola.put(("error", {"detail": f"La generación superó {PLAZO_GENERACION_EN_VIVO:.0f} segundos"}))
+            except Exception as e:
+                await cola.put(("error", {"detail": getattr(e, "detail", str(e))}))
+
+        tarea = asyncio.create_task(generar())
+        try:
+            while True:
+                tipo, datos = await cola.get()
+                yield evento_sse(tipo, datos)
+                if tipo in ("fin", "error"):
+                    break
+        finally:
+            # El cliente se desconectó: detener la generación (cancela el run en OpenAI y
+            # borra la evaluación parcial)
+            if not tarea.done():
+                tarea.cancel()
+                await asyncio.gather(tarea, return_exceptions=True)
+            sesion.close()
+
+    return StreamingResponse(
+        eventos_reserva() if evaluacion else eventos_generados(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.delete("/evaluacion/{evaluacion_id}")
 def eliminar_evaluacion(evaluacion_id: int, db: Session = Depends(get_db)):
     evaluacion = db.query(Evaluacion).filter(Evaluacion.id == evaluacion_id).first()
@@ -819,7 +956,7 @@ class EnvioEvaluacionIn(BaseModel):
 # ----------------------
 # ENDPOINT
 # ----------------------
-@app.post("/evaluacion/{evaluacion_id}/responder")
+@app.post("/evaluacion/{evaluacion_id}/responder", status_code=202)
 async def responder_evaluacion(
     evaluacion_id: int,
     data: EnvioEvaluacionIn,
@@ -869,35 +1006,152 @@ async def responder_evaluacion(
 
     db.commit()
 
-    # 3️⃣ Llamar a la corrección
-    resultado = await corregir_evaluacion(
-        assistant_id=assistant_id,
-        respuestas=respuestas_db
-    )
+    # 3️⃣ Puntaje de VF y alternativas de inmediato: el intento queda pendiente
+    # hasta que se corrija el desarrollo
+    parcial = resultado_objetivo(respuestas_db)
+    intento = registrar_intento_parcial(db, evaluacion, data.id_usuario, parcial)
+    if not parcial["desarrollos_pendientes"]:
+        return JSONResponse(status_code=200, content={"intento": intento_a_dict(intento), "parcial": parcial})
+
+    # 4️⃣ Encolar la corrección del desarrollo (la hace worker.py y completa el intento)
+    trabajo = encolar_trabajo(db, "corregir_evaluacion", {
+        "evaluacion_id": evaluacion.id,
+        "id_usuario": data.id_usuario,
+        "id_intento": intento.id,
+        "assistant_id": assistant_id,
+        "respuestas": respuestas_db
+    })
 
-    # 4️⃣ Insertar intento de evaluación
-    intento = IntentoEvaluacion(
-        id_evaluacion=evaluacion.id,
-        id_usuario=data.id_usuario,
-        id_unidad=evaluacion.id_unidad,
-        puntaje_obtenido=resultado["cumplimiento"],
-        nivel_al_momento=evaluacion.nivel,
-        fecha=datetime.utcnow(),
-        retroalimentacion="\n".join(
-            [f"id pregunta: {retro['id_desarrollo']} - Retroalimentacion: {retro['retroalimentacion']}" 
-             for retro in resultado["retroalimentaciones"]]
-        )
+    return {**trabajo_a_dict(trabajo), "intento": intento_a_dict(intento), "parcial": parcial}
+
+# ----------------------
+# RESULTADO DE UN INTENTO
+# ----------------------
+@app.get("/intentos/{intento_id}")
+def obtener_intento(intento_id: int, db: Session = Depends(get_db)):
+    """
+    Consulta del intento para los clientes sin SSE: estado_correccion pasa de
+    "pendiente" a "completado" (o "fallido", con el puntaje parcial).
+    """
+    intento = db.get(IntentoEvaluacion, intento_id)
+    if not intento:
+        raise HTTPException(status_code=404, detail="Intento no encontrado")
+
+    return intento_a_dict(intento)
+
+@app.get("/intentos/{intento_id}/eventos")
+async def eventos_intento(intento_id: int):
+    """
+    Server-Sent Events del intento: "parcial" al conectarse y "final" cuando
+    termina la corrección del desarrollo ("error" si falló o venció el plazo).
+    """
+    primero = await asyncio.to_thread(leer_intento, intento_id)
+    if not primero:
+        raise HTTPException(status_code=404, detail="Intento no encontrado")
+
+    async def eventos():
+        intento = primero
+        yield evento_sse("parcial", intento)
+        limite = time.monotonic() + PLAZO_EVENTOS_INTENTO
+        ultimo_envio = time.monotonic()
+        while intento["estado_correccion"] == EstadoTrabajo.pendiente.value:
+            if time.monotonic() >= limite:
+                yield evento_sse("error", {"detail": "La corrección sigue en curso; consultar /intentos/" + str(intento_id)})
+                return
+            await asyncio.sleep(INTERVALO_INTENTO)
+            intento = await asyncio.to_thread(leer_intento, intento_id)
+            if not intento:
+                yield evento_sse("error", {"detail": "Intento no encontrado"})
+                return
+            if time.monotonic() - ultimo_envio >= LATIDO_INTENTO:
+                # Comentario SSE: evita que un proxy cierre la conexión inactiva
+                yield ": latido\n\n"
+                ultimo_envio = time.monotonic()
+
+        if intento["estado_correccion"] == EstadoTrabajo.fallido.value:
+            yield evento_sse("error", {"detail": "No se pudo corregir el desarrollo", "intento": intento})
+        else:
+            yield evento_sse("final", intento)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    db.add(intento)
-    db.commit()
-    db.refresh(intento)
+
+# ----------------------
+# TRABAJOS EN SEGUNDO PLANO
+# ----------------------
+@app.get("/trabajos/{trabajo_id}")
+def obtener_trabajo(trabajo_id: int, db: Session = Depends(get_db)):
+    trabajo = db.query(Trabajo).filter(Trabajo.id == trabajo_id).first()
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+
+    return trabajo_a_dict(trabajo)
+
+@app.post("/trabajos/{trabajo_id}/cancelar")
+def cancelar_trabajo_endpoint(trabajo_id: int, db: Session = Depends(get_db)):
+    """
+    El cliente ya no espera el resultado (p. ej. cerró la pestaña): el trabajo
+    no se ejecuta, o si está en proceso el worker cancela su run en OpenAI.
+    Las correcciones no se cancelan: su resultado queda en el intento.
+    """
+    trabajo = db.query(Trabajo).filter(Trabajo.id == trabajo_id).first()
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    if trabajo.tipo != "generar_evaluacion":
+        raise HTTPException(status_code=409, detail="Solo se pueden cancelar generaciones de evaluaciones")
+
+    cancelar_trabajo(db, trabajo)
+    return trabajo_a_dict(trabajo)
+
+# ----------------------
+# MÉTRICAS
+# ----------------------
+@app.get("/metricas/cache_correccion")
+def metricas_cache_correccion(db: Session = Depends(get_db)):
+    contadores = leer_contadores(db, "cache_correccion.")
+    aciertos = contadores.get("cache_correccion.aciertos", 0)
+    fallos = contadores.get("cache_correccion.fallos", 0)
+    consultas = aciertos + fallos
 
     return {
-        "id_intento": intento.id,
-        "puntaje": intento.puntaje_obtenido,
-        "retroalimentacion": intento.retroalimentacion
+        "aciertos": int(aciertos),
+        "fallos": int(fallos),
+        "tasa_aciertos": aciertos / consultas if consultas else 0,
+        "segundos_ahorrados": contadores.get("cache_correccion.segundos_ahorrados", 0)
     }
 
+@app.get("/metricas/llm")
+def obtener_metricas_llm(db: Session = Depends(get_db)):
+    """
+    Latencias (total, cola, ejecución, espera_limite), reintentos, tokens y
+    resultados de las llamadas a OpenAI, por operación (generate, grade,
+    upload, delete, provision), con las solicitudes frenadas por el limitador
+    (limitadas), los 429 recibidos y los runs cancelados porque nadie iba a
+    leer su resultado (runs_cancelados, segundos_ahorrados estimados).
+    Incluye lo medido por este proceso y por worker.py.
+    """
+    volcar_metricas_llm()
+    return metricas_llm(db)
+
+@app.get("/metricas/limitador")
+async def obtener_estado_limitador():
+    """
+    Solicitudes a OpenAI esperando turno en este proceso (por clase de
+    prioridad), disponible en las cubetas por minuto y pausa por 429 restante.
+    """
+    return await estado_limitador()
+
+@app.get("/borrados/pendientes")
+def obtener_borrados_pendientes(db: Session = Depends(get_db)):
+    """
+    Assistants, vectores y archivos de cursos y unidades eliminados que aún no
+    se pudieron borrar en OpenAI, con sus intentos y el último error.
+    """
+    return borrados_pendientes(db)
+
 class AlternativaOut(BaseModel):
     enunciado: str
     opciones: Dict[str, str]  # A, B, C, D
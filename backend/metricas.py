@@ -0,0 +1,105 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from database import SessionLocal
+from models import Contador
+import asyncio
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from API.API import vaciar_metricas, BUCKETS_LATENCIA
+
+# Cada cuántos segundos se pasan las métricas del proceso a la tabla contador
+INTERVALO_METRICAS = float(os.getenv("INTERVALO_METRICAS", "10"))
+
+# -----------------------
+# Contadores compartidos entre la API y worker.py
+# -----------------------
+def sumar_contador(db: Session, nombre: str, valor: float = 1, confirmar: bool = True):
+    """
+    Suma valor al contador (lo crea si no existe).
+    """
+    actualizados = (
+        db.query(Contador)
+        .filter(Contador.nombre == nombre)
+        .update({Contador.valor: Contador.valor + valor}, synchronize_session=False)
+    )
+    if not actualizados:
+        try:
+            with db.begin_nested():
+                db.add(Contador(nombre=nombre, valor=valor))
+            if confirmar:
+                db.commit()
+            return
+        except IntegrityError:
+            # Otro proceso lo creó al mismo tiempo
+            db.query(Contador).filter(Contador.nombre == nombre).update(
+                {Contador.valor: Contador.valor + valor}, synchronize_session=False
+            )
+    if confirmar:
+        db.commit()
+
+def leer_contadores(db: Session, prefijo: str = ""):
+    contadores = db.query(Contador).filter(Contador.nombre.like(f"{prefijo}%")).all()
+    return {c.nombre: c.valor for c in contadores}
+
+# -----------------------
+# Métricas de las llamadas a OpenAI (API.py)
+# -----------------------
+def volcar_metricas_llm():
+    """
+    Suma a la tabla contador lo que API.py midió en este proceso.
+    """
+    metricas = vaciar_metricas()
+    if not metricas:
+        return
+    db = SessionLocal()
+    try:
+        for nombre, valor in metricas.items():
+            sumar_contador(db, nombre, valor, confirmar=False)
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"No se pudieron guardar las métricas: {e}")
+    finally:
+        db.close()
+
+async def volcar_metricas_periodicamente():
+    while True:
+        await asyncio.sleep(INTERVALO_METRICAS)
+        # La escritura en la base de datos no debe frenar el event loop
+        await asyncio.to_thread(volcar_metricas_llm)
+
+def metricas_llm(db: Session):
+    """
+    Histogramas de latencia (acumulados) y contadores por operación:
+    {operacion: {"latencia": {medida: {...}}, "reintentos": n, ...}}
+    """
+    operaciones = {}
+    for nombre, valor in leer_contadores(db, "llm.").items():
+        operacion, clave = nombre[len("llm."):].split(".", 1)
+        datos = operaciones.setdefault(operacion, {"latencia": {}, "resultados": {}})
+
+        if ".bucket." in clave or clave.endswith((".suma", ".cantidad")):
+            medida, tipo = clave.split(".", 1)
+            histograma = datos["latencia"].setdefault(medida, {"buckets": {}, "suma": 0, "cantidad": 0})
+            if tipo.startswith("bucket."):
+                histograma["buckets"][tipo[len("bucket."):]] = valor
+            else:
+                histograma[tipo] = valor
+        elif clave.startswith("resultado."):
+            datos["resultados"][clave[len("resultado."):]] = int(valor)
+        else:
+            datos[clave] = valor
+
+    # Pasar los buckets a formato acumulado (le = "menor o igual a")
+    for datos in operaciones.values():
+        for histograma in datos["latencia"].values():
+            acumulado = 0
+            buckets = {}
+            for limite in BUCKETS_LATENCIA:
+                acumulado += histograma["buckets"].get(str(limite), 0)
+                buckets[str(limite)] = int(acumulado)
+            histograma["buckets"] = buckets
+            histograma["cantidad"] = int(histograma["cantidad"])
+            histograma["promedio"] = histograma["suma"] / histograma["cantidad"] if histograma["cantidad"] else 0
+    return operaciones
@@ -0,0 +1,54 @@
+# migrar_asistente_compartido.py
+# Pasa las unidades existentes (y la reserva de pares) al assistant compartido:
+# la unidad conserva su vector, que se vincula en cada thread, y su assistant propio se borra.
+# Uso (dentro de backend, con ASISTENTE_COMPARTIDO=1 en el .env de API):
+#   python migrar_asistente_compartido.py [--simular]
+from database import SessionLocal
+from models import Unidad, ParAsistente
+import argparse
+import asyncio
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from API.API import asistente_compartido, obtener_assistant_compartido, borrar_assistant
+
+async def migrar(simular: bool):
+    compartido = await obtener_assistant_compartido()
+    print(f"Assistant compartido: {compartido}")
+
+    db = SessionLocal()
+    try:
+        filas = (
+            db.query(Unidad).filter(Unidad.assistant_id != None, Unidad.assistant_id != compartido).all()
+            + db.query(ParAsistente).filter(ParAsistente.assistant_id != compartido).all()
+        )
+        antiguos = {fila.assistant_id for fila in filas}
+        print(f"{len(filas)} unidades / pares en reserva con {len(antiguos)} assistants propios")
+        if simular:
+            return
+
+        for fila in filas:
+            fila.assistant_id = compartido
+        db.commit()
+    finally:
+        db.close()
+
+    errores = 0
+    for assistant_id in antiguos:
+        try:
+            await borrar_assistant(assistant_id)
+        except Exception as e:
+            errores += 1
+            print(f"No se pudo borrar assistant {assistant_id}: {getattr(e, 'detail', e)}")
+    print(f"{len(antiguos) - errores} assistants borrados, {errores} con error")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra las unidades al assistant compartido")
+    parser.add_argument("--simular", action="store_true", help="Solo muestra lo que se migraría")
+    args = parser.parse_args()
+
+    if not asistente_compartido:
+        print("Activa ASISTENTE_COMPARTIDO=1 antes de migrar (si no, las unidades quedarían sin vector)")
+        sys.exit(1)
+    asyncio.run(migrar(args.simular))
@@ -0,0 +1,90 @@
+# migrar_esquema.py
+# Agrega a una base de datos existente las columnas nuevas de tablas que ya
+# existían: Base.metadata.create_all solo crea las tablas que faltan, no las
+# altera. Es idempotente: solo agrega las columnas e índices que no están.
+# Uso (dentro de backend, antes de iniciar main.py y worker.py):
+#   python migrar_esquema.py --mostrar   (solo muestra el SQL)
+#   python migrar_esquema.py
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+from database import engine, Base
+import models  # noqa: F401 (registra las tablas)
+import argparse
+
+# (tabla, columna) agregadas después de que la tabla ya existía
+COLUMNAS_NUEVAS = [
+    ("evaluacion", "en_reserva"),                 # reserva de evaluaciones pre-generadas
+    ("unidad", "version_corpus"),                 # versión del corpus compartida entre procesos
+    ("evaluacion", "version_corpus"),
+    ("trabajo", "clave"),                         # rellenos de la reserva sin duplicar
+    ("corpus", "estado"),                         # espera de la indexación en el vector store
+    ("corpus", "error_ingesta"),
+    ("corpus", "estado_extraccion"),              # extracción de texto del corpus
+    ("intento_evaluacion", "estado_correccion"),  # corrección en dos fases
+]
+
+def _valor_defecto(columna):
+    valor = columna.default.arg if columna.default is not None and columna.default.is_scalar else None
+    if valor is None:
+        return None
+    if isinstance(valor, bool):
+        return "1" if valor else "0"
+    if isinstance(valor, (int, float)):
+        return str(valor)
+    return f"'{getattr(valor, 'name', valor)}'"
+
+def sentencias_columna(conexion, columna):
+    """
+    ALTER TABLE (y CREATE INDEX si corresponde) para agregar la columna del modelo.
+    La unicidad va como índice único: SQLite no acepta UNIQUE en ADD COLUMN.
+    """
+    tabla = columna.table
+    partes = [columna.name, columna.type.compile(dialect=conexion.dialect)]
+    defecto = _valor_defecto(columna)
+    if defecto is not None:
+        partes.append(f"DEFAULT {defecto}")
+    partes.append("NULL" if columna.nullable else "NOT NULL")
+    sentencias = [f"ALTER TABLE {tabla.name} ADD COLUMN {' '.join(partes)}"]
+
+    if columna.unique:
+        sentencias.append(f"CREATE UNIQUE INDEX uq_{tabla.name}_{columna.name} ON {tabla.name} ({columna.name})")
+    for indice in tabla.indexes:
+        if [c.name for c in indice.columns] == [columna.name]:
+            sentencias.append(str(CreateIndex(indice).compile(dialect=conexion.dialect)))
+    return sentencias
+
+def sentencias_pendientes(conexion):
+    inspector = inspect(conexion)
+    tablas = set(inspector.get_table_names())
+    sentencias = []
+    for nombre_tabla, nombre_columna in COLUMNAS_NUEVAS:
+        if nombre_tabla not in tablas:
+            continue  # create_all la crea completa
+        existentes = {c["name"] for c in inspector.get_columns(nombre_tabla)}
+        if nombre_columna not in existentes:
+            columna = Base.metadata.tables[nombre_tabla].columns[nombre_columna]
+            sentencias += sentencias_columna(conexion, columna)
+    return sentencias
+
+def migrar(motor=engine, mostrar: bool = False):
+    """
+    Aplica (o con mostrar=True solo devuelve) las sentencias que faltan.
+    """
+    with motor.begin() as conexion:
+        sentencias = sentencias_pendientes(conexion)
+        if not mostrar:
+            for sentencia in sentencias:
+                conexion.execute(text(sentencia))
+    return sentencias
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agrega las columnas nuevas a una base de datos existente")
+    parser.add_argument("--mostrar", action="store_true", help="Solo muestra el SQL, sin ejecutarlo")
+    args = parser.parse_args()
+
+    sentencias = migrar(mostrar=args.mostrar)
+    for sentencia in sentencias:
+        print(f"{sentencia};")
+    if not sentencias:
+        print("La base de datos ya tiene todas las columnas")
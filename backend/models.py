@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Enum
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Enum, Boolean, Float
 from sqlalchemy.orm import relationship
 from database import Base
 import enum
@@ -15,6 +15,27 @@ class EstadoProgreso(enum.Enum):
     aprobado = "aprobado"
     bloqueado = "bloqueado"
 
+# Enum para estados de trabajos en segundo plano
+class EstadoTrabajo(enum.Enum):
+    pendiente = "pendiente"
+    en_proceso = "en_proceso"
+    completado = "completado"
+    fallido = "fallido"
+
+# Enum para el estado de indexación de un corpus en su vector store
+class EstadoIngesta(enum.Enum):
+    pendiente = "pendiente"
+    procesando = "procesando"
+    listo = "listo"
+    fallido = "fallido"
+
+# Enum para el estado de la extracción de texto de un corpus (ver ingesta.py)
+class EstadoExtraccion(enum.Enum):
+    pendiente = "pendiente"
+    lista = "lista"
+    sin_texto = "sin_texto"
+    error = "error"
+
 # Tabla usuario
 class Usuario(Base):
     __tablename__ = "usuario"
@@ -47,6 +68,7 @@ class Unidad(Base):
     id_curso = Column(Integer, ForeignKey("curso.id", ondelete="CASCADE"), nullable=False)
     assistant_id = Column(String(255), nullable=True)
     vector_id = Column(String(255), nullable=True)
+    version_corpus = Column(Integer, nullable=False, default=0)  # sube cada vez que cambia el corpus
 
     curso = relationship("Curso", back_populates="unidades")
     corpus = relationship("Corpus", back_populates="unidad", cascade="all, delete-orphan")
@@ -60,8 +82,24 @@ class Corpus(Base):
     nombre = Column(String(100), nullable=False)
     material = Column(Text, nullable=False)
     id_unidad = Column(Integer, ForeignKey("unidad.id", ondelete="CASCADE"), nullable=False)
+    estado = Column(Enum(EstadoIngesta), nullable=False, default=EstadoIngesta.pendiente, index=True)
+    error_ingesta = Column(Text, nullable=True)
+    estado_extraccion = Column(Enum(EstadoExtraccion), nullable=False, default=EstadoExtraccion.pendiente)
 
     unidad = relationship("Unidad", back_populates="corpus")
+    fragmentos = relationship("FragmentoCorpus", back_populates="corpus", cascade="all, delete-orphan",
+                              passive_deletes=True, order_by="FragmentoCorpus.orden")
+
+# Texto extraído de cada corpus, dividido en fragmentos (ver ingesta.py)
+class FragmentoCorpus(Base):
+    __tablename__ = "fragmento_corpus"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    id_corpus = Column(Integer, ForeignKey("corpus.id", ondelete="CASCADE"), nullable=False, index=True)
+    orden = Column(Integer, nullable=False)
+    texto = Column(Text, nullable=False)
+    tokens = Column(Integer, nullable=False)  # estimación
+
+    corpus = relationship("Corpus", back_populates="fragmentos")
 
 # Tabla evaluacion
 class Evaluacion(Base):
@@ -75,6 +113,8 @@ class Evaluacion(Base):
     puntaje_total = Column(Integer)
     nivel = Column(Integer, nullable=True)  # o Enum si prefieres categorías fijas
     id_unidad = Column(Integer, ForeignKey("unidad.id", ondelete="CASCADE"), nullable=False)
+    en_reserva = Column(Boolean, nullable=False, default=False)  # pre-generada, aún no entregada
+    version_corpus = Column(Integer, nullable=False, default=0)  # en la reserva: Unidad.version_corpus al generarla
 
     unidad = relationship("Unidad", back_populates="evaluaciones")
     alternativas = relationship("Alternativa", back_populates="evaluacion", cascade="all, delete-orphan")
@@ -148,6 +188,9 @@ class IntentoEvaluacion(Base):
     nivel_al_momento = Column(Integer, nullable=False)
     fecha = Column(DateTime, default=datetime.datetime.utcnow)
     retroalimentacion = Column(Text)
+    # pendiente mientras el worker corrige las preguntas de desarrollo;
+    # hasta entonces puntaje_obtenido es solo el de VF y alternativas
+    estado_correccion = Column(Enum(EstadoTrabajo), nullable=False, default=EstadoTrabajo.completado)
 
     evaluacion = relationship("Evaluacion", back_populates="intentos")
     usuario = relationship("Usuario", back_populates="intentos")
@@ -167,6 +210,65 @@ class Respuesta(Base):
     usuario = relationship("Usuario")
     evaluacion = relationship("Evaluacion")
 
+# Tabla de trabajos (generación y corrección) que ejecuta worker.py
+class Trabajo(Base):
+    __tablename__ = "trabajo"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    tipo = Column(String(50), nullable=False)  # "generar_evaluacion", "corregir_evaluacion", "rellenar_reserva"
+    # Mientras el trabajo está pendiente o en proceso: evita encolar dos veces el
+    # mismo trabajo (p. ej. "rellenar_reserva:unidad:nivel"), también entre procesos
+    clave = Column(String(100), nullable=True, unique=True)
+    parametros = Column(Text, nullable=False)  # JSON
+    estado = Column(Enum(EstadoTrabajo), nullable=False, default=EstadoTrabajo.pendiente, index=True)
+    resultado = Column(Text, nullable=True)  # JSON
+    error = Column(Text, nullable=True)
+    intentos = Column(Integer, nullable=False, default=0)
+    creado = Column(DateTime, default=datetime.datetime.utcnow)
+    actualizado = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+# Caché de correcciones de desarrollo (clave: huella de contenido + pregunta + respuesta)
+class CorreccionCache(Base):
+    __tablename__ = "correccion_cache"
+    huella = Column(String(64), primary_key=True)  # sha256 hex
+    puntaje = Column(Integer, nullable=False)
+    retroalimentacion = Column(Text, nullable=False)
+    segundos = Column(Float, nullable=True)  # duración de la corrección con la IA
+    creado = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    ultimo_uso = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+# Contadores acumulados (compartidos entre procesos)
+class Contador(Base):
+    __tablename__ = "contador"
+    nombre = Column(String(100), primary_key=True)
+    valor = Column(Float, nullable=False, default=0)
+
+# Archivos subidos a OpenAI por contenido (sha256), compartidos por los corpus que lo usan
+class ArchivoRemoto(Base):
+    __tablename__ = "archivo_remoto"
+    huella = Column(String(64), primary_key=True)  # sha256 hex del contenido
+    file_id = Column(String(255), unique=True, nullable=False)
+    referencias = Column(Integer, nullable=False, default=1)  # filas de corpus que lo usan
+    creado = Column(DateTime, default=datetime.datetime.utcnow)
+
+# Pares assistant + vector store ya creados en OpenAI, listos para asignar a una unidad nueva
+class ParAsistente(Base):
+    __tablename__ = "par_asistente"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    assistant_id = Column(String(255), nullable=False)
+    vector_id = Column(String(255), nullable=False)
+    creado = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+# Recursos de OpenAI por borrar tras eliminar cursos y unidades (ver borrados.py)
+class BorradoPendiente(Base):
+    __tablename__ = "borrado_pendiente"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    tipo = Column(String(20), nullable=False)  # "assistant", "vector", "archivo"
+    recurso_id = Column(String(255), nullable=False)
+    intentos = Column(Integer, nullable=False, default=0)
+    proximo_intento = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    error = Column(Text, nullable=True)  # último error
+    creado = Column(DateTime, default=datetime.datetime.utcnow)
+
 
 # Crear tablas solo si ejecutas este archivo directamente
 if __name__ == "__main__":
@@ -0,0 +1,182 @@
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import ParAsistente
+from borrados import registrar_borrado, programar_recoleccion
+from datetime import datetime, timedelta
+import asyncio
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from API.API import (crear_assistant, crear_vector, renombrar_assistant,
+                     asistente_compartido, obtener_assistant_compartido, es_assistant_compartido)
+
+# Pares assistant + vector que se mantienen listos para unidades nuevas
+RESERVA_ASISTENTES = int(os.getenv("RESERVA_ASISTENTES", "3"))
+# Horas tras las cuales un par sin usar se borra (y se reemplaza por uno nuevo)
+HORAS_PAR_SIN_USO = float(os.getenv("HORAS_PAR_SIN_USO", "72"))
+# Cada cuántos segundos se revisa la reserva
+INTERVALO_RESERVA_ASISTENTES = float(os.getenv("INTERVALO_RESERVA_ASISTENTES", "600"))
+
+NOMBRE_EN_RESERVA = "Asistente en reserva"
+
+_relleno_en_curso = False
+# Referencias a las tareas en segundo plano para que no sean recolectadas
+_tareas = set()
+
+def _en_segundo_plano(corrutina):
+    tarea = asyncio.create_task(corrutina)
+    _tareas.add(tarea)
+    tarea.add_done_callback(_tareas.discard)
+
+async def crear_par(nombre: str):
+    """
+    Crea el par en OpenAI. Con assistant compartido solo se crea el vector.
+    """
+    if asistente_compartido:
+        assistant_id = await obtener_assistant_compartido()
+        return assistant_id, await crear_vector(assistant_id, vincular=False)
+    assistant_id = await crear_assistant(nombre)
+    return assistant_id, await crear_vector(assistant_id)
+
+# -----------------------
+# Asignación
+# -----------------------
+def tomar_par(db: Session, assistant_id: str = None):
+    """
+    Saca un par de la reserva sin confirmar la transacción: quien lo llama
+    guarda la unidad con esos ids y hace commit, así el par no se pierde
+    si la unidad falla. Con assistant_id solo se toman pares de ese assistant.
+    Devuelve (assistant_id, vector_id) o None.
+    """
+    consulta = db.query(ParAsistente)
+    if assistant_id:
+        consulta = consulta.filter(ParAsistente.assistant_id == assistant_id)
+    par = (
+        consulta
+        .order_by(ParAsistente.id)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if not par:
+        return None
+    db.delete(par)
+    return par.assistant_id, par.vector_id
+
+async def obtener_par(db: Session, nombre: str):
+    """
+    Par assistant + vector para una unidad nueva: de la reserva si hay (y se
+    renombra en segundo plano), si no se crea en el momento.
+    Tras el commit, quien lo llama debe llamar a programar_relleno_asistentes():
+    antes, el relleno todavía cuenta el par tomado.
+    """
+    compartido = await obtener_assistant_compartido() if asistente_compartido else None
+    par = tomar_par(db, compartido)
+    if par:
+        if not compartido:
+            _en_segundo_plano(renombrar(par[0], nombre))
+        return par
+
+    return await crear_par(nombre)
+
+async def renombrar(assistant_id: str, nombre: str):
+    try:
+        await renombrar_assistant(assistant_id, nombre)
+    except Exception as e:
+        print(f"No se pudo renombrar el assistant {assistant_id}: {e}")
+
+# -----------------------
+# Mantención de la reserva
+# -----------------------
+def pares_en_reserva(db: Session, assistant_id: str = None, bloquear: bool = False):
+    consulta = db.query(ParAsistente.id)
+    if assistant_id:
+        consulta = consulta.filter(ParAsistente.assistant_id == assistant_id)
+    if bloquear:
+        consulta = consulta.with_for_update()
+    return len(consulta.all())
+
+def guardar_en_reserva(db: Session, assistant_id: str, vector_id: str, compartido: str = None):
+    """
+    Guarda el par recién creado si la reserva sigue bajo RESERVA_ASISTENTES.
+    El conteo va en la misma transacción que el insert porque otros procesos
+    también rellenan; si sobra, el par se registra para borrarse.
+    Devuelve True si quedó en la reserva.
+    """
+    if pares_en_reserva(db, compartido, bloquear=True) >= RESERVA_ASISTENTES:
+        if not compartido:
+            registrar_borrado(db, "assistant", assistant_id)
+        registrar_borrado(db, "vector", vector_id)
+        db.commit()
+        programar_recoleccion()
+        return False
+    db.add(ParAsistente(assistant_id=assistant_id, vector_id=vector_id))
+    db.commit()
+    return True
+
+async def rellenar_reserva_asistentes():
+    """
+    Crea pares hasta llegar a RESERVA_ASISTENTES.
+    Usa su propia sesión porque corre fuera del request.
+    """
+    global _relleno_en_curso
+    # Solo evita rellenos simultáneos en este proceso; el tope lo pone guardar_en_reserva
+    if _relleno_en_curso:
+        return
+    _relleno_en_curso = True
+
+    db = SessionLocal()
+    try:
+        compartido = await obtener_assistant_compartido() if asistente_compartido else None
+        while pares_en_reserva(db, compartido) < RESERVA_ASISTENTES:
+            # No dejar la transacción abierta mientras se crea el par en OpenAI
+            db.commit()
+            assistant_id, vector_id = await crear_par(NOMBRE_EN_RESERVA)
+            if not guardar_en_reserva(db, assistant_id, vector_id, compartido):
+                break
+    except Exception as e:
+        print(f"No se pudo rellenar la reserva de assistants: {e}")
+    finally:
+        _relleno_en_curso = False
+        db.close()
+
+async def podar_reserva_asistentes():
+    """
+    Borra de la tabla (y registra para borrar en OpenAI) los pares que llevan más de HORAS_PAR_SIN_USO sin asignarse.
+    """
+    limite = datetime.utcnow() - timedelta(hours=HORAS_PAR_SIN_USO)
+    db = SessionLocal()
+    try:
+        while True:
+            par = (
+                db.query(ParAsistente)
+                .filter(ParAsistente.creado < limite)
+                .order_by(ParAsistente.id)
+                .with_for_update(skip_locked=True)
+                .first()
+            )
+            if not par:
+                return
+            # Los borra el recolector de borrados.py, con reintentos
+            if not await es_assistant_compartido(par.assistant_id):
+                registrar_borrado(db, "assistant", par.assistant_id)
+            registrar_borrado(db, "vector", par.vector_id)
+            db.delete(par)
+            db.commit()
+            programar_recoleccion()
+    finally:
+        db.close()
+
+def programar_relleno_asistentes():
+    """
+    Rellena la reserva en segundo plano (llamar después del commit que tomó el par).
+    """
+    _en_segundo_plano(rellenar_reserva_asistentes())
+
+async def mantener_reserva_asistentes():
+    while True:
+        try:
+            await podar_reserva_asistentes()
+            await rellenar_reserva_asistentes()
+        except Exception as e:
+            print(f"Error al mantener la reserva de assistants: {e}")
+        await asyncio.sleep(INTERVALO_RESERVA_ASISTENTES)
@@ -0,0 +1,92 @@
+# conftest.py
+# Pruebas del backend contra SQLite y fake_openai (sin MySQL ni la API real).
+# Uso (dentro de backend):
+#   python -m pytest tests
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND = os.path.join(os.path.dirname(__file__), "..")
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+PUERTO_FAKE = _puerto_libre()
+CARPETA = tempfile.mkdtemp(prefix="tesis_pruebas_")
+# Segundos que dura cada run en fake_openai: la "generación lenta" de las pruebas
+DURACION_RUN = 2.0
+
+# Antes de importar database / API.py, que leen la configuración al importarse
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(CARPETA, 'pruebas.db')}",
+    OPENAI_BASE_URL=f"http://127.0.0.1:{PUERTO_FAKE}/v1",
+    OPENAI_API_KEY="pruebas",
+    CARPETA_INDICES=os.path.join(CARPETA, "indices"),
+    RESERVA_EVALUACIONES="0",
+    MODO_GENERACION="texto",
+    FAKE_OPENAI_COLA="0",
+    FAKE_OPENAI_DURACION_RUN=str(DURACION_RUN),
+)
+sys.path.insert(0, os.path.abspath(BACKEND))
+sys.path.insert(0, os.path.abspath(os.path.join(BACKEND, "..")))
+
+import httpx
+import pytest
+import uvicorn
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    # Un solo event loop para toda la sesión: el cliente de OpenAI de API.py es global
+    return "asyncio"
+
+@pytest.fixture(scope="session", autouse=True)
+async def bucle_compartido(anyio_backend):
+    # anyio mantiene el loop mientras viva un fixture async de sesión
+    yield
+
+@pytest.fixture(scope="session", autouse=True)
+def fake_openai():
+    from API import fake_openai as fake
+    servidor = uvicorn.Server(uvicorn.Config(fake.app, host="127.0.0.1", port=PUERTO_FAKE, log_level="warning"))
+    hilo = threading.Thread(target=servidor.run, daemon=True)
+    hilo.start()
+    while not servidor.started:
+        time.sleep(0.05)
+    yield fake
+    servidor.should_exit = True
+    hilo.join(5)
+
+@pytest.fixture
+def db():
+    from database import Base, SessionLocal, engine
+    import models  # noqa: F401 (registra las tablas)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    sesion = SessionLocal()
+    yield sesion
+    sesion.close()
+
+@pytest.fixture
+async def cliente(db):
+    import main
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://prueba") as c:
+        yield c
+
+@pytest.fixture
+def unidad(db, fake_openai):
+    """
+    Usuario, curso y unidad con assistant y vector store creados en fake_openai.
+    """
+    import models
+    assistant_id = httpx.post(f"{os.environ['OPENAI_BASE_URL']}/assistants", json={"model": "gpt-4o", "name": "prueba"}).json()["id"]
+    vector_id = httpx.post(f"{os.environ['OPENAI_BASE_URL']}/vector_stores", json={"name": "prueba"}).json()["id"]
+    db.add(models.Usuario(id=1, nombre="Prueba", correo="prueba@prueba.cl", contrasena="x", tipo=models.TipoUsuario.admin))
+    db.add(models.Curso(id=1, nombre="Curso", id_usuario=1))
+    db.add(models.Unidad(id=1, nombre="Unidad", id_curso=1, assistant_id=assistant_id, vector_id=vector_id))
+    db.commit()
+    return db.get(models.Unidad, 1)
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import borrados
+from borrados import espera_reintento, recolectar_borrados, registrar_borrado, tomar_borrados
+from models import BorradoPendiente
+
+pytestmark = pytest.mark.anyio
+
+def vencer(db, fila):
+    # Como si hubiera pasado el plazo de la fila
+    fila.proximo_intento = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+
+async def test_recolector_borra_los_recursos_registrados(db, unidad, fake_openai):
+    registrar_borrado(db, "assistant", unidad.assistant_id)
+    registrar_borrado(db, "vector", unidad.vector_id)
+    db.commit()
+
+    assert await recolectar_borrados() == (2, 0)
+    assert db.query(BorradoPendiente).count() == 0
+    assert unidad.assistant_id not in fake_openai.assistants
+    assert unidad.vector_id not in fake_openai.vector_stores
+
+async def test_fallo_se_reintenta_con_backoff(db, monkeypatch):
+    async def fallar(tipo, recurso_id):
+        raise RuntimeError("OpenAI no responde")
+    monkeypatch.setattr(borrados, "borrar_recurso", fallar)
+    registrar_borrado(db, "vector", "vs_caido")
+    db.commit()
+
+    for intentos in (1, 2):
+        espera = borrados.ESPERA_BORRADO_BASE * 2 ** (intentos - 1)
+        antes = datetime.utcnow()
+        assert await recolectar_borrados() == (0, 1)
+        db.expire_all()
+        fila = db.query(BorradoPendiente).one()
+        assert fila.intentos == intentos and fila.error == "OpenAI no responde"
+        # Entre la mitad y el total de la espera, que se duplica en cada fallo
+        assert antes + timedelta(seconds=espera / 2 - 1) <= fila.proximo_intento <= datetime.utcnow() + timedelta(seconds=espera)
+        # Antes del plazo no se vuelve a intentar
+        assert await recolectar_borrados() == (0, 0)
+        vencer(db, fila)
+
+def test_espera_no_pasa_del_maximo():
+    assert espera_reintento(30) <= timedelta(seconds=borrados.ESPERA_BORRADO_MAXIMA)
+
+def test_fila_tomada_vuelve_a_la_cola_si_el_recolector_no_termina(db):
+    registrar_borrado(db, "archivo", "file_1")
+    db.commit()
+
+    assert [recurso for _, _, recurso in tomar_borrados(db)] == ["file_1"]
+    # Otro proceso no la toma mientras dura el plazo del primero
+    assert tomar_borrados(db) == []
+
+    # El primero murió sin terminar: al vencer el plazo se vuelve a tomar
+    vencer(db, db.query(BorradoPendiente).one())
+    assert [recurso for _, _, recurso in tomar_borrados(db)] == ["file_1"]
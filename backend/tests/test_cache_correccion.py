@@ -0,0 +1,15 @@
+import datetime
+
+from cache_correccion import CacheCorreccion
+from models import CorreccionCache
+
+def test_acierto_en_memoria_actualiza_ultimo_uso(db):
+    cache = CacheCorreccion()
+    cache.guardar("huella", 80, "Bien", 1.5)
+    antiguo = datetime.datetime.utcnow() - datetime.timedelta(days=3)
+    db.query(CorreccionCache).update({CorreccionCache.ultimo_uso: antiguo})
+    db.commit()
+
+    assert cache.obtener("huella") == (80, "Bien")
+    db.expire_all()
+    assert db.get(CorreccionCache, "huella").ultimo_uso > antiguo
@@ -0,0 +1,96 @@
+import asyncio
+import pytest
+
+import archivos_remotos
+import ingesta
+import main
+from models import ArchivoRemoto, Corpus
+
+pytestmark = pytest.mark.anyio
+
+async def test_lote_sube_y_guarda_cada_archivo(cliente, db, unidad):
+    archivos = [
+        ("archivos", ("uno.txt", "La fotosíntesis ocurre en los cloroplastos.".encode(), "text/plain")),
+        ("archivos", ("dos.txt", "La mitocondria produce energía para la célula.".encode(), "text/plain")),
+    ]
+    respuesta = await cliente.post(f"/corpus/unidad/{unidad.id}/lote", files=archivos)
+    assert respuesta.status_code == 200, respuesta.text
+    resultados = respuesta.json()["archivos"]
+    assert [r["nombre"] for r in resultados] == ["uno.txt", "dos.txt"]
+    assert all(r["file_id"] for r in resultados)
+
+    # Esperar la extracción en segundo plano antes de cerrar el event loop
+    await asyncio.gather(*ingesta._tareas)
+    db.expire_all()
+    assert {c.nombre for c in db.query(Corpus).filter(Corpus.id_unidad == unidad.id)} == {"uno.txt", "dos.txt"}
+
+async def test_archivo_sin_texto_no_se_sube(cliente, db, unidad, fake_openai):
+    archivos_antes = len(fake_openai.archivos)
+    respuesta = await cliente.post(f"/corpus/unidad/{unidad.id}", files={"archivo": ("vacio.txt", b"  \n\n ", "text/plain")})
+    assert respuesta.status_code == 422, respuesta.text
+    assert len(fake_openai.archivos) == archivos_antes
+    assert db.query(Corpus).count() == 0
+
+async def test_estado_extraccion_en_fragmentos(cliente, db, unidad):
+    archivos = [
+        ("archivos", ("texto.txt", "Las células eucariotas tienen núcleo definido.".encode(), "text/plain")),
+        ("archivos", ("vacio.txt", b"   ", "text/plain")),
+    ]
+    respuesta = await cliente.post(f"/corpus/unidad/{unidad.id}/lote", files=archivos)
+    assert respuesta.status_code == 200, respuesta.text
+    vacio = respuesta.json()["archivos"][1]
+    assert vacio["file_id"] is None and "texto" in vacio["error"]
+
+    await asyncio.gather(*ingesta._tareas)
+    corpus = db.query(Corpus).one()
+    datos = (await cliente.get(f"/corpus/{corpus.id}/fragmentos")).json()
+    assert datos["estado_extraccion"] == "lista"
+    assert datos["fragmentos"] == 1
+
+async def test_eliminar_corpus_repetido_mantiene_el_archivo_en_el_vector(cliente, db, unidad, fake_openai):
+    contenido = "El sistema nervioso central está formado por el encéfalo y la médula espinal.".encode()
+    for nombre in ("apunte.txt", "apunte_copia.txt"):
+        respuesta = await cliente.post(f"/corpus/unidad/{unidad.id}", files={"archivo": (nombre, contenido, "text/plain")})
+        assert respuesta.status_code == 200, respuesta.text
+    await asyncio.gather(*ingesta._tareas)
+    primero, segundo = db.query(Corpus).order_by(Corpus.id).all()
+    assert primero.material == segundo.material
+    file_id = primero.material
+    archivos_vector = fake_openai.vector_stores[unidad.vector_id]["archivos"]
+
+    # Los parámetros de la request ya no se usan
+    respuesta = await cliente.delete(f"/corpus/{primero.id}", params={"file_id": "file-otro", "vector_id": "vs-otro"})
+    assert respuesta.status_code == 200, respuesta.text
+    assert file_id in archivos_vector and file_id in fake_openai.archivos
+
+    respuesta = await cliente.delete(f"/corpus/{segundo.id}")
+    assert respuesta.status_code == 200, respuesta.text
+    assert "errores" not in respuesta.json()
+    assert file_id not in archivos_vector and file_id not in fake_openai.archivos
+
+async def test_la_huella_se_calcula_al_copiar_el_archivo(cliente, db, unidad, monkeypatch):
+    async def releer(archivo):
+        raise AssertionError("el archivo se volvió a leer para calcular la huella")
+    monkeypatch.setattr(archivos_remotos, "huella_archivo", releer)
+
+    respuesta = await cliente.post(f"/corpus/unidad/{unidad.id}", files={"archivo": ("a.txt", b"Los virus no tienen metabolismo propio.", "text/plain")})
+    assert respuesta.status_code == 200, respuesta.text
+    archivos = [("archivos", ("b.txt", b"Las bacterias son procariotas.", "text/plain"))]
+    respuesta = await cliente.post(f"/corpus/unidad/{unidad.id}/lote", files=archivos)
+    assert respuesta.status_code == 200, respuesta.text
+    await asyncio.gather(*ingesta._tareas)
+    assert db.query(ArchivoRemoto).count() == 2
+
+async def test_corpus_que_no_se_guarda_suelta_la_referencia(cliente, db, unidad, fake_openai, monkeypatch):
+    def fallar(*args, **kwargs):
+        raise RuntimeError("base de datos caída")
+    monkeypatch.setattr(main, "save_file_to_db", fallar)
+    archivos_antes = set(fake_openai.archivos)
+
+    with pytest.raises(RuntimeError):
+        await cliente.post(f"/corpus/unidad/{unidad.id}", files={"archivo": ("c.txt", b"Los hongos descomponen materia.", "text/plain")})
+    db.expire_all()
+    assert db.query(ArchivoRemoto).count() == 0
+    # Era la única referencia: se desvincula del vector y se borra de OpenAI
+    assert not fake_openai.vector_stores[unidad.vector_id]["archivos"]
+    assert set(fake_openai.archivos) == archivos_antes
@@ -0,0 +1,36 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from API import API
+
+pytestmark = pytest.mark.anyio
+
+def desarrollo(id):
+    return {"id": id, "tipo": "desarrollo", "enunciado": f"Pregunta {id}", "respuesta_usuario": "respuesta", "correcta": None}
+
+async def test_una_correccion_fallida_cancela_los_runs_de_las_demas(monkeypatch, fake_openai):
+    assistant_id = httpx.post(f"{os.environ['OPENAI_BASE_URL']}/assistants", json={"model": "gpt-4o", "name": "prueba"}).json()["id"]
+    corregir = API.corregir_desarrollo_con_cache
+
+    async def corregir_o_fallar(assistant_id, r, *args):
+        if r["id"] == 1:
+            # Falla cuando las demás ya crearon sus runs
+            while len(set(fake_openai.runs) - antes) < 2:
+                await asyncio.sleep(0.05)
+            raise RuntimeError("sin respuesta")
+        return await corregir(assistant_id, r, *args)
+    monkeypatch.setattr(API, "corregir_desarrollo_con_cache", corregir_o_fallar)
+
+    antes = set(fake_openai.runs)
+    with pytest.raises(HTTPException) as error:
+        await API.corregir_evaluacion(assistant_id, [desarrollo(i) for i in range(1, 4)])
+    assert error.value.status_code == 500
+    assert error.value.detail == "Error evaluando desarrollo: sin respuesta"
+
+    nuevos = [run for id, run in fake_openai.runs.items() if id not in antes]
+    assert len(nuevos) == 2
+    assert all(run["status"] == "cancelled" for run in nuevos)
@@ -0,0 +1,43 @@
+import argparse
+import asyncio
+import json
+
+import pytest
+
+import correccion_masiva
+from API.API import enviar_lote
+from evaluaciones import guardar_evaluacion, registrar_intento
+from models import Desarrollo, IntentoEvaluacion, Respuesta
+
+pytestmark = pytest.mark.anyio
+
+RESULTADO = {"nombre": "Semestre", "descripcion": "", "preguntas": [
+    {"tipo": "desarrollo", "enunciado": "¿Qué produce la fotosíntesis?", "respuesta": "Glucosa y oxígeno."},
+]}
+
+async def test_preparar_enviar_y_recoger_el_batch(db, unidad, fake_openai, monkeypatch, tmp_path):
+    monkeypatch.setattr(fake_openai, "DURACION_LOTE", 0)
+    evaluacion = guardar_evaluacion(db, unidad.id, 1, RESULTADO)
+    pregunta = db.query(Desarrollo).one()
+    db.add(Respuesta(id_usuario=1, id_evaluacion=evaluacion.id, tipo_pregunta="desarrollo",
+                     id_pregunta=pregunta.id, respuesta_texto="Produce oxígeno."))
+    db.commit()
+    intento = registrar_intento(db, evaluacion, 1, {"cumplimiento": 0, "retroalimentaciones": []})
+
+    salida = tmp_path / "lote.jsonl"
+    correccion_masiva.preparar(argparse.Namespace(unidad=unidad.id, evaluacion=None, salida=str(salida)))
+    solicitudes = [json.loads(linea) for linea in salida.read_text(encoding="utf-8").splitlines()]
+    assert [s["custom_id"] for s in solicitudes] == [f"1:{evaluacion.id}:{pregunta.id}"]
+
+    batch_id = await enviar_lote(str(salida))
+    lote, resultados, errores = await correccion_masiva.descargar(batch_id)
+    while lote.status != "completed":
+        await asyncio.sleep(0.05)
+        lote, resultados, errores = await correccion_masiva.descargar(batch_id)
+    assert not errores and list(resultados) == [solicitudes[0]["custom_id"]]
+
+    assert correccion_masiva.guardar_resultados(resultados) == 1
+    db.expire_all()
+    corregido = db.get(IntentoEvaluacion, intento.id)
+    assert corregido.retroalimentacion
+    assert corregido.puntaje_obtenido > 0
@@ -0,0 +1,64 @@
+import pytest
+
+import worker
+from evaluaciones import guardar_evaluacion
+from models import Evaluacion, Trabajo
+from trabajos import tomar_trabajo
+
+pytestmark = pytest.mark.anyio
+
+RESULTADO = {"nombre": "Reserva", "descripcion": "", "preguntas": []}
+
+@pytest.fixture
+def runs_rapidos(fake_openai, monkeypatch):
+    monkeypatch.setattr(fake_openai, "DURACION_RUN", 0.2)
+
+async def ejecutar_siguiente_trabajo(db, tipo):
+    trabajo = tomar_trabajo(db)
+    assert trabajo.tipo == tipo
+    await worker.ejecutar_trabajo(trabajo.id)
+    return trabajo.id
+
+async def test_evaluacion_de_la_reserva_se_entrega_de_inmediato(cliente, db, unidad):
+    reservada = guardar_evaluacion(db, unidad.id, 1, RESULTADO, en_reserva=True, version_corpus=unidad.version_corpus)
+
+    respuesta = await cliente.post(f"/evaluacion/unidad/{unidad.id}", params={"nivel": 1})
+    assert respuesta.status_code == 200, respuesta.text
+    assert respuesta.json()["id"] == reservada.id
+    assert db.query(Trabajo).filter(Trabajo.tipo == "generar_evaluacion").count() == 0
+
+async def test_sin_reserva_se_encola_la_generacion(cliente, db, unidad, runs_rapidos):
+    respuesta = await cliente.post(f"/evaluacion/unidad/{unidad.id}", params={"nivel": 1})
+    assert respuesta.status_code == 202, respuesta.text
+    trabajo = respuesta.json()
+    assert trabajo["tipo"] == "generar_evaluacion" and trabajo["estado"] == "pendiente"
+
+    assert await ejecutar_siguiente_trabajo(db, "generar_evaluacion") == trabajo["id"]
+    terminado = (await cliente.get(f"/trabajos/{trabajo['id']}")).json()
+    assert terminado["estado"] == "completado", terminado
+    generada = db.get(Evaluacion, terminado["resultado"]["id"])
+    assert generada.id_unidad == unidad.id and not generada.en_reserva
+
+async def test_responder_y_consultar_el_intento_hasta_que_se_corrige(cliente, db, unidad, runs_rapidos):
+    evaluacion = guardar_evaluacion(db, unidad.id, 1, RESULTADO)
+    envio = {
+        "id_evaluacion": evaluacion.id,
+        "id_usuario": 1,
+        "respuestas": [
+            {"id_pregunta": 1, "tipo": "desarrollo", "enunciado": "¿Dónde ocurre la fotosíntesis?",
+             "respuesta_usuario": "En los cloroplastos."},
+        ],
+    }
+    respuesta = await cliente.post(f"/evaluacion/{evaluacion.id}/responder", json=envio)
+    assert respuesta.status_code == 202, respuesta.text
+    datos = respuesta.json()
+    assert datos["tipo"] == "corregir_evaluacion"
+    intento_id = datos["intento"]["id"]
+
+    intento = (await cliente.get(f"/intentos/{intento_id}")).json()
+    assert intento["estado_correccion"] == "pendiente"
+
+    await ejecutar_siguiente_trabajo(db, "corregir_evaluacion")
+    intento = (await cliente.get(f"/intentos/{intento_id}")).json()
+    assert intento["estado_correccion"] == "completado", intento
+    assert intento["puntaje"] is not None
@@ -0,0 +1,45 @@
+import os
+
+import httpx
+import openai
+import pytest
+
+from API.API import client, generar_evaluacion_estructurada, generar_preguntas
+
+pytestmark = pytest.mark.anyio
+
+CONTEXTO = "La fotosíntesis ocurre en los cloroplastos y produce oxígeno."
+
+def assistant_con_herramientas():
+    return httpx.post(f"{os.environ['OPENAI_BASE_URL']}/assistants", json={
+        "model": "gpt-4o", "name": "prueba",
+        "tools": [{"type": "file_search"}, {"type": "code_interpreter"}]
+    }).json()["id"]
+
+async def test_json_schema_con_file_search_se_rechaza():
+    thread = await client.beta.threads.create(messages=[{"role": "user", "content": "hola"}])
+    formato = {"type": "json_schema", "json_schema": {"name": "x", "schema": {"type": "object"}, "strict": True}}
+    with pytest.raises(openai.BadRequestError):
+        await client.beta.threads.runs.create(
+            thread_id=thread.id, assistant_id=assistant_con_herramientas(), response_format=formato
+        )
+
+async def test_estructurada_funciona_con_assistant_con_herramientas():
+    evaluacion = await generar_evaluacion_estructurada(
+        assistant_con_herramientas(), vf=1, desarrollo=1, alternativas=1, dificultad="fácil", contexto=CONTEXTO
+    )
+    assert len(evaluacion["preguntas"]) == 3
+
+async def test_reintento_en_texto_usa_un_thread_nuevo(monkeypatch, fake_openai):
+    monkeypatch.setattr(fake_openai, "DURACION_RUN", 0.2)
+    simular = fake_openai.respuesta_simulada
+    respuestas = iter(["No encontré material para generar preguntas."])
+    monkeypatch.setattr(fake_openai, "respuesta_simulada", lambda prompt: next(respuestas, None) or simular(prompt))
+
+    threads_antes = set(fake_openai.threads)
+    texto, thread_id = await generar_preguntas(assistant_con_herramientas(), "1", "1", "1", "fácil", contexto=CONTEXTO)
+    assert "Pregunta_" in texto
+    nuevos = set(fake_openai.threads) - threads_antes
+    assert len(nuevos) == 2 and thread_id in nuevos
+    # El thread del intento que sirvió tiene solo el prompt y la respuesta
+    assert [m["role"] for m in fake_openai.mensajes[thread_id]] == ["user", "assistant"]
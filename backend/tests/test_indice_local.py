@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+
+from conftest import BACKEND
+
+import indice_local
+
+AGREGAR = """
+import sys
+from indice_local import indexar_fragmentos
+proceso = int(sys.argv[1])
+for corpus in range(5):
+    indexar_fragmentos(1, proceso * 100 + corpus, [f"fragmento {proceso} {corpus} fotosintesis cloroplasto"])
+"""
+
+def test_procesos_concurrentes_no_pierden_fragmentos(tmp_path, monkeypatch):
+    monkeypatch.setattr(indice_local, "CARPETA_INDICES", str(tmp_path))
+    entorno = {**os.environ, "CARPETA_INDICES": str(tmp_path)}
+    procesos = [subprocess.Popen([sys.executable, "-c", AGREGAR, str(i)], cwd=BACKEND, env=entorno) for i in range(4)]
+    assert [p.wait(60) for p in procesos] == [0] * 4
+
+    indice = indice_local.obtener_indice(1)
+    assert sorted(f["corpus_id"] for f in indice.fragmentos) == sorted(i * 100 + c for i in range(4) for c in range(5))
+    assert len(indice.buscar("fotosintesis", k=50)) == 20
+    # Sin temporales a medio escribir
+    assert sorted(os.listdir(tmp_path)) == ["unidad_1.json", "unidad_1.lock", "unidad_1.npz"]
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+import ingesta
+from API.API import vincular_archivo
+from ingesta import actualizar_estados_ingesta, esperar_corpus_listo, estado_corpus_unidad
+from models import Corpus, EstadoIngesta
+
+pytestmark = pytest.mark.anyio
+
+async def agregar_corpus(db, unidad, fake_openai, monkeypatch, file_id, vincular=True):
+    monkeypatch.setitem(fake_openai.archivos, file_id, {"id": file_id, "object": "file", "bytes": 10})
+    if vincular:
+        await vincular_archivo(unidad.vector_id, file_id)
+    corpus = Corpus(nombre=f"{file_id}.txt", material=file_id, id_unidad=unidad.id)
+    db.add(corpus)
+    db.commit()
+    return corpus
+
+async def test_corpus_pasa_de_pendiente_a_listo(db, unidad, fake_openai, monkeypatch):
+    monkeypatch.setattr(fake_openai, "DURACION_INGESTA", 0.5)
+    corpus = await agregar_corpus(db, unidad, fake_openai, monkeypatch, "file_ingesta")
+    assert corpus.estado == EstadoIngesta.pendiente
+    assert not estado_corpus_unidad(db, unidad.id)["listo"]
+
+    # El vector store todavía lo está indexando
+    await actualizar_estados_ingesta(db)
+    assert corpus.estado == EstadoIngesta.procesando
+    assert estado_corpus_unidad(db, unidad.id)["conteo"]["procesando"] == 1
+
+    await asyncio.sleep(0.6)
+    await actualizar_estados_ingesta(db)
+    assert corpus.estado == EstadoIngesta.listo
+    estado = estado_corpus_unidad(db, unidad.id)
+    assert estado["listo"] and estado["archivos"][0]["estado"] == "listo"
+
+async def test_corpus_que_no_esta_en_el_vector_queda_fallido(db, unidad, fake_openai, monkeypatch):
+    monkeypatch.setattr(fake_openai, "DURACION_INGESTA", 0.5)
+    monkeypatch.setattr(ingesta, "INTERVALO_ESTADO_INGESTA", 0.1)
+    await agregar_corpus(db, unidad, fake_openai, monkeypatch, "file_en_proceso")
+    perdido = await agregar_corpus(db, unidad, fake_openai, monkeypatch, "file_perdido", vincular=False)
+
+    await actualizar_estados_ingesta(db)
+    assert perdido.estado == EstadoIngesta.fallido
+    assert perdido.error_ingesta
+    # Un corpus terminado (aunque haya fallado) no se vuelve a consultar
+    assert await esperar_corpus_listo(unidad.id, plazo=5)
+    db.expire_all()
+    assert db.get(Corpus, perdido.id).estado == EstadoIngesta.fallido
+    assert estado_corpus_unidad(db, unidad.id)["conteo"] == {"pendiente": 0, "procesando": 0, "listo": 1, "fallido": 1}
+
+async def test_esperar_corpus_listo_vence_el_plazo(db, unidad, fake_openai, monkeypatch):
+    monkeypatch.setattr(fake_openai, "DURACION_INGESTA", 30)
+    await agregar_corpus(db, unidad, fake_openai, monkeypatch, "file_lento")
+    assert not await esperar_corpus_listo(unidad.id, plazo=0)
@@ -0,0 +1,55 @@
+import pytest
+
+import worker
+from evaluaciones import guardar_evaluacion
+from models import Trabajo, VF
+from trabajos import tomar_trabajo
+
+pytestmark = pytest.mark.anyio
+
+RESULTADO = {"nombre": "Dos fases", "descripcion": "", "preguntas": [
+    {"tipo": "vf", "enunciado": "La fotosíntesis libera oxígeno.", "correcta": "V"},
+]}
+
+def envio(evaluacion, db, con_desarrollo=True):
+    vf = db.query(VF).one()
+    respuestas = [{"id_pregunta": vf.id, "tipo": "vf", "enunciado": vf.enunciado, "respuesta_usuario": "v"}]
+    if con_desarrollo:
+        respuestas.append({"id_pregunta": 1, "tipo": "desarrollo", "enunciado": "¿Dónde ocurre la fotosíntesis?",
+                           "respuesta_usuario": "En los cloroplastos."})
+    return {"id_evaluacion": evaluacion.id, "id_usuario": 1, "respuestas": respuestas}
+
+async def test_sin_desarrollo_el_intento_se_completa_al_responder(cliente, db, unidad):
+    evaluacion = guardar_evaluacion(db, unidad.id, 1, RESULTADO)
+
+    respuesta = await cliente.post(f"/evaluacion/{evaluacion.id}/responder", json=envio(evaluacion, db, con_desarrollo=False))
+    assert respuesta.status_code == 200, respuesta.text
+    intento = respuesta.json()["intento"]
+    assert intento["estado_correccion"] == "completado" and intento["puntaje"] == 100
+    assert db.query(Trabajo).count() == 0
+
+async def test_intento_conserva_el_puntaje_parcial_si_falla_la_correccion(cliente, db, unidad, monkeypatch):
+    async def fallar(**kwargs):
+        raise RuntimeError("OpenAI no responde")
+    monkeypatch.setattr(worker, "corregir_evaluacion", fallar)
+    evaluacion = guardar_evaluacion(db, unidad.id, 1, RESULTADO)
+
+    respuesta = await cliente.post(f"/evaluacion/{evaluacion.id}/responder", json=envio(evaluacion, db))
+    assert respuesta.status_code == 202, respuesta.text
+    datos = respuesta.json()
+    # El VF correcto ya cuenta: 1 punto de 3 (el desarrollo pesa 2)
+    parcial = datos["parcial"]["cumplimiento"]
+    assert 0 < parcial < 100 and datos["intento"]["puntaje"] == parcial
+    intento_id = datos["intento"]["id"]
+
+    for estado in ("pendiente", "fallido"):
+        # El worker cambia el trabajo en su propia sesión
+        db.expire_all()
+        trabajo = tomar_trabajo(db)
+        await worker.ejecutar_trabajo(trabajo.id)
+        intento = (await cliente.get(f"/intentos/{intento_id}")).json()
+        # Con reintentos pendientes sigue esperando; al agotarlos queda fallido
+        assert intento["estado_correccion"] == estado, intento
+        assert intento["puntaje"] == parcial
+    db.expire_all()
+    assert tomar_trabajo(db) is None
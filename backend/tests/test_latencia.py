@@ -0,0 +1,31 @@
+import asyncio
+import time
+
+import pytest
+
+from conftest import DURACION_RUN
+
+pytestmark = pytest.mark.anyio
+
+PAUSA = 0.05
+
+async def test_generacion_lenta_no_bloquea_otras_consultas(cliente, unidad):
+    inicio = time.perf_counter()
+    generacion = asyncio.create_task(cliente.post(f"/evaluacion/unidad/{unidad.id}/stream", params={"nivel": 1}))
+
+    # Mientras dura la generación se consulta un endpoint barato; la pausa entre
+    # consultas también se mide, así un bloqueo del event loop aparece como latencia
+    latencias = []
+    while not generacion.done():
+        antes = time.perf_counter()
+        await asyncio.sleep(PAUSA)
+        respuesta = await cliente.get("/cursos/1")
+        latencias.append(time.perf_counter() - antes - PAUSA)
+        assert respuesta.status_code == 200, respuesta.text
+
+    respuesta = generacion.result()
+    assert respuesta.status_code == 200
+    assert "event: fin" in respuesta.text, respuesta.text
+    assert time.perf_counter() - inicio >= DURACION_RUN
+    assert len(latencias) > 5
+    assert max(latencias) < DURACION_RUN / 4, latencias
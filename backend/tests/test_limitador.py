@@ -0,0 +1,102 @@
+import asyncio
+import os
+import time
+
+import httpx
+import pytest
+
+from API import API
+from API.API import AlmacenMemoria, AlmacenSQLite, PlanificadorOpenAI, _estado_inicial, _tomar, pausa_pedida
+
+pytestmark = pytest.mark.anyio
+
+def _planificador(almacen, capacidad, nivel):
+    planificador = PlanificadorOpenAI(almacen)
+    cubeta = almacen.estado["cubetas"]["solicitudes"]
+    cubeta.update(capacidad=capacidad, nivel=nivel, actualizado=time.time())
+    return planificador
+
+def test_reserva_deja_margen_a_las_clases_urgentes():
+    estado = _estado_inicial()
+    estado["cubetas"]["solicitudes"].update(capacidad=100, nivel=20, actualizado=time.time())
+    pedido = {"solicitudes": 1}
+
+    # La provisión no puede bajar del 25 % de la cubeta; la corrección sí
+    assert _tomar(estado, time.time(), pedido, API.RESERVAS[2]) > 0
+    assert estado["cubetas"]["solicitudes"]["nivel"] == pytest.approx(20, abs=0.1)
+    assert _tomar(estado, time.time(), pedido, API.RESERVAS[0]) == 0
+    assert estado["cubetas"]["solicitudes"]["nivel"] == pytest.approx(19, abs=0.1)
+
+def test_pausa_pedida_por_429():
+    assert pausa_pedida(httpx.Headers({"retry-after-ms": "1500", "retry-after": "9"})) == 1.5
+    assert pausa_pedida(httpx.Headers({"retry-after": "3"})) == 3
+    assert pausa_pedida(httpx.Headers({})) == API.pausa_429
+
+async def test_atiende_primero_la_clase_mas_urgente(monkeypatch):
+    monkeypatch.setattr(API, "RESERVAS", {0: 0.0, 1: 0.0, 2: 0.0})
+    # 600 por minuto y la cubeta vacía: se libera una solicitud cada 0,1 s
+    planificador = _planificador(AlmacenMemoria(), 600, 0)
+    atendidas = []
+
+    async def pedir(prioridad):
+        await planificador.adquirir(prioridad, {"solicitudes": 1})
+        atendidas.append(prioridad)
+
+    tareas = [asyncio.create_task(pedir(2))]
+    await asyncio.sleep(0.01)
+    tareas += [asyncio.create_task(pedir(1)), asyncio.create_task(pedir(0))]
+    await asyncio.gather(*tareas)
+    assert atendidas == [0, 1, 2]
+
+async def test_ajuste_de_tokens_no_se_pierde_si_falla_el_almacen():
+    class AlmacenQueFalla(AlmacenMemoria):
+        fallar = True
+
+        async def aplicar(self, cambio):
+            if self.fallar:
+                raise RuntimeError("database is locked")
+            return await super().aplicar(cambio)
+
+    almacen = AlmacenQueFalla()
+    almacen.estado["cubetas"]["tokens"].update(capacidad=10000, nivel=10000, actualizado=time.time())
+    planificador = PlanificadorOpenAI(almacen)
+    planificador.ajustar_tokens(3000)
+
+    with pytest.raises(RuntimeError):
+        await planificador.registrar_respuesta({})
+    almacen.fallar = False
+    await planificador.registrar_respuesta({})
+    assert almacen.estado["cubetas"]["tokens"]["nivel"] == pytest.approx(7000, abs=5)
+
+async def test_almacen_sqlite_compartido_entre_planificadores(monkeypatch, tmp_path):
+    monkeypatch.setattr(API, "solicitudes_por_minuto", 600)
+    ruta = str(tmp_path / "limite.db")
+    uno, otro = PlanificadorOpenAI(AlmacenSQLite(ruta)), PlanificadorOpenAI(AlmacenSQLite(ruta))
+
+    # Uno agota el presupuesto del minuto; el otro proceso tiene que esperar
+    assert await uno.adquirir(0, {"solicitudes": 600}) == 0
+    assert (await otro.estado())["cubetas"]["solicitudes"]["disponible"] < 2
+    espera = await otro.adquirir(0, {"solicitudes": 1})
+    assert espera >= 0.05
+
+async def test_429_pausa_las_solicitudes_siguientes(monkeypatch, fake_openai):
+    planificador = PlanificadorOpenAI(AlmacenMemoria())
+    monkeypatch.setattr(API, "planificador", planificador)
+    monkeypatch.setattr(API, "RESERVAS", {0: 0.0, 1: 0.0, 2: 0.0})
+    # 60 por minuto y 0,7 solicitudes en la cubeta del servidor: la primera recibe
+    # un 429 con retry-after-ms de 300 ms
+    monkeypatch.setattr(fake_openai, "SOLICITUDES_POR_MINUTO", 60)
+    monkeypatch.setattr(fake_openai, "_cubeta", [0.7, time.monotonic()])
+    antes = fake_openai.respuestas_429
+
+    hooks = {"request": [API.limitar_solicitud], "response": [API.registrar_limites]}
+    async with httpx.AsyncClient(base_url=os.environ["OPENAI_BASE_URL"], event_hooks=hooks) as cliente:
+        primera = await cliente.get("/models")
+        assert primera.status_code == 429
+        assert (await planificador.estado())["pausa"] > 0.2
+
+        inicio = time.monotonic()
+        segunda = await cliente.get("/models")
+        assert time.monotonic() - inicio >= 0.25
+    assert segunda.status_code != 429
+    assert fake_openai.respuestas_429 == antes + 1
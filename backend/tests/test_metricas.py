@@ -0,0 +1,32 @@
+import asyncio
+import threading
+
+import pytest
+
+import metricas
+from API.API import sumar_metrica
+from metricas import leer_contadores
+
+pytestmark = pytest.mark.anyio
+
+async def test_volcado_periodico_no_bloquea_el_event_loop(db, monkeypatch):
+    monkeypatch.setattr(metricas, "INTERVALO_METRICAS", 0.01)
+    hilos = []
+    volcar = metricas.volcar_metricas_llm
+
+    def volcar_registrando():
+        volcar()
+        hilos.append(threading.current_thread())
+    monkeypatch.setattr(metricas, "volcar_metricas_llm", volcar_registrando)
+
+    sumar_metrica("llm.grade.reintentos", 2)
+    tarea = asyncio.create_task(metricas.volcar_metricas_periodicamente())
+    try:
+        while not hilos:
+            await asyncio.sleep(0.01)
+    finally:
+        tarea.cancel()
+
+    assert threading.main_thread() not in hilos
+    db.expire_all()
+    assert leer_contadores(db, "llm.grade.")["llm.grade.reintentos"] >= 2
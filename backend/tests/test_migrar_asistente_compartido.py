@@ -0,0 +1,31 @@
+import os
+
+import httpx
+import pytest
+
+from API.API import obtener_assistant_compartido
+from migrar_asistente_compartido import migrar
+from models import ParAsistente, Unidad
+
+pytestmark = pytest.mark.anyio
+
+async def test_migrar_pasa_unidades_y_reserva_al_assistant_compartido(db, unidad, fake_openai):
+    propio, vector = unidad.assistant_id, unidad.vector_id
+    de_reserva = httpx.post(f"{os.environ['OPENAI_BASE_URL']}/assistants", json={"model": "gpt-4o", "name": "reserva"}).json()["id"]
+    db.add(ParAsistente(assistant_id=de_reserva, vector_id="vs_reserva"))
+    db.commit()
+
+    await migrar(simular=True)
+    db.expire_all()
+    assert db.get(Unidad, unidad.id).assistant_id == propio
+
+    await migrar(simular=False)
+    db.expire_all()
+    compartido = await obtener_assistant_compartido()
+    migrada = db.get(Unidad, unidad.id)
+    assert migrada.assistant_id == compartido
+    assert migrada.vector_id == vector
+    assert db.query(ParAsistente).one().assistant_id == compartido
+    # Los assistants propios se borran; el compartido queda
+    assert propio not in fake_openai.assistants and de_reserva not in fake_openai.assistants
+    assert compartido in fake_openai.assistants
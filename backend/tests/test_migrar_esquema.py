@@ -0,0 +1,38 @@
+from sqlalchemy import create_engine, inspect, text
+
+from database import Base
+from migrar_esquema import COLUMNAS_NUEVAS, migrar
+
+def base_antigua(ruta):
+    """
+    Base con las tablas como estaban antes de agregar COLUMNAS_NUEVAS.
+    """
+    motor = create_engine(f"sqlite:///{ruta}")
+    nuevas = set(COLUMNAS_NUEVAS)
+    with motor.begin() as conexion:
+        for tabla in Base.metadata.sorted_tables:
+            columnas = [c for c in tabla.columns if (tabla.name, c.name) not in nuevas]
+            definicion = ", ".join(f"{c.name} {c.type.compile(dialect=motor.dialect)}" for c in columnas)
+            conexion.execute(text(f"CREATE TABLE {tabla.name} ({definicion})"))
+    return motor
+
+def test_agrega_las_columnas_que_faltan_una_sola_vez(tmp_path):
+    motor = base_antigua(tmp_path / "antigua.db")
+    assert migrar(motor, mostrar=True)
+
+    migrar(motor)
+    inspector = inspect(motor)
+    for tabla, columna in COLUMNAS_NUEVAS:
+        assert columna in {c["name"] for c in inspector.get_columns(tabla)}
+    assert "uq_trabajo_clave" in {i["name"] for i in inspector.get_indexes("trabajo")}
+    assert migrar(motor) == []
+
+    with motor.begin() as conexion:
+        conexion.execute(text("INSERT INTO unidad (id, nombre, id_curso) VALUES (1, 'U', 1)"))
+        assert conexion.execute(text("SELECT version_corpus FROM unidad")).scalar() == 0
+
+def test_mostrar_no_cambia_la_base(tmp_path):
+    motor = base_antigua(tmp_path / "antigua.db")
+    sentencias = migrar(motor, mostrar=True)
+    assert any("ALTER TABLE unidad ADD COLUMN version_corpus INTEGER DEFAULT 0 NOT NULL" == s for s in sentencias)
+    assert migrar(motor, mostrar=True) == sentencias
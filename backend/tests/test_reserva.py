@@ -0,0 +1,56 @@
+import pytest
+
+import evaluaciones
+from evaluaciones import guardar_evaluacion, invalidar_reserva, tomar_de_reserva, programar_relleno, rellenar_reserva
+from models import Corpus, EstadoIngesta, EstadoTrabajo, Evaluacion, Trabajo, Unidad
+from trabajos import completar_trabajo, tomar_trabajo
+
+RESULTADO = {"nombre": "Reserva", "descripcion": "", "preguntas": []}
+
+def test_invalidar_reserva_sube_la_version_en_la_base(db, unidad):
+    invalidar_reserva(db, unidad.id)
+    invalidar_reserva(db, unidad.id)
+    db.expire_all()
+    assert db.get(Unidad, unidad.id).version_corpus == 2
+
+def test_no_se_entrega_una_evaluacion_de_un_corpus_anterior(db, unidad):
+    # Otro proceso la terminó de generar después de que el corpus cambiara
+    invalidar_reserva(db, unidad.id)
+    vieja = guardar_evaluacion(db, unidad.id, 1, RESULTADO, en_reserva=True, version_corpus=0)
+    assert tomar_de_reserva(db, unidad.id, 1) is None
+    assert db.get(Evaluacion, vieja.id).en_reserva
+
+    actual = guardar_evaluacion(db, unidad.id, 1, RESULTADO, en_reserva=True, version_corpus=1)
+    assert tomar_de_reserva(db, unidad.id, 1).id == actual.id
+
+def test_relleno_se_encola_una_sola_vez_por_unidad_y_nivel(db, unidad, monkeypatch):
+    monkeypatch.setattr(evaluaciones, "RESERVA_EVALUACIONES", 2)
+    # Varios procesos web piden el mismo relleno
+    programar_relleno(db, unidad.id, [1])
+    programar_relleno(db, unidad.id, [1, 2])
+    assert sorted(t.clave for t in db.query(Trabajo)) == ["rellenar_reserva:1:1", "rellenar_reserva:1:2"]
+
+    # Al terminar el relleno se puede volver a encolar
+    trabajo = tomar_trabajo(db)
+    assert trabajo.clave == "rellenar_reserva:1:1"
+    assert completar_trabajo(db, trabajo, {"generadas": 0})
+    programar_relleno(db, unidad.id, [1])
+    assert db.query(Trabajo).filter(Trabajo.tipo == "rellenar_reserva").count() == 3
+
+def test_los_rellenos_van_despues_de_los_trabajos_de_usuarios(db, unidad, monkeypatch):
+    monkeypatch.setattr(evaluaciones, "RESERVA_EVALUACIONES", 2)
+    programar_relleno(db, unidad.id, [1])
+    db.add(Trabajo(tipo="generar_evaluacion", parametros="{}", estado=EstadoTrabajo.pendiente))
+    db.commit()
+    assert tomar_trabajo(db).tipo == "generar_evaluacion"
+    assert tomar_trabajo(db).tipo == "rellenar_reserva"
+
+@pytest.mark.anyio
+async def test_rellenar_reserva_llega_a_la_marca(db, unidad, monkeypatch):
+    monkeypatch.setattr(evaluaciones, "RESERVA_EVALUACIONES", 2)
+    db.add(Corpus(nombre="apunte.txt", material="file-x", id_unidad=unidad.id, estado=EstadoIngesta.listo))
+    db.commit()
+
+    assert await rellenar_reserva(db, unidad.id, 1) == 2
+    assert await rellenar_reserva(db, unidad.id, 1) == 0
+    assert db.query(Evaluacion).filter(Evaluacion.en_reserva == True).count() == 2
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+import reserva_asistentes
+from database import SessionLocal
+from models import BorradoPendiente, ParAsistente
+from reserva_asistentes import guardar_en_reserva, pares_en_reserva, rellenar_reserva_asistentes
+
+pytestmark = pytest.mark.anyio
+
+async def test_relleno_llega_al_tope_de_la_reserva(db, monkeypatch):
+    monkeypatch.setattr(reserva_asistentes, "RESERVA_ASISTENTES", 2)
+    await rellenar_reserva_asistentes()
+    await rellenar_reserva_asistentes()
+    assert pares_en_reserva(db) == 2
+
+async def test_par_que_sobra_se_registra_para_borrar(db, monkeypatch):
+    monkeypatch.setattr(reserva_asistentes, "RESERVA_ASISTENTES", 1)
+    db.add(ParAsistente(assistant_id="asst_1", vector_id="vs_1"))
+    db.commit()
+
+    # Otro proceso llenó la reserva mientras este creaba su par
+    assert not guardar_en_reserva(db, "asst_2", "vs_2")
+    assert pares_en_reserva(db) == 1
+    borrados = {(b.tipo, b.recurso_id) for b in db.query(BorradoPendiente)}
+    assert borrados == {("assistant", "asst_2"), ("vector", "vs_2")}
+
+async def test_relleno_corre_despues_del_commit_que_toma_el_par(cliente, db, unidad, monkeypatch):
+    monkeypatch.setattr(reserva_asistentes, "RESERVA_ASISTENTES", 2)
+    db.add_all([ParAsistente(assistant_id=unidad.assistant_id, vector_id=f"vs_reserva_{i}") for i in range(2)])
+    db.commit()
+
+    vistos = []
+
+    async def contar_al_rellenar():
+        sesion = SessionLocal()
+        try:
+            vistos.append(pares_en_reserva(sesion))
+        finally:
+            sesion.close()
+    monkeypatch.setattr(reserva_asistentes, "rellenar_reserva_asistentes", contar_al_rellenar)
+
+    respuesta = await cliente.post("/cursos/", json={"nombre": "Curso nuevo", "id_usuario": 1})
+    assert respuesta.status_code == 200, respuesta.text
+    while not vistos:
+        await asyncio.sleep(0.01)
+    # El relleno ya ve la reserva sin el par tomado
+    assert vistos == [1]
@@ -0,0 +1,78 @@
+import asyncio
+import os
+from datetime import datetime
+
+import httpx
+import openai
+import pytest
+
+import worker
+from API import API
+from API.API import client, ejecutar_run
+from trabajos import TrabajoInterrumpido, encolar_trabajo
+
+pytestmark = pytest.mark.anyio
+
+def assistant():
+    return httpx.post(f"{os.environ['OPENAI_BASE_URL']}/assistants", json={"model": "gpt-4o", "name": "prueba"}).json()["id"]
+
+def runs_del_thread(fake, thread_id):
+    return [r for r in fake.runs.values() if r["thread_id"] == thread_id]
+
+async def test_stream_cortado_antes_del_primer_evento_no_crea_otro_run(monkeypatch, fake_openai):
+    crear = client.beta.threads.runs.create
+
+    async def crear_y_cortar(**kwargs):
+        respuesta = await crear(**kwargs)
+        if kwargs.get("stream"):
+            # El run quedó creado en el servidor pero la conexión se cae
+            await respuesta.close()
+            raise openai.APIConnectionError(request=httpx.Request("POST", "http://prueba"))
+        return respuesta
+    monkeypatch.setattr(client.beta.threads.runs, "create", crear_y_cortar)
+
+    thread = await client.beta.threads.create(messages=[{"role": "user", "content": "hola"}])
+    run = await ejecutar_run(thread.id, assistant())
+    assert run.status == "completed"
+    assert len(runs_del_thread(fake_openai, thread.id)) == 1
+
+async def test_error_de_la_api_no_se_reintenta_con_otro_run(monkeypatch, fake_openai):
+    async def crear_y_fallar(**kwargs):
+        raise openai.APIStatusError("falla", response=httpx.Response(500, request=httpx.Request("POST", "http://prueba")), body=None)
+    monkeypatch.setattr(client.beta.threads.runs, "create", crear_y_fallar)
+
+    thread = await client.beta.threads.create(messages=[{"role": "user", "content": "hola"}])
+    with pytest.raises(openai.APIStatusError):
+        await ejecutar_run(thread.id, assistant())
+    assert runs_del_thread(fake_openai, thread.id) == []
+
+def runs_cancelados():
+    return API._metricas.get("llm.otras.runs_cancelados", 0)
+
+async def test_cancelar_la_tarea_cancela_el_run_en_openai(fake_openai):
+    thread = await client.beta.threads.create(messages=[{"role": "user", "content": "hola"}])
+    antes = runs_cancelados()
+    tarea = asyncio.create_task(ejecutar_run(thread.id, assistant()))
+    while not runs_del_thread(fake_openai, thread.id):
+        await asyncio.sleep(0.05)
+
+    # El cliente se desconecta mientras el run sigue en curso
+    tarea.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await tarea
+    [run] = runs_del_thread(fake_openai, thread.id)
+    assert run["status"] == "cancelled"
+    assert runs_cancelados() == antes + 1
+
+async def test_plazo_vencido_del_trabajo_cancela_el_run(db, fake_openai, monkeypatch):
+    monkeypatch.setitem(worker.PLAZOS_TRABAJO, "corregir_evaluacion", 0.5)
+    trabajo = encolar_trabajo(db, "corregir_evaluacion", {})
+    trabajo.creado = datetime.utcnow()
+    thread = await client.beta.threads.create(messages=[{"role": "user", "content": "hola"}])
+    antes = runs_cancelados()
+
+    with pytest.raises(TrabajoInterrumpido, match="Venció el plazo"):
+        await worker.con_plazo_y_cancelacion(trabajo, ejecutar_run(thread.id, assistant()))
+    [run] = runs_del_thread(fake_openai, thread.id)
+    assert run["status"] == "cancelled"
+    assert runs_cancelados() == antes + 1
@@ -0,0 +1,54 @@
+import asyncio
+import datetime
+
+import pytest
+
+import worker
+from models import EstadoTrabajo, Trabajo
+from trabajos import (recuperar_trabajos_colgados, cancelar_trabajo, completar_trabajo, fallar_trabajo,
+                      CANCELADO_POR_CLIENTE)
+
+pytestmark = pytest.mark.anyio
+
+def trabajo_en_proceso(db, tipo="corregir_evaluacion"):
+    antiguo = datetime.datetime.utcnow() - datetime.timedelta(minutes=20)
+    trabajo = Trabajo(tipo=tipo, parametros="{}", estado=EstadoTrabajo.en_proceso, intentos=1,
+                      creado=datetime.datetime.utcnow(), actualizado=antiguo)
+    db.add(trabajo)
+    db.commit()
+    return trabajo
+
+async def test_trabajo_largo_late_y_no_se_recupera_como_colgado(db, monkeypatch):
+    monkeypatch.setattr(worker, "INTERVALO_CANCELACION", 0.05)
+    trabajo = trabajo_en_proceso(db)
+
+    async def correccion_larga():
+        await asyncio.sleep(0.3)
+        return "ok"
+
+    assert await worker.con_plazo_y_cancelacion(trabajo, correccion_larga()) == "ok"
+    assert recuperar_trabajos_colgados(db, 15) == 0
+    db.expire_all()
+    assert db.get(Trabajo, trabajo.id).estado == EstadoTrabajo.en_proceso
+
+async def test_trabajo_sin_latido_vuelve_a_la_cola(db):
+    trabajo = trabajo_en_proceso(db)
+    assert recuperar_trabajos_colgados(db, 15) == 1
+    db.expire_all()
+    assert db.get(Trabajo, trabajo.id).estado == EstadoTrabajo.pendiente
+
+async def test_completar_no_pisa_una_cancelacion(db):
+    trabajo = trabajo_en_proceso(db, "generar_evaluacion")
+    cancelar_trabajo(db, trabajo)
+
+    assert not completar_trabajo(db, trabajo, {"id": 1})
+    assert not fallar_trabajo(db, trabajo, "error del run", max_intentos=2)
+    assert trabajo.estado == EstadoTrabajo.fallido
+    assert trabajo.error == CANCELADO_POR_CLIENTE
+    assert trabajo.resultado is None
+
+async def test_cancelar_no_cambia_un_trabajo_terminado(db):
+    trabajo = trabajo_en_proceso(db, "generar_evaluacion")
+    assert completar_trabajo(db, trabajo, {"id": 1})
+    assert not cancelar_trabajo(db, trabajo)
+    assert trabajo.estado == EstadoTrabajo.completado
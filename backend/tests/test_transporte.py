@@ -0,0 +1,25 @@
+import time
+
+import openai
+import pytest
+
+from API import API
+
+pytestmark = pytest.mark.anyio
+
+def test_timeouts_por_operacion(monkeypatch):
+    monkeypatch.setenv("OPENAI_TIMEOUT_CONEXION", "3")
+    timeout = API._timeout(15)
+    assert (timeout.connect, timeout.read, timeout.write, timeout.pool) == (3, 15, 15, 6)
+    assert API.TIMEOUTS["consulta"].read < API.TIMEOUTS["default"].read < API.TIMEOUTS["subida"].read
+
+async def test_consulta_lenta_corta_con_su_timeout(unidad, fake_openai, monkeypatch):
+    # El servidor tarda más que el timeout de las consultas de estado, no que el de por defecto
+    monkeypatch.setattr(fake_openai, "LATENCIA", 2)
+    monkeypatch.setitem(API.TIMEOUTS, "consulta", API._timeout(0.2))
+    monkeypatch.setattr(API, "client", API.client.with_options(max_retries=0))
+
+    inicio = time.monotonic()
+    with pytest.raises(openai.APITimeoutError):
+        await API.conteo_archivos_vector(unidad.vector_id)
+    assert time.monotonic() - inicio < 1
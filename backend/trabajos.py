@@ -0,0 +1,148 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from models import Trabajo, EstadoTrabajo
+import datetime
+import json
+
+# -----------------------
+# Cola de trabajos en la base de datos
+# -----------------------
+def encolar_trabajo(db: Session, tipo: str, parametros: dict, clave: str = None):
+    """
+    Registra un trabajo pendiente para que lo ejecute worker.py.
+    Con `clave` no se encola si ya hay un trabajo pendiente o en proceso con la
+    misma clave (la columna es única): devuelve None.
+    """
+    trabajo = Trabajo(
+        tipo=tipo,
+        parametros=json.dumps(parametros),
+        estado=EstadoTrabajo.pendiente,
+        clave=clave
+    )
+    db.add(trabajo)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    db.refresh(trabajo)
+    return trabajo
+
+def tomar_trabajo(db: Session):
+    """
+    Toma el trabajo pendiente más antiguo y lo marca en proceso; los rellenos
+    de la reserva van después de los que espera un usuario.
+    SKIP LOCKED permite correr varios workers sin que tomen el mismo trabajo.
+    """
+    trabajo = (
+        db.query(Trabajo)
+        .filter(Trabajo.estado == EstadoTrabajo.pendiente)
+        .order_by(Trabajo.tipo == "rellenar_reserva", Trabajo.id)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if not trabajo:
+        db.commit()
+        return None
+
+    trabajo.estado = EstadoTrabajo.en_proceso
+    trabajo.intentos += 1
+    db.commit()
+    db.refresh(trabajo)
+    return trabajo
+
+def _cambiar_si_sigue(db: Session, trabajo: Trabajo, estados: tuple, cambios: dict):
+    """
+    UPDATE condicional: aplica `cambios` solo si el trabajo sigue en uno de
+    `estados` (así no se pisa, p. ej., una cancelación del cliente que llegó
+    mientras el worker terminaba). Devuelve True si se aplicó.
+    """
+    filas = (
+        db.query(Trabajo)
+        .filter(Trabajo.id == trabajo.id, Trabajo.estado.in_(estados))
+        .update(cambios, synchronize_session=False)
+    )
+    db.commit()
+    db.refresh(trabajo)
+    return filas == 1
+
+def completar_trabajo(db: Session, trabajo: Trabajo, resultado: dict):
+    """
+    Marca el trabajo completado si sigue en proceso. Devuelve False si ya no lo
+    estaba (el cliente lo canceló): se mantiene cancelado.
+    """
+    return _cambiar_si_sigue(db, trabajo, (EstadoTrabajo.en_proceso,), {
+        Trabajo.estado: EstadoTrabajo.completado,
+        Trabajo.resultado: json.dumps(resultado),
+        Trabajo.error: None,
+        Trabajo.clave: None,
+    })
+
+def fallar_trabajo(db: Session, trabajo: Trabajo, error: str, max_intentos: int = 1):
+    """
+    Marca el trabajo como fallido, o lo devuelve a la cola si le quedan intentos.
+    Solo si sigue en proceso; devuelve False si no (p. ej. ya estaba cancelado).
+    """
+    if trabajo.intentos < max_intentos:
+        cambios = {Trabajo.estado: EstadoTrabajo.pendiente, Trabajo.error: error}
+    else:
+        cambios = {Trabajo.estado: EstadoTrabajo.fallido, Trabajo.error: error, Trabajo.clave: None}
+    return _cambiar_si_sigue(db, trabajo, (EstadoTrabajo.en_proceso,), cambios)
+
+# Error guardado en los trabajos que canceló el cliente
+CANCELADO_POR_CLIENTE = "Cancelado por el cliente"
+
+class TrabajoInterrumpido(Exception):
+    """
+    El trabajo se detuvo porque el cliente lo canceló o venció su plazo: no se reintenta.
+    """
+
+def cancelar_trabajo(db: Session, trabajo: Trabajo):
+    """
+    Marca el trabajo como fallido por cancelación. Si está pendiente ningún
+    worker lo toma; si está en proceso, el worker lo ve en su próxima
+    revisión (ver trabajo_cancelado) y cancela el run en OpenAI.
+    Un trabajo ya terminado no cambia.
+    """
+    return _cambiar_si_sigue(db, trabajo, (EstadoTrabajo.pendiente, EstadoTrabajo.en_proceso), {
+        Trabajo.estado: EstadoTrabajo.fallido,
+        Trabajo.error: CANCELADO_POR_CLIENTE,
+        Trabajo.clave: None,
+    })
+
+def latir_trabajo(db: Session, trabajo_id: int):
+    """
+    Renueva `actualizado` mientras el trabajo sigue en proceso: recuperar_trabajos_colgados
+    solo devuelve a la cola los que dejaron de latir (su worker murió).
+    """
+    db.query(Trabajo).filter(Trabajo.id == trabajo_id, Trabajo.estado == EstadoTrabajo.en_proceso).update(
+        {Trabajo.actualizado: datetime.datetime.utcnow()}, synchronize_session=False
+    )
+    db.commit()
+
+def trabajo_cancelado(db: Session, trabajo_id: int):
+    estado, error = db.query(Trabajo.estado, Trabajo.error).filter(Trabajo.id == trabajo_id).one()
+    return estado == EstadoTrabajo.fallido and error == CANCELADO_POR_CLIENTE
+
+def recuperar_trabajos_colgados(db: Session, minutos: int):
+    """
+    Devuelve a la cola los trabajos en proceso de un worker que murió: los que
+    llevan `minutos` sin latido (ver latir_trabajo).
+    """
+    limite = datetime.datetime.utcnow() - datetime.timedelta(minutes=minutos)
+    cantidad = (
+        db.query(Trabajo)
+        .filter(Trabajo.estado == EstadoTrabajo.en_proceso, Trabajo.actualizado < limite)
+        .update({Trabajo.estado: EstadoTrabajo.pendiente}, synchronize_session=False)
+    )
+    db.commit()
+    return cantidad
+
+def trabajo_a_dict(trabajo: Trabajo):
+    return {
+        "id": trabajo.id,
+        "tipo": trabajo.tipo,
+        "estado": trabajo.estado.value,
+        "resultado": json.loads(trabajo.resultado) if trabajo.resultado else None,
+        "error": trabajo.error
+    }
@@ -0,0 +1,224 @@
+# worker.py
+# Ejecuta los trabajos de IA (generación y corrección) fuera de los workers web.
+# Uso (dentro de backend, igual que main.py):
+#   python worker.py
+from database import SessionLocal
+from models import Unidad, Evaluacion, IntentoEvaluacion, Trabajo, EstadoTrabajo
+from trabajos import (tomar_trabajo, completar_trabajo, fallar_trabajo, recuperar_trabajos_colgados, trabajo_cancelado,
+                      latir_trabajo, TrabajoInterrumpido, CANCELADO_POR_CLIENTE)
+from evaluaciones import (tomar_de_reserva, generar_resultado, guardar_evaluacion, evaluacion_a_dict, registrar_intento,
+                          completar_intento, fallar_intento, version_contenido, rellenar_reserva, programar_relleno_general)
+from cache_correccion import cache_correccion
+from metricas import volcar_metricas_periodicamente, volcar_metricas_llm
+from indice_local import contexto_correccion
+from datetime import datetime
+import asyncio
+import json
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from API.API import corregir_evaluacion
+
+# Trabajos que un worker ejecuta al mismo tiempo
+TRABAJOS_CONCURRENTES = int(os.getenv("TRABAJOS_CONCURRENTES", "4"))
+# Segundos de espera cuando la cola está vacía
+ESPERA_COLA = float(os.getenv("ESPERA_COLA", "1"))
+# Intentos por trabajo antes de marcarlo fallido
+MAX_INTENTOS = int(os.getenv("MAX_INTENTOS_TRABAJO", "2"))
+# Minutos sin latido tras los cuales un trabajo en proceso se considera abandonado
+# (el latido se renueva cada INTERVALO_CANCELACION, ver esperar_cancelacion)
+MINUTOS_COLGADO = int(os.getenv("MINUTOS_TRABAJO_COLGADO", "15"))
+# Segundos desde que se encola un trabajo hasta que deja de servir, por tipo.
+# Al vencer se cancela su run en OpenAI; la corrección tiene más margen porque
+# su resultado se guarda aunque el alumno ya no esté mirando
+PLAZOS_TRABAJO = {
+    "generar_evaluacion": float(os.getenv("PLAZO_TRABAJO_GENERACION", "300")),
+    "corregir_evaluacion": float(os.getenv("PLAZO_TRABAJO_CORRECCION", "1800")),
+    "rellenar_reserva": float(os.getenv("PLAZO_TRABAJO_RELLENO", "900")),
+}
+# Cada cuántos segundos se revisa si el cliente canceló un trabajo en proceso
+# (y se renueva su latido)
+INTERVALO_CANCELACION = float(os.getenv("INTERVALO_CANCELACION", "2"))
+
+# -----------------------
+# Tipos de trabajo
+# -----------------------
+async def generar_evaluacion(db, parametros: dict):
+    unidad = db.query(Unidad).filter(Unidad.id == parametros["unidad_id"]).first()
+    if not unidad:
+        raise Exception("Unidad no encontrada")
+    nivel = parametros["nivel"]
+
+    # Puede que la reserva se haya llenado mientras el trabajo esperaba
+    evaluacion = tomar_de_reserva(db, unidad.id, nivel)
+    if not evaluacion:
+        resultado = await generar_resultado(unidad.assistant_id, nivel, unidad.vector_id, unidad.id)
+        evaluacion = guardar_evaluacion(db, unidad.id, nivel, resultado)
+
+    return evaluacion_a_dict(evaluacion)
+
+async def corregir(db, parametros: dict):
+    evaluacion = db.query(Evaluacion).filter(Evaluacion.id == parametros["evaluacion_id"]).first()
+    if not evaluacion:
+        raise Exception("Evaluación no encontrada")
+
+    resultado = await corregir_evaluacion(
+        assistant_id=parametros["assistant_id"],
+        respuestas=parametros["respuestas"],
+        cache=cache_correccion,
+        version_contenido=version_contenido(db, evaluacion.unidad),
+        vector_id=evaluacion.unidad.vector_id,
+        contexto_de=lambda r: contexto_correccion(evaluacion.id_unidad, r["enunciado"], r["respuesta_usuario"])
+    )
+    if parametros.get("id_intento"):
+        # Intento ya registrado con el puntaje parcial al enviar las respuestas
+        intento = db.get(IntentoEvaluacion, parametros["id_intento"])
+        if not intento:
+            raise Exception("Intento no encontrado")
+        intento = completar_intento(db, intento, resultado)
+    else:
+        intento = registrar_intento(db, evaluacion, parametros["id_usuario"], resultado)
+
+    return {
+        "id_intento": intento.id,
+        "puntaje": intento.puntaje_obtenido,
+        "retroalimentacion": intento.retroalimentacion
+    }
+
+async def rellenar(db, parametros: dict):
+    generadas = await rellenar_reserva(db, parametros["unidad_id"], parametros["nivel"])
+    return {"generadas": generadas}
+
+TIPOS_TRABAJO = {
+    "generar_evaluacion": generar_evaluacion,
+    "corregir_evaluacion": corregir,
+    "rellenar_reserva": rellenar,
+}
+
+# -----------------------
+# Plazo y cancelación
+# -----------------------
+async def esperar_cancelacion(trabajo_id: int):
+    """
+    Termina cuando el cliente cancela el trabajo (POST /trabajos/{id}/cancelar).
+    Mientras tanto renueva el latido del trabajo, así una corrección larga no
+    se confunde con un trabajo abandonado.
+    """
+    def latir_y_revisar():
+        # La sesión vive entera en el hilo: si se cancela la espera, el hilo
+        # termina con ella sin que el event loop la cierre a mitad de uso
+        db = SessionLocal()
+        try:
+            latir_trabajo(db, trabajo_id)
+            return trabajo_cancelado(db, trabajo_id)
+        finally:
+            db.close()
+
+    while True:
+        await asyncio.sleep(INTERVALO_CANCELACION)
+        try:
+            if await asyncio.to_thread(latir_y_revisar):
+                return
+        except Exception as e:
+            print(f"No se pudo revisar el trabajo {trabajo_id}: {e}")
+
+async def con_plazo_y_cancelacion(trabajo: Trabajo, corrutina):
+    """
+    Ejecuta el trabajo hasta su plazo o hasta que el cliente lo cancele. Al
+    interrumpirlo, la cancelación llega a ejecutar_run, que cancela el run en
+    OpenAI y deja de consultarlo.
+    """
+    restante = PLAZOS_TRABAJO.get(trabajo.tipo, float("inf")) - (datetime.utcnow() - trabajo.creado).total_seconds()
+    if restante <= 0:
+        corrutina.close()
+        raise TrabajoInterrumpido("Venció el plazo del trabajo antes de empezar")
+
+    tarea = asyncio.create_task(corrutina)
+    vigia = asyncio.create_task(esperar_cancelacion(trabajo.id))
+    try:
+        await asyncio.wait({tarea, vigia}, timeout=restante, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        vigia.cancel()
+    if tarea.done():
+        return tarea.result()
+
+    tarea.cancel()
+    await asyncio.gather(tarea, return_exceptions=True)
+    if vigia.done() and not vigia.cancelled():
+        raise TrabajoInterrumpido(CANCELADO_POR_CLIENTE)
+    raise TrabajoInterrumpido(f"Venció el plazo del trabajo ({PLAZOS_TRABAJO[trabajo.tipo]:.0f} s)")
+
+# -----------------------
+# Bucle principal
+# -----------------------
+async def ejecutar_trabajo(trabajo_id: int):
+    db = SessionLocal()
+    try:
+        trabajo = db.query(Trabajo).filter(Trabajo.id == trabajo_id).first()
+        try:
+            funcion = TIPOS_TRABAJO[trabajo.tipo]
+            resultado = await con_plazo_y_cancelacion(trabajo, funcion(db, json.loads(trabajo.parametros)))
+            if not completar_trabajo(db, trabajo, resultado):
+                print(f"Trabajo {trabajo.id} ({trabajo.tipo}) terminó después de cancelarse: se mantiene cancelado")
+        except Exception as e:
+            db.rollback()
+            detalle = getattr(e, "detail", None) or str(e)
+            print(f"Trabajo {trabajo.id} ({trabajo.tipo}) falló: {detalle}")
+            fallar_trabajo(db, trabajo, detalle, max_intentos=1 if isinstance(e, TrabajoInterrumpido) else MAX_INTENTOS)
+            if trabajo.tipo == "corregir_evaluacion" and trabajo.estado == EstadoTrabajo.fallido:
+                id_intento = json.loads(trabajo.parametros).get("id_intento")
+                if id_intento:
+                    fallar_intento(db, id_intento)
+    finally:
+        db.close()
+
+async def main():
+    db = SessionLocal()
+    try:
+        recuperados = recuperar_trabajos_colgados(db, MINUTOS_COLGADO)
+        if recuperados:
+            print(f"{recuperados} trabajos abandonados devueltos a la cola")
+        # Completar la reserva de evaluaciones pre-generadas de todas las unidades
+        # (los rellenos que ya están en cola no se duplican)
+        programar_relleno_general(db)
+    finally:
+        db.close()
+
+    semaforo = asyncio.Semaphore(TRABAJOS_CONCURRENTES)
+    tareas = set()
+    tarea_metricas = asyncio.create_task(volcar_metricas_periodicamente())
+
+    async def con_limite(trabajo_id):
+        try:
+            await ejecutar_trabajo(trabajo_id)
+        finally:
+            semaforo.release()
+
+    print(f"Worker iniciado ({TRABAJOS_CONCURRENTES} trabajos concurrentes)")
+    try:
+        while True:
+            await semaforo.acquire()
+            db = SessionLocal()
+            try:
+                trabajo = tomar_trabajo(db)
+                trabajo_id = trabajo.id if trabajo else None
+            finally:
+                db.close()
+
+            if trabajo_id is None:
+                semaforo.release()
+                await asyncio.sleep(ESPERA_COLA)
+                continue
+
+            tarea = asyncio.create_task(con_limite(trabajo_id))
+            tareas.add(tarea)
+            tarea.add_done_callback(tareas.discard)
+    finally:
+        # Al detener el worker: parar el volcado periódico y guardar las últimas métricas
+        tarea_metricas.cancel()
+        await asyncio.gather(tarea_metricas, return_exceptions=True)
+        volcar_metricas_llm()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
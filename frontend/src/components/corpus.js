@@ -6,6 +6,14 @@ import Navbar from "./navbar";
 import Plus from "../assets/plus.png"; // Ícono de plus
 import '../styles/corpus.css';
 
+// Estado de la extracción de texto de cada archivo (estado_extraccion del backend)
+const ETIQUETAS_EXTRACCION = {
+  pendiente: "Extrayendo texto...",
+  lista: "Texto extraído",
+  sin_texto: "Sin texto extraíble (¿PDF escaneado?)",
+  error: "Error al extraer el texto",
+};
+
 const Corpus = () => {
   const navigate = useNavigate();
   const { unidadId } = useParams();
@@ -78,14 +86,17 @@ const handleAgregarCorpus = async (event) => {
     // Espera 1.5s para simular spinner
     await new Promise(resolve => setTimeout(resolve, 1500));
 
-    // Subir archivos uno por uno
-    for (const file of selectedFiles) {
-      const formData = new FormData();
-      formData.append("archivo", file);
+    // Subir todos los archivos en una sola request
+    const formData = new FormData();
+    selectedFiles.forEach(file => formData.append("archivos", file));
 
-      await axios.post(`http://localhost:8000/corpus/unidad/${unidadId}`, formData, {
-        headers: { "Content-Type": "multipart/form-data" },
-      });
+    const subida = await axios.post(`http://localhost:8000/corpus/unidad/${unidadId}/lote`, formData, {
+      headers: { "Content-Type": "multipart/form-data" },
+    });
+
+    const fallidos = subida.data.archivos.filter(a => !a.file_id);
+    if (fallidos.length > 0) {
+      alert(`No se pudieron subir: ${fallidos.map(a => `${a.nombre} (${a.error})`).join(', ')}`);
     }
 
     // Actualizar lista de corpus después de subir, incluyendo usuario_id
@@ -120,18 +131,12 @@ const handleAgregarCorpus = async (event) => {
 
 
 
-  const handleEliminarCorpus = async (corpusId, fileId, vectorId) => {
+  const handleEliminarCorpus = async (corpusId) => {
     if (!window.confirm("¿Estás seguro de que deseas eliminar este archivo?")) return;
 
-    if (!fileId || !vectorId) {
-      alert("No se pueden eliminar los archivos: faltan IDs");
-      return;
-    }
-
     try {
-      await axios.delete(`http://localhost:8000/corpus/${corpusId}`, {
-        params: { file_id: fileId, vector_id: vectorId }
-      });
+      // El backend toma el archivo y el vector del corpus
+      await axios.delete(`http://localhost:8000/corpus/${corpusId}`);
 
       setCorpus(prev => prev.filter(c => c.id !== corpusId));
       alert("Archivo eliminado correctamente.");
@@ -221,9 +226,14 @@ const handleAgregarCorpus = async (event) => {
                   <div className="corpus-line"></div>
                   <div className="corpus-content">
                     <div className='titulo-corpus'>{c.nombre}</div>
+                    {c.estado_extraccion && (
+                      <div className={`estado-extraccion estado-${c.estado_extraccion}`}>
+                        {ETIQUETAS_EXTRACCION[c.estado_extraccion]}
+                      </div>
+                    )}
                     <button
                       className="btn-danger btn-eliminar-corpus"
-                      onClick={() => handleEliminarCorpus(c.id, c.material, c.vector_id)}
+                      onClick={() => handleEliminarCorpus(c.id)}
                     >
                       Eliminar material
                     </button>
@@ -7,6 +7,17 @@ import Docs from '../assets/docs.png';
 import Evaluacion from '../assets/evaluacion.png';
 import '../styles/curso.css';
 
+// Espera a que worker.py termine un trabajo y devuelve su resultado
+const esperarTrabajo = async (trabajoId) => {
+  while (true) {
+    const res = await fetch(`http://localhost:8000/trabajos/${trabajoId}`);
+    const trabajo = await res.json();
+    if (trabajo.estado === "completado") return trabajo.resultado;
+    if (trabajo.estado === "fallido") throw new Error(trabajo.error);
+    await new Promise(resolve => setTimeout(resolve, 2000));
+  }
+};
+
 const Curso = () => {
   const { idCurso } = useParams();
   const navigate = useNavigate();
@@ -22,6 +33,7 @@ const Curso = () => {
   const [nivelSeleccionado, setNivelSeleccionado] = useState("1"); // Por defecto Fácil
   const [creandoEvaluacion, setCreandoEvaluacion] = useState(false);
   const [corpusUnidad, setCorpusUnidad] = useState(null);
+  const [corpusListo, setCorpusListo] = useState(false);
   const [mejorIntento, setMejorIntento] = useState(null);
 
 
@@ -129,6 +141,34 @@ const Curso = () => {
   fetchCorpus();
 }, [selectedUnidad]);
 
+// Consultar si el material ya terminó de indexarse (se repite mientras no esté listo)
+useEffect(() => {
+  if (!selectedUnidad) return;
+  let temporizador;
+  let cancelado = false;
+
+  const fetchEstado = async () => {
+    try {
+      const res = await fetch(`http://localhost:8000/corpus/unidad/${selectedUnidad}/estado`);
+      const data = res.ok ? await res.json() : null;
+      if (cancelado) return;
+      setCorpusListo(Boolean(data && data.listo));
+      if (data && !data.listo && (data.conteo.pendiente > 0 || data.conteo.procesando > 0)) {
+        temporizador = setTimeout(fetchEstado, 5000);
+      }
+    } catch (err) {
+      console.error("Error al consultar el estado del corpus:", err);
+    }
+  };
+
+  setCorpusListo(false);
+  fetchEstado();
+  return () => {
+    cancelado = true;
+    clearTimeout(temporizador);
+  };
+}, [selectedUnidad]);
+
 useEffect(() => {
   if (!selectedUnidad) return;
 
@@ -248,7 +288,19 @@ useEffect(() => {
       return;
     }
 
-    const data = await response.json();
+    let data = await response.json();
+    // 202: la evaluación se está generando en segundo plano
+    if (response.status === 202) {
+      // Si se cierra la pestaña mientras se genera, cancelar el trabajo (y su run en OpenAI)
+      const trabajoId = data.id;
+      const cancelar = () => navigator.sendBeacon(`http://localhost:8000/trabajos/${trabajoId}/cancelar`);
+      window.addEventListener("pagehide", cancelar);
+      try {
+        data = await esperarTrabajo(trabajoId);
+      } finally {
+        window.removeEventListener("pagehide", cancelar);
+      }
+    }
     alert(`Evaluación creada correctamente: ${data.nombre}`);
     setShowModalEvaluacion(false);
     // Recargar evaluaciones
@@ -362,8 +414,9 @@ const handleEliminarEvaluacion = async (evaluacionId) => {
                     <button
                       className="ver-corpus"
                       onClick={() => setShowModalEvaluacion(true)}
-                      disabled={!corpusUnidad || corpusUnidad.length === 0}
-                      title={!corpusUnidad || corpusUnidad.length === 0 ? "Debe haber al menos un material subido" : ""}
+                      disabled={!corpusUnidad || corpusUnidad.length === 0 || !corpusListo}
+                      title={!corpusUnidad || corpusUnidad.length === 0 ? "Debe haber al menos un material subido"
+                        : !corpusListo ? "El material todavía se está procesando" : ""}
                     >
                       <img src={Evaluacion} alt="Ícono Evaluación" className="icono-evaluacion" />
                       Nueva Evaluación
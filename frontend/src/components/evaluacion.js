@@ -4,6 +4,36 @@ import axios from "axios";
 import Navbar from "./navbar";
 import "../styles/evaluacion.css";
 
+// Espera a que termine la corrección del desarrollo de un intento: por SSE
+// si el navegador lo soporta, si no (o si se corta) consultando cada 2 s
+const esperarIntento = (intentoId) => new Promise((resolve, reject) => {
+  const consultar = async () => {
+    try {
+      while (true) {
+        const res = await axios.get(`http://localhost:8000/intentos/${intentoId}`);
+        if (res.data.estado_correccion === "completado") return resolve(res.data);
+        if (res.data.estado_correccion === "fallido") return reject(new Error("No se pudo corregir el desarrollo"));
+        await new Promise(r => setTimeout(r, 2000));
+      }
+    } catch (err) {
+      reject(err);
+    }
+  };
+
+  if (!window.EventSource) return consultar();
+  const fuente = new EventSource(`http://localhost:8000/intentos/${intentoId}/eventos`);
+  fuente.addEventListener("final", (e) => {
+    fuente.close();
+    resolve(JSON.parse(e.data));
+  });
+  fuente.addEventListener("error", (e) => {
+    fuente.close();
+    // Evento "error" del servidor (trae datos) o conexión cortada
+    if (e.data && JSON.parse(e.data).intento) reject(new Error(JSON.parse(e.data).detail));
+    else consultar();
+  });
+});
+
 const Evaluacion = () => {
   const { idEvaluacion } = useParams();
   const navigate = useNavigate();
@@ -11,6 +41,7 @@ const Evaluacion = () => {
   const [hayIntento, setHayIntento] = useState(false);
   const [cursoId, setCursoId] = useState(null);
   const [enviando, setEnviando] = useState(false);
+  const [parcial, setParcial] = useState(null);
 
 useEffect(() => {
   const verificarUsuario = async () => {
@@ -122,8 +153,14 @@ useEffect(() => {
         }
       );
 
-      if (res.status === 200) {
-        alert(`Evaluación enviada! Puntaje: ${res.data.puntaje}\nRetroalimentación disponible.`);
+      if (res.status === 202) {
+        // VF y alternativas ya están corregidas; el desarrollo se corrige en segundo plano
+        setParcial(res.data.parcial);
+        const intento = await esperarIntento(res.data.intento.id);
+        alert(`Evaluación enviada! Puntaje: ${intento.puntaje}\nRetroalimentación disponible.`);
+        window.location.reload();
+      } else {
+        alert(`Evaluación enviada! Puntaje: ${res.data.intento.puntaje}`);
         window.location.reload();
       }
     } catch (err) {
@@ -313,7 +350,11 @@ useEffect(() => {
                 {/* Spinner mientras se envía */}
                 {enviando && (
                   <div className="eva-cargando">
-                    <span>Enviando respuestas...</span>
+                    <span>
+                      {parcial
+                        ? `Correctas: ${parcial.correctas}/${parcial.total_objetivas} (puntaje parcial ${parcial.cumplimiento}%, hasta ${parcial.cumplimiento_maximo}%). Corrigiendo desarrollo...`
+                        : "Enviando respuestas..."}
+                    </span>
                     <div className="spinner"></div>
                   </div>
                 )}